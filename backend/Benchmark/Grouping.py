@@ -0,0 +1,112 @@
+"""
+Benchmarks GroupPara and club_sentences_by_word_count against their previous
+quadratic implementations on synthetic 1,000-page inputs.
+
+Run from the backend directory:
+    python -m Benchmark.Grouping --pages 1000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.Group import GroupPara
+from Utils.Para import club_sentences_by_word_count
+
+VOCAB = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing",
+         "elit", "sed", "do", "eiusmod", "tempor", "incididunt", "labore"]
+
+
+# --- Previous implementations, kept for comparison ---
+
+def legacy_group_para(paragraphs, minCount=50):
+    paras = list(paragraphs)
+    grouped, current_paras, para, words = [], [], [], 0
+    while paras:
+        base_para = paras.pop(0)
+        words += len(base_para[4].split())
+        current_paras.append(base_para)
+        if words >= minCount:
+            grouped.append(current_paras)
+            para.append("")
+            for p in current_paras:
+                para[-1] += (p[4])
+            current_paras, words = [], 0
+    return grouped, para
+
+
+def legacy_club_sentences(sentences_info, min_count=20):
+    final_chunks, current_chunk = [], None
+    for sentence_info in sentences_info:
+        current_word_count = len(current_chunk['text'].split()) if current_chunk else 0
+        if current_chunk is None:
+            current_chunk = {'text': sentence_info['text'], 'words': list(sentence_info['words'])}
+        elif current_word_count < min_count:
+            current_chunk['text'] += ' ' + sentence_info['text']
+            current_chunk['words'].extend(sentence_info['words'])
+        else:
+            final_chunks.append(current_chunk)
+            current_chunk = {'text': sentence_info['text'], 'words': list(sentence_info['words'])}
+    if current_chunk:
+        final_chunks.append(current_chunk)
+    return final_chunks
+
+
+# --- Synthetic inputs ---
+
+def make_blocks(pages: int, blocks_per_page: int = 12):
+    rng = random.Random(0)
+    blocks = []
+    for page in range(pages):
+        for b in range(blocks_per_page):
+            text = " ".join(rng.choices(VOCAB, k=rng.randint(5, 60))) + "\n"
+            y = b * 60.0
+            blocks.append((50.0, y, 550.0, y + 50.0, text, b, 0))
+    return blocks
+
+
+def make_sentences(pages: int, sentences_per_page: int = 30):
+    rng = random.Random(1)
+    sentences = []
+    for _ in range(pages * sentences_per_page):
+        words = rng.choices(VOCAB, k=rng.randint(3, 25))
+        tuples = [(0.0, 0.0, 1.0, 1.0, w, 0, 0, i) for i, w in enumerate(words)]
+        sentences.append({'text': " ".join(words) + ".", 'words': tuples})
+    return sentences
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    # GroupPara prints its group counts, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark paragraph and sentence grouping")
+    parser.add_argument("--pages", type=int, default=1000, help="synthetic page count")
+    parser.add_argument("--min-para", type=int, default=50, help="GroupPara minCount")
+    parser.add_argument("--min-sentence", type=int, default=20, help="club_sentences min_count")
+    args = parser.parse_args()
+
+    # A whole document worth of blocks in one call is the worst case for pop(0)
+    blocks = make_blocks(args.pages)
+    (old_groups, _), old_t = timed(legacy_group_para, blocks, minCount=args.min_para)
+    (new_groups, _), new_t = timed(GroupPara, blocks, minCount=args.min_para)
+    dropped = len(blocks) - sum(len(g) for g in old_groups)
+    assert sum(len(g) for g in new_groups) == len(blocks)
+    print(f"GroupPara            {len(blocks):>8} blocks  "
+          f"old {old_t:8.3f}s  new {new_t:8.3f}s  speedup {old_t / new_t:6.1f}x  "
+          f"(old dropped {dropped} trailing blocks)")
+
+    sentences = make_sentences(args.pages)
+    old_chunks, old_t = timed(legacy_club_sentences, sentences, args.min_sentence)
+    new_chunks, new_t = timed(club_sentences_by_word_count, sentences, args.min_sentence)
+    assert [c['text'] for c in old_chunks] == [c['text'] for c in new_chunks]
+    print(f"club_sentences       {len(sentences):>8} sents   "
+          f"old {old_t:8.3f}s  new {new_t:8.3f}s  speedup {old_t / new_t:6.1f}x")
@@ -0,0 +1,97 @@
+"""
+Compares full shingling with winnowing on the PDFs in the repository's
+test/ folder: index size, indexing and query time, and whether the best
+match of every document is still found.
+
+Each PDF is also indexed as `--copies` perturbed variants (a share of tokens
+replaced at random) so the corpus is large enough for timings to mean
+something.
+
+Run from the backend directory:
+    python -m Benchmark.Plagiarism --copies 20
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.Plagirarism import (SHINGLE_SIZE, WINNOW_WINDOW, extract_text_and_ocr_from_pdf,
+                               fingerprint_tokens, normalize_text, tokenize)
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "test")
+
+
+def load_corpus(copies: int, noise: float):
+    corpus = {}
+    for path in sorted(glob.glob(os.path.join(TEST_DIR, "*.pdf"))):
+        # OCR warnings of image-only pages are not part of the benchmark
+        with contextlib.redirect_stdout(io.StringIO()):
+            tokens = tokenize(normalize_text(extract_text_and_ocr_from_pdf(path)))
+        name = os.path.basename(path)
+        corpus[name] = tokens
+        for c in range(copies):
+            variant = [random.choice(tokens) if random.random() < noise else t for t in tokens]
+            corpus[f"{name}#{c}"] = variant
+    return corpus
+
+
+def run(corpus, mode: str, k: int, window: int):
+    start = time.perf_counter()
+    fingerprints = {name: fingerprint_tokens(tokens, k, mode, window)[0] for name, tokens in corpus.items()}
+    index = defaultdict(list)
+    for name, fps in fingerprints.items():
+        for fp in fps.tolist():
+            index[fp].append(name)
+    build = time.perf_counter() - start
+
+    queries = [name for name in corpus if "#" not in name]
+    start = time.perf_counter()
+    best = {}
+    for name in queries:
+        shared = Counter()
+        for fp in fingerprints[name].tolist():
+            shared.update(index.get(fp, ()))
+        del shared[name]
+        best[name] = shared.most_common(1)[0][0] if shared else None
+    query = (time.perf_counter() - start) / len(queries)
+
+    postings = sum(len(v) for v in index.values())
+    return {"postings": postings, "keys": len(index), "build": build, "query": query, "best": best}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=20, help="perturbed variants per PDF")
+    parser.add_argument("--noise", type=float, default=0.05, help="share of tokens replaced in variants")
+    parser.add_argument("--shingle", type=int, default=SHINGLE_SIZE)
+    parser.add_argument("--window", type=int, default=WINNOW_WINDOW)
+    args = parser.parse_args()
+    random.seed(0)
+
+    corpus = load_corpus(args.copies, args.noise)
+    print(f"Corpus: {len(corpus)} documents, {sum(len(t) for t in corpus.values())} tokens")
+    print(f"Guaranteed match length for winnowing: {args.window + args.shingle - 1} tokens\n")
+
+    full = run(corpus, "shingles", args.shingle, args.window)
+    winnowed = run(corpus, "winnowing", args.shingle, args.window)
+    # The best match of a PDF should be one of its own variants
+    found = {label: sum((r["best"][q] or "").split("#")[0] == q for q in r["best"])
+             for label, r in (("shingles", full), ("winnowing", winnowed))}
+
+    print(f"{'':12}{'postings':>12}{'fingerprints':>14}{'index MB':>10}{'build s':>10}{'query ms':>10}")
+    for label, r in (("shingles", full), ("winnowing", winnowed)):
+        print(f"{label:12}{r['postings']:>12}{r['keys']:>14}{r['postings'] * 8 / 2**20:>10.2f}"
+              f"{r['build']:>10.3f}{r['query'] * 1000:>10.2f}")
+    print(f"\nWinnowing index is {winnowed['postings'] / full['postings']:.0%} of full shingling; "
+          f"source found for {found['winnowing']}/{len(winnowed['best'])} queries "
+          f"(full shingling: {found['shingles']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorCollection as Collection
+
+
+async def AddBlobRefs(documents: List[Dict], blob_collection: Collection) -> None:
+    """
+    Count one more reference to the blob of each document, creating the
+    blob records that do not exist yet. Documents need `content_hash` and
+    `size_bytes`.
+    """
+    if not documents:
+        return
+    now = datetime.now(timezone.utc)
+    refs = Counter(document["content_hash"] for document in documents)
+    sizes = {document["content_hash"]: document["size_bytes"] for document in documents}
+    await blob_collection.bulk_write([
+        UpdateOne(
+            {"_id": content_hash},
+            {"$inc": {"refs": count},
+             "$setOnInsert": {"size_bytes": sizes[content_hash], "created_at": now}},
+            upsert=True
+        )
+        for content_hash, count in refs.items()
+    ], ordered=False)
+
+
+async def ReleaseBlobRefs(content_hashes: List[str], blob_collection: Collection) -> List[str]:
+    """
+    Drop one reference per listed hash (a hash may be listed several times)
+    and forget the blobs nothing refers to any more.
+
+    Returns:
+        List[str]: Hashes of the blobs whose files can be removed.
+    """
+    if not content_hashes:
+        return []
+    refs = Counter(content_hashes)
+    await blob_collection.bulk_write([
+        UpdateOne({"_id": content_hash}, {"$inc": {"refs": -count}})
+        for content_hash, count in refs.items()
+    ], ordered=False)
+
+    unused = {"_id": {"$in": list(refs)}, "refs": {"$lte": 0}}
+    orphans = [blob["_id"] async for blob in blob_collection.find(unused, {"_id": 1})]
+    await blob_collection.delete_many(unused)
+    return orphans
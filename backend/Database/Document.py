@@ -1,6 +1,22 @@
+from typing import Dict, List
 from uuid import uuid4
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection as Collection
 
+# Documents sent per insert_many call
+DOCUMENT_BATCH_SIZE = 1000
+
+
+def _new_document(document_name: str, document_path: str, **extra) -> Dict:
+    return {
+        "_id": ObjectId(),
+        "id": str(uuid4()),
+        "document_name": document_name,
+        "document_path": document_path,
+        "result": {},
+        **extra
+    }
+
 
 async def RegisterDocument(
     document_name: str,
@@ -8,11 +24,34 @@ async def RegisterDocument(
     document_collection: Collection
 ) -> str:
     """Register a new document in the database and return its ID."""
-    new_document = {
-        "id": str(uuid4()),
-        "document_name": document_name,
-        "document_path": document_path,
-        "result": {}
-    }
+    new_document = _new_document(document_name, document_path)
     result = await document_collection.insert_one(new_document)
-    return str(result.inserted_id)
\ No newline at end of file
+    return str(result.inserted_id)
+
+async def RegisterDocuments(
+    documents: List[Dict],
+    document_collection: Collection,
+    batch_size: int = DOCUMENT_BATCH_SIZE
+) -> List[str]:
+    """
+    Register many documents with unordered insert_many batches.
+
+    Each entry needs `document_name` and `document_path`; any other keys are
+    stored on the record as they are. IDs are assigned before inserting, so
+    they come back in the order of `documents`.
+    """
+    records = [_new_document(**document) for document in documents]
+    for i in range(0, len(records), batch_size):
+        await document_collection.insert_many(records[i:i + batch_size], ordered=False)
+    return [str(record["_id"]) for record in records]
+
+async def SetDocumentResult(
+    document_id: str,
+    result: dict,
+    document_collection: Collection
+) -> None:
+    """Fill the `result` field of a registered document."""
+    await document_collection.update_one(
+        {"_id": ObjectId(document_id)},
+        {"$set": {"result": result}}
+    )
@@ -0,0 +1,270 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+from pymongo import ReturnDocument
+from motor.motor_asyncio import AsyncIOMotorCollection as Collection
+
+# Task states: queued -> running -> done | failed (retried while attempts remain)
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# A running task or job whose lease ran out is considered abandoned (crash, restart)
+LEASE_SECONDS = 300
+
+
+async def CreateJob(
+    project_id: str,
+    user_id: str,
+    document_ids: List[str],
+    ai_model: str,
+    plag_model: str,
+    job_collection: Collection,
+    task_collection: Collection,
+    max_attempts: int = 3
+) -> str:
+    """Register an analysis job with one queued task per document and return its ID."""
+    now = datetime.now(timezone.utc)
+    job_id = str(uuid4())
+    await job_collection.insert_one({
+        "_id": job_id,
+        "kind": "analysis",
+        "project_id": project_id,
+        "user_id": user_id,
+        "ai_model": ai_model,
+        "plagiarism_model": plag_model,
+        "total": len(document_ids),
+        "status": QUEUED if document_ids else DONE,
+        "seq": 0,
+        "created_at": now,
+        "updated_at": now
+    })
+    if document_ids:
+        await task_collection.insert_many([
+            {
+                "job_id": job_id,
+                "user_id": user_id,
+                "document_id": document_id,
+                "ai_model": ai_model,
+                "plagiarism_model": plag_model,
+                "status": QUEUED,
+                "attempts": 0,
+                "max_attempts": max_attempts,
+                "not_before": now,
+                "result": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now
+            }
+            for document_id in document_ids
+        ], ordered=False)
+    return job_id
+
+
+async def ClaimTask(task_collection: Collection, query: dict = None,
+                    lease_seconds: float = LEASE_SECONDS) -> Optional[dict]:
+    """Atomically take the oldest runnable queued task, marking it running under a lease."""
+    now = datetime.now(timezone.utc)
+    return await task_collection.find_one_and_update(
+        {"status": QUEUED, "not_before": {"$lte": now}, **(query or {})},
+        {"$set": {"status": RUNNING, "lease_until": now + timedelta(seconds=lease_seconds),
+                  "updated_at": now},
+         "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def GetQueuedUsers(task_collection: Collection) -> List[str]:
+    """Users that have at least one runnable queued task."""
+    now = datetime.now(timezone.utc)
+    return await task_collection.distinct("user_id", {"status": QUEUED, "not_before": {"$lte": now}})
+
+
+async def CountRunningByUser(task_collection: Collection) -> Dict[str, int]:
+    """Number of running tasks per user, across every worker process."""
+    counts = {}
+    async for row in task_collection.aggregate([
+        {"$match": {"status": RUNNING}},
+        {"$group": {"_id": "$user_id", "n": {"$sum": 1}}}
+    ]):
+        counts[row["_id"]] = row["n"]
+    return counts
+
+
+async def ExtendLease(_id, collection: Collection, lease_seconds: float = LEASE_SECONDS) -> None:
+    """Push back the lease of a running task or job that is still being worked on."""
+    now = datetime.now(timezone.utc)
+    await collection.update_one(
+        {"_id": _id, "status": RUNNING},
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds), "updated_at": now}}
+    )
+
+
+async def RecoverExpiredTasks(task_collection: Collection) -> int:
+    """Re-queue running tasks whose worker died; returns how many were recovered."""
+    now = datetime.now(timezone.utc)
+    result = await task_collection.update_many(
+        {"status": RUNNING, "lease_until": {"$lt": now}},
+        {"$set": {"status": QUEUED, "not_before": now, "updated_at": now}}
+    )
+    return result.modified_count
+
+
+async def CompleteTask(task_id, result: dict, task_collection: Collection) -> None:
+    """Store a task's result and mark it done."""
+    await task_collection.update_one(
+        {"_id": task_id},
+        {"$set": {"status": DONE, "result": result, "error": None,
+                  "updated_at": datetime.now(timezone.utc)}}
+    )
+
+
+async def FailTask(task: dict, error: str, task_collection: Collection, backoff_seconds: float = 5) -> bool:
+    """
+    Record a task failure. The task is re-queued with a linear backoff while
+    attempts remain; returns True if it was re-queued.
+    """
+    now = datetime.now(timezone.utc)
+    retry = task["attempts"] < task["max_attempts"]
+    await task_collection.update_one(
+        {"_id": task["_id"]},
+        {"$set": {
+            "status": QUEUED if retry else FAILED,
+            "error": error,
+            "not_before": now + timedelta(seconds=backoff_seconds * task["attempts"]),
+            "updated_at": now
+        }}
+    )
+    return retry
+
+
+async def GetJob(job_id: str, job_collection: Collection) -> Optional[dict]:
+    return await job_collection.find_one({"_id": job_id})
+
+
+async def GetJobTasks(job_id: str, task_collection: Collection) -> List[dict]:
+    return await task_collection.find({"job_id": job_id}).sort("created_at", 1).to_list(length=None)
+
+
+async def UpdateJobStatus(job_id: str, job_collection: Collection, task_collection: Collection) -> dict:
+    """Recompute a job's counters and status from its tasks."""
+    counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+    async for row in task_collection.aggregate([
+        {"$match": {"job_id": job_id}},
+        {"$group": {"_id": "$status", "n": {"$sum": 1}}}
+    ]):
+        counts[row["_id"]] = row["n"]
+
+    if counts[QUEUED] or counts[RUNNING]:
+        status = RUNNING if (counts[RUNNING] or counts[DONE] or counts[FAILED]) else QUEUED
+    else:
+        status = DONE
+    update = {"status": status, "total": sum(counts.values()),
+              "done": counts[DONE], "failed": counts[FAILED],
+              "updated_at": datetime.now(timezone.utc)}
+    before = await job_collection.find_one_and_update(
+        {"_id": job_id}, {"$set": update}, projection={"status": 1})
+    # Only one caller sees the job turn done, so completion is announced once
+    update["finished_now"] = status == DONE and (before or {}).get("status") != DONE
+    return update
+
+
+# --- Job events, replayed to clients that reconnect with a cursor ---
+async def AppendJobEvent(job_id: str, event: dict, job_collection: Collection,
+                         event_collection: Collection) -> dict:
+    """Persist a progress event under the job's next sequence number and return it."""
+    job = await job_collection.find_one_and_update(
+        {"_id": job_id}, {"$inc": {"seq": 1}},
+        projection={"seq": 1}, return_document=ReturnDocument.AFTER)
+    event = {**event, "job_id": job_id, "seq": job["seq"]}
+    await event_collection.insert_one({"job_id": job_id, "seq": job["seq"], "event": event})
+    return event
+
+
+async def GetJobEvents(job_id: str, after: int, event_collection: Collection) -> List[dict]:
+    """Events of a job with a sequence number greater than `after`, in order."""
+    cursor = event_collection.find({"job_id": job_id, "seq": {"$gt": after}}).sort("seq", 1)
+    return [row["event"] async for row in cursor]
+
+
+async def GetPublishedChunks(job_id: str, after_page: int,
+                             event_collection: Collection) -> Set[Tuple[int, Optional[int]]]:
+    """
+    (page, chunk) of the page events an OCR job already published past
+    page `after_page`, chunk None for a page's completion. A resumed job
+    skips them instead of publishing them again under new sequence numbers.
+    """
+    cursor = event_collection.find({"job_id": job_id, "event.page": {"$gt": after_page}})
+    return {(row["event"]["page"], row["event"].get("chunk")) async for row in cursor}
+
+# --- Page-checkpointed OCR jobs ---
+async def CreateOCRJob(pdf_path: str, total_pages: int, job_collection: Collection,
+                       user_id: str = None, content_hash: str = None, model_version: str = None,
+                       lease_seconds: float = LEASE_SECONDS) -> str:
+    """Register an OCR job, already running and leased by the caller, and return its ID."""
+    now = datetime.now(timezone.utc)
+    job_id = str(uuid4())
+    await job_collection.insert_one({
+        "_id": job_id,
+        "kind": "ocr",
+        "user_id": user_id,
+        "pdf_path": pdf_path,
+        "content_hash": content_hash,
+        "model_version": model_version,
+        "total": total_pages,
+        "checkpoint": 0,  # index of the next page to process
+        "status": RUNNING,
+        "lease_until": now + timedelta(seconds=lease_seconds),
+        "seq": 0,
+        "created_at": now,
+        "updated_at": now
+    })
+    return job_id
+
+
+async def FindOCRJob(content_hash: str, model_version: str,
+                     job_collection: Collection) -> Optional[dict]:
+    """
+    Return the latest OCR job of a file's content that can still be followed:
+    finished, or running under a live lease. Failed jobs and jobs whose
+    runner stopped renewing the lease are ignored.
+    """
+    now = datetime.now(timezone.utc)
+    return await job_collection.find_one(
+        {"kind": "ocr", "content_hash": content_hash, "model_version": model_version,
+         "$or": [{"status": DONE}, {"status": RUNNING, "lease_until": {"$gt": now}}]},
+        sort=[("created_at", -1)]
+    )
+
+
+async def ClaimExpiredOCRJob(job_collection: Collection,
+                             lease_seconds: float = LEASE_SECONDS) -> Optional[dict]:
+    """Take over an unfinished OCR job whose previous runner stopped renewing its lease."""
+    now = datetime.now(timezone.utc)
+    return await job_collection.find_one_and_update(
+        {"kind": "ocr", "status": RUNNING, "lease_until": {"$lt": now}},
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds), "updated_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def FailOCRJob(job_id: str, error: str, job_collection: Collection) -> None:
+    """Mark an OCR job failed; it is not resumed or reused afterwards."""
+    await job_collection.update_one(
+        {"_id": job_id},
+        {"$set": {"status": FAILED, "error": error, "updated_at": datetime.now(timezone.utc)},
+         "$unset": {"lease_until": ""}}
+    )
+
+
+async def SetJobCheckpoint(job_id: str, checkpoint: int, job_collection: Collection,
+                           done: bool = False, lease_seconds: float = LEASE_SECONDS) -> None:
+    """Record the next page to process (renewing the lease), or mark the job done."""
+    now = datetime.now(timezone.utc)
+    await job_collection.update_one(
+        {"_id": job_id},
+        {"$set": {"checkpoint": checkpoint, "status": DONE if done else RUNNING,
+                  "lease_until": now + timedelta(seconds=lease_seconds), "updated_at": now}}
+    )
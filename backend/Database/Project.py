@@ -1,19 +1,146 @@
+import asyncio
+from typing import Optional
 from uuid import uuid4
+from bson import ObjectId
+from bson.int64 import Int64
 from motor.motor_asyncio import AsyncIOMotorCollection as Collection
 
-async def RegisterProject(
-    project_name: str,
-    project_path: str,
-    project_collection: Collection,
-    documents: list = []
-) -> str:
-    """Register a new project in the database and return its ID."""
-    new_project = {
+
+def _new_project(project_name: str, project_path: str, documents: list, archive_hash: str,
+                 project_id: ObjectId = None) -> dict:
+    return {
+        "_id": project_id or ObjectId(),
         "id": str(uuid4()),
         "name": project_name,
         "path": project_path,
         "documents": documents,
+        "archive_sha256": archive_hash,
         "status": "Upload"
     }
+
+
+def _supports_transactions(collection: Collection) -> bool:
+    """Whether the collection's deployment is one multi-document transactions run on."""
+    try:
+        topology = collection.database.client.topology_description.topology_type_name
+    except AttributeError:
+        return False
+    return topology in ("ReplicaSetWithPrimary", "Sharded")
+
+
+async def RegisterProject(
+    project_name: str,
+    project_path: str,
+    project_collection: Collection,
+    documents: list = [],
+    archive_hash: str = None
+) -> str:
+    """Register a new project in the database and return its ID."""
+    new_project = _new_project(project_name, project_path, documents, archive_hash)
     result = await project_collection.insert_one(new_project)
-    return str(result.inserted_id)
\ No newline at end of file
+    return str(result.inserted_id)
+
+
+async def RegisterProjectForUser(
+    project_name: str,
+    project_path: str,
+    documents: list,
+    user_id: str,
+    storage: int,
+    project_collection: Collection,
+    user_collection: Collection,
+    archive_hash: str = None,
+    project_id: ObjectId = None
+) -> str:
+    """
+    Register a project and attach it to its owner in one step.
+
+    The project ID is assigned client-side (or passed in, when the project's
+    directory is named after it), so the project insert and the user update
+    are independent. On a replica set both run in one transaction. Otherwise
+    they are sent together, and when one of them fails the other one is
+    undone before the error is raised.
+    """
+    new_project = _new_project(project_name, project_path, documents, archive_hash, project_id)
+    project_id = str(new_project["_id"])
+    attach = {
+        # usage grows by the project's size, stored as int64
+        "$inc": {"storage": Int64(storage)},
+        # appends new project to list
+        "$push": {"projects": project_id}
+    }
+
+    if _supports_transactions(user_collection):
+        async with await user_collection.database.client.start_session() as session:
+            async with session.start_transaction():
+                await project_collection.insert_one(new_project, session=session)
+                await user_collection.update_one({"_id": user_id}, attach, session=session)
+        return project_id
+
+    inserted, attached = await asyncio.gather(
+        project_collection.insert_one(new_project),
+        user_collection.update_one({"_id": user_id}, attach),
+        return_exceptions=True
+    )
+    if isinstance(inserted, BaseException) or isinstance(attached, BaseException):
+        undo = []
+        if not isinstance(inserted, BaseException):
+            undo.append(project_collection.delete_one({"_id": new_project["_id"]}))
+        if not isinstance(attached, BaseException):
+            undo.append(user_collection.update_one(
+                {"_id": user_id, "projects": project_id},
+                {"$inc": {"storage": Int64(-storage)}, "$pull": {"projects": project_id}}
+            ))
+        await asyncio.gather(*undo)
+        raise inserted if isinstance(inserted, BaseException) else attached
+    return project_id
+
+
+async def DeleteProjectForUser(
+    project_id: str,
+    user_id: str,
+    project_collection: Collection,
+    document_collection: Collection,
+    user_collection: Collection
+) -> Optional[dict]:
+    """
+    Delete a project and its documents, and take their sizes off the owner's
+    storage in the same update that detaches the project. That update only
+    matches while the project is still attached, so of two concurrent
+    deletes only one goes on to remove the records and report them.
+
+    Returns:
+        Optional[dict]: {'path', 'document_paths', 'content_hashes',
+        'size_bytes'} of what was removed, or None if the user has no such
+        project.
+    """
+    owner = await user_collection.find_one({"_id": user_id, "projects": project_id}, {"_id": 1})
+    project = await project_collection.find_one({"_id": ObjectId(project_id)}) if owner else None
+    if project is None:
+        return None
+
+    document_ids = [ObjectId(document_id) for document_id in project.get("documents", [])]
+    documents = [
+        document async for document in document_collection.find(
+            {"_id": {"$in": document_ids}}, {"size_bytes": 1, "content_hash": 1, "document_path": 1})
+    ]
+    size = sum(document.get("size_bytes", 0) for document in documents)
+
+    detached = await user_collection.update_one(
+        {"_id": user_id, "projects": project_id},
+        {"$inc": {"storage": Int64(-size)}, "$pull": {"projects": project_id}}
+    )
+    if detached.modified_count != 1:
+        # Another request deleted it in the meantime
+        return None
+
+    await asyncio.gather(
+        document_collection.delete_many({"_id": {"$in": document_ids}}),
+        project_collection.delete_one({"_id": project["_id"]})
+    )
+    return {
+        "path": project["path"],
+        "document_paths": [d["document_path"] for d in documents if d.get("document_path")],
+        "content_hashes": [d["content_hash"] for d in documents if d.get("content_hash")],
+        "size_bytes": size
+    }
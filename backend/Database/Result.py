@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+from motor.motor_asyncio import AsyncIOMotorCollection as Collection
+
+
+async def FindResult(
+    content_hash: str,
+    model_version: str,
+    mode: str,
+    result_collection: Collection
+) -> Optional[dict]:
+    """Return the stored analysis of a file's content for a model version, if any."""
+    return await result_collection.find_one({
+        "content_hash": content_hash,
+        "model_version": model_version,
+        "mode": mode
+    })
+
+
+async def StoreResult(
+    content_hash: str,
+    model_version: str,
+    mode: str,
+    result_id: str,
+    pdf_path: str,
+    summary: dict,
+    result_collection: Collection
+) -> dict:
+    """
+    Store (or replace) the analysis of a file's content for a model version.
+    Chunk level data lives on disk under the result id, the record only
+    indexes it.
+    """
+    record = {
+        "content_hash": content_hash,
+        "model_version": model_version,
+        "mode": mode,
+        "result_id": result_id,
+        "pdf_path": pdf_path,
+        "summary": summary,
+        "created_at": datetime.now(timezone.utc)
+    }
+    await result_collection.update_one(
+        {"content_hash": content_hash, "model_version": model_version, "mode": mode},
+        {"$set": record},
+        upsert=True
+    )
+    return record
+
+
+async def DeleteResults(result_ids: List[str], result_collection: Collection) -> int:
+    """Drop the records of results whose files were swept; returns how many were removed."""
+    if not result_ids:
+        return 0
+    result = await result_collection.delete_many({"result_id": {"$in": result_ids}})
+    return result.deleted_count
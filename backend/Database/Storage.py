@@ -0,0 +1,124 @@
+"""
+Offline reconciliation of storage accounting.
+
+Uploads and deletes keep `users.storage` and `blobs.refs` up to date with
+`$inc`, so the request path never walks directories. This command
+recomputes both from the document records, for use after crashes, manual
+edits or migrations:
+
+    python -m Database.Storage [--user USER_ID] [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict
+from bson import ObjectId
+from bson.int64 import Int64
+from motor.motor_asyncio import AsyncIOMotorCollection as Collection
+
+
+async def ReconcileUserStorage(
+    user: dict,
+    user_collection: Collection,
+    project_collection: Collection,
+    document_collection: Collection,
+    dry_run: bool = False
+) -> int:
+    """
+    Recompute a user's storage as the sum of their documents' sizes and
+    store it. Documents uploaded before sizes were recorded are measured on
+    disk once and get their `size_bytes` filled in.
+    """
+    project_ids = [ObjectId(project_id) for project_id in user.get("projects", [])]
+    document_ids = []
+    async for project in project_collection.find({"_id": {"$in": project_ids}}, {"documents": 1}):
+        document_ids.extend(ObjectId(document_id) for document_id in project.get("documents", []))
+
+    total = 0
+    async for document in document_collection.find(
+            {"_id": {"$in": document_ids}}, {"size_bytes": 1, "document_path": 1}):
+        size = document.get("size_bytes")
+        if size is None:
+            try:
+                size = os.path.getsize(document["document_path"])
+            except OSError:
+                size = 0
+            if not dry_run:
+                await document_collection.update_one(
+                    {"_id": document["_id"]}, {"$set": {"size_bytes": size}})
+        total += size
+
+    if not dry_run:
+        await user_collection.update_one({"_id": user["_id"]}, {"$set": {"storage": Int64(total)}})
+    return total
+
+
+async def ReconcileBlobRefs(
+    document_collection: Collection,
+    blob_collection: Collection,
+    dry_run: bool = False
+) -> Dict[str, int]:
+    """
+    Recount blob references from the documents that point at each blob,
+    recreate the records of blobs documents refer to but that have none, and
+    drop the records of blobs nothing refers to.
+
+    Returns:
+        Dict[str, int]: Hashes whose count was wrong or missing, with the
+        corrected count.
+    """
+    refs = Counter()
+    sizes = {}
+    async for document in document_collection.find(
+            {"content_hash": {"$exists": True}}, {"content_hash": 1, "size_bytes": 1}):
+        refs[document["content_hash"]] += 1
+        sizes[document["content_hash"]] = document.get("size_bytes", 0)
+
+    fixed = {}
+    missing = set(refs)
+    async for blob in blob_collection.find({}, {"refs": 1}):
+        missing.discard(blob["_id"])
+        count = refs.get(blob["_id"], 0)
+        if blob.get("refs") != count:
+            fixed[blob["_id"]] = count
+    fixed.update((content_hash, refs[content_hash]) for content_hash in missing)
+    if not dry_run:
+        now = datetime.now(timezone.utc)
+        for content_hash, count in fixed.items():
+            if count:
+                await blob_collection.update_one(
+                    {"_id": content_hash},
+                    {"$set": {"refs": count},
+                     "$setOnInsert": {"size_bytes": sizes[content_hash], "created_at": now}},
+                    upsert=True)
+            else:
+                await blob_collection.delete_one({"_id": content_hash})
+    return fixed
+
+
+async def main(user_id: str = None, dry_run: bool = False):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from Database.Credentials import MONGO_URL, MONGODB_DB_NAME
+
+    db = AsyncIOMotorClient(MONGO_URL)[MONGODB_DB_NAME]
+    query = {"_id": user_id} if user_id else {}
+    async for user in db["users"].find(query, {"projects": 1, "storage": 1}):
+        total = await ReconcileUserStorage(
+            user, db["users"], db["projects"], db["documents"], dry_run=dry_run)
+        if total != user.get("storage", 0):
+            print(f"[INFO] User {user['_id']}: storage {user.get('storage', 0)} -> {total}")
+
+    fixed = await ReconcileBlobRefs(db["documents"], db["blobs"], dry_run=dry_run)
+    for content_hash, count in fixed.items():
+        print(f"[INFO] Blob {content_hash}: refs -> {count}")
+    print(f"[INFO] Reconciliation {'checked' if dry_run else 'done'}, {len(fixed)} blob(s) corrected")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute storage usage and blob reference counts")
+    parser.add_argument("--user", help="Only reconcile this user's storage")
+    parser.add_argument("--dry-run", action="store_true", help="Report differences without writing")
+    args = parser.parse_args()
+    asyncio.run(main(args.user, args.dry_run))
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import io
 import json
@@ -7,6 +8,7 @@ from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from PyPDF2 import PdfMerger, PdfReader
@@ -28,12 +30,14 @@ from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from opentelemetry.instrumentation.logging import LoggingInstrumentor
 from opentelemetry.trace import StatusCode  # Import StatusCode
 
-from Utils.Para import split_paragraph
+from Utils.Para import chunk_by_tokens, get_tokenizer
 from Utils.File import UPLOAD_DIR, extract_zip
 from reportlab.lib.colors import Color
 import re
 
 from Utils.PDF import HighlightParagraphs, HighlightSentences, highlight_paragraphs
+from Utils.Analysis import analyse_pdf, expire_results
+from Utils.Result import new_result_id, result_pdf_path, save_result_data
 from typing import Dict
 
 # Databases
@@ -41,8 +45,12 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from Database.Credentials import MONGO_URL, MONGODB_DB_NAME
 from Auth.Route import EmailInput, login_route
 from Auth.JWT import get_current_user
-from Routes.ProjectManager import GetUserProjects, NewProject
-from Routes.Sheduler import analyze_websocket
+from Routes.ProjectManager import DeleteProject, GetUserProjects, NewProject
+from Routes.Sheduler import analyze_websocket, stream_job_events
+from Utils.Scheduler import AnalysisScheduler
+from Routes.CONFIG import RESULT_SWEEP_INTERVAL, RESULT_TTL_SECONDS, SCHEDULER_PER_USER_LIMIT, SCHEDULER_WORKERS
+from Routes.Result import GetResultData, GetResultPDF
+from Routes.Document import AnalyseDocument
 
 
 client = AsyncIOMotorClient(MONGO_URL)
@@ -51,6 +59,11 @@ db = client[MONGODB_DB_NAME]
 users_collection = db["users"]
 projects_collection = db["projects"]
 documents_collection = db["documents"]
+results_collection = db["results"]
+jobs_collection = db["jobs"]
+tasks_collection = db["tasks"]
+job_events_collection = db["job_events"]
+blobs_collection = db["blobs"]
 
 API_URL = "http://localhost:3344/api/get"
 
@@ -107,6 +120,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Result-Id"],
 )
 
 # Instrument FastAPI and logging
@@ -120,6 +134,46 @@ templates = Jinja2Templates(directory="Templates")
 # Get a tracer instance
 tracer = trace.get_tracer(__name__)
 
+# Project analysis workers, fed by the Mongo task queue
+scheduler = AnalysisScheduler(documents_collection, results_collection,
+                              jobs_collection, tasks_collection, job_events_collection,
+                              workers=SCHEDULER_WORKERS, per_user_limit=SCHEDULER_PER_USER_LIMIT,
+                              tracer=tracer)
+
+
+async def sweep_results_periodically():
+    """Removes results nobody used for RESULT_TTL_SECONDS, every RESULT_SWEEP_INTERVAL."""
+    while True:
+        try:
+            expired = await expire_results(results_collection, RESULT_TTL_SECONDS)
+            if expired:
+                logger.info(f"Removed {len(expired)} expired result(s)")
+        except Exception as e:
+            logger.warning(f"Result sweep failed: {e}")
+        await asyncio.sleep(RESULT_SWEEP_INTERVAL)
+
+
+result_sweeper = None
+
+
+@app.on_event("startup")
+async def start_scheduler():
+    global result_sweeper
+    # Downloads the tokenizer's vocabulary before the first request needs it
+    try:
+        await run_in_threadpool(get_tokenizer)
+    except Exception as e:
+        logger.warning(f"Tokenizer not loaded at startup, retried on first use: {e}")
+    await scheduler.start()
+    result_sweeper = asyncio.create_task(sweep_results_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    if result_sweeper is not None:
+        result_sweeper.cancel()
+    await scheduler.stop()
+
 
 @app.get("/Run")
 async def run():
@@ -128,32 +182,43 @@ async def run():
 
 
 @app.post("/highlight_pdf")
-async def highlight_pdf(file: UploadFile = File(...)):
+async def highlight_pdf(file: UploadFile = File(...), download: bool = False):
     with tracer.start_as_current_span("highlight_pdf_endpoint") as span:
         # Add high-level metadata
         span.set_attribute("http.request_type", "POST")
         span.set_attribute("endpoint.path", "/highlight_pdf")
         span.set_attribute("file.name", file.filename)
         span.set_attribute("file.content_type", file.content_type)
+        span.set_attribute("response.download", download)
 
         try:
             with tracer.start_as_current_span("read_file"):
                 pdf_bytes = await file.read()
                 span.add_event("File read successfully")
 
+            result_id = new_result_id()
+            pdf_path = result_pdf_path(result_id)
+            span.set_attribute("result.id", result_id)
+
             with tracer.start_as_current_span("highlight_paragraphs_utility"):
-                # Assuming highlight_paragraphs internally performs all the OCR, classification, and highlighting logic
-                highlighted_pdf = highlight_paragraphs(pdf_bytes)
+                # Saved straight to the result file, no in-memory copy
+                highlight_paragraphs(pdf_bytes, output=pdf_path)
+                save_result_data(result_id, {"filename": file.filename, "data": []})
                 span.add_event("PDF highlighting complete")
 
+            if download:
+                return await GetResultPDF(result_id, file.filename)
+
             with tracer.start_as_current_span("base64_encode"):
                 # Encode result to Base64
-                b64_pdf = base64.b64encode(highlighted_pdf).decode("utf-8")
+                with open(pdf_path, "rb") as f:
+                    b64_pdf = base64.b64encode(f.read()).decode("utf-8")
                 span.add_event("Base64 encoding complete")
 
             return JSONResponse(content={
                 "status": "success",
                 "filename": file.filename,
+                "result_id": result_id,
                 "highlighted_pdf_base64": b64_pdf
             })
 
@@ -207,11 +272,12 @@ async def ocr_test(request: Request):
 
 
 @app.post("/api/pdf/actual")
-async def pdf_actual(file: UploadFile = File(...)):
+async def pdf_actual(file: UploadFile = File(...), download: bool = False):
     with tracer.start_as_current_span("pdf_actual_endpoint") as span:
         span.set_attribute("http.request_type", "POST")
         span.set_attribute("endpoint.path", "/api/pdf/actual")
         span.set_attribute("file.name", file.filename)
+        span.set_attribute("response.download", download)
 
         if not file.filename.endswith(".pdf"):
             span.set_status(StatusCode.ERROR, description="Invalid file type")
@@ -225,12 +291,26 @@ async def pdf_actual(file: UploadFile = File(...)):
                 span.add_event("PDF bytes read")
 
             with tracer.start_as_current_span("process_pdf_actual"):
-                highlighted_pdf, data = await HighlightParagraphs(pdf_bytes)
-                encoded_pdf = base64.b64encode(highlighted_pdf).decode("utf-8")
-                processed_data = {
-                    "message": "PDF processed successfully", "pdf_bytes": encoded_pdf, "data": data}
+                # Stored results for the same content and model version are reused
+                result, cached = await analyse_pdf(
+                    pdf_bytes, results_collection, filename=file.filename, tracer=tracer)
+                result_id = result["result_id"]
+                span.set_attribute("result.id", result_id)
+                span.set_attribute("result.cached", cached)
+                for phase, seconds in result.get("timings", {}).items():
+                    span.set_attribute(f"highlight.{phase}_seconds", seconds)
                 span.add_event("PDF processing complete")
 
+            # Binary download, the classification data is at /api/result/{result_id}
+            if download:
+                return await GetResultPDF(result_id, file.filename)
+
+            with open(result["pdf_path"], "rb") as f:
+                encoded_pdf = base64.b64encode(f.read()).decode("utf-8")
+            processed_data = {
+                "message": "PDF processed successfully", "result_id": result_id,
+                "cached": cached, "pdf_bytes": encoded_pdf, "data": result["data"]}
+
             return JSONResponse(processed_data)
 
         except Exception as e:
@@ -241,6 +321,20 @@ async def pdf_actual(file: UploadFile = File(...)):
             return JSONResponse({"error": "Internal server error during PDF processing", "msg": str(e)}, status_code=500)
 
 
+@app.get("/api/result/{result_id}")
+async def result_data(result_id: str):
+    with tracer.start_as_current_span("result_data_endpoint") as span:
+        span.set_attribute("result.id", result_id)
+    return await GetResultData(result_id)
+
+
+@app.get("/api/result/{result_id}/pdf")
+async def result_pdf(result_id: str):
+    with tracer.start_as_current_span("result_pdf_endpoint") as span:
+        span.set_attribute("result.id", result_id)
+    return await GetResultPDF(result_id)
+
+
 @app.post("/api/ocr/pdf")
 async def ocr_pdf(file: UploadFile = File(...)):
     with tracer.start_as_current_span("ocr_pdf_endpoint") as span:
@@ -284,7 +378,7 @@ async def ocr_pdf(file: UploadFile = File(...)):
                         page_span.add_event("OCR complete")
 
                     with tracer.start_as_current_span("split_text_to_chunks"):
-                        tokens = split_paragraph(text, max_words=50)
+                        tokens = [c['text'] for c in await run_in_threadpool(chunk_by_tokens, text)]
                         page_span.set_attribute("chunk.count", len(tokens))
 
                     url = "http://localhost:3344/api/get"
@@ -330,6 +424,12 @@ async def ocr_pdf(file: UploadFile = File(...)):
 
 @app.websocket("/ws/ocr/pdf")
 async def ocr_pdf_ws(websocket: WebSocket):
+    """
+    Send the PDF bytes to start an OCR job, or {"job_id", "cursor"} as text
+    to reconnect to one. The job runs in the scheduler and survives the
+    socket closing; on reconnect, results after `cursor` (the last "seq"
+    received) are replayed before live progress continues.
+    """
     await websocket.accept()
     await websocket.send_text("Connected. Send PDF bytes now.")
 
@@ -337,109 +437,42 @@ async def ocr_pdf_ws(websocket: WebSocket):
         span.set_attribute("websocket.type", "ocr_pdf")
 
         try:
-            # Receive binary PDF file from client
-            pdf_bytes = await websocket.receive_bytes()
-            logger.info("Received PDF via WebSocket")
-            span.add_event("Received PDF bytes")
-
-            # Convert to images
-            with tracer.start_as_current_span("ws_convert_pdf_to_images") as convert_span:
-                pages = convert_from_bytes(pdf_bytes)
-                span.set_attribute("page.count", len(pages))
-                convert_span.add_event(f"Converted to {len(pages)} images")
+            message = await websocket.receive()
+            if message.get("type") == "websocket.disconnect":
+                raise WebSocketDisconnect()
+
+            if message.get("bytes") is not None:
+                # New job from the uploaded PDF
+                logger.info("Received PDF via WebSocket")
+                span.add_event("Received PDF bytes")
+                job = await scheduler.submit_ocr(message["bytes"])
+                cursor = 0
+            else:
+                # Reconnect to an existing job
+                payload = json.loads(message.get("text") or "{}")
+                job = await scheduler.get_job(payload.get("job_id", ""))
+                cursor = int(payload.get("cursor", 0))
+                if job is None or job.get("kind") != "ocr":
+                    await websocket.send_text(json.dumps({"error": "Job not found"}))
+                    await websocket.close()
+                    return
+                span.add_event("Resumed OCR job")
+
+            span.set_attribute("job.id", job["_id"])
+            span.set_attribute("page.count", job["total"])
 
             await websocket.send_text(json.dumps({
-                "total pages": len(pages)
+                "total pages": job["total"],
+                "job_id": job["_id"]
             }))
 
-            for i, page in enumerate(pages):
-                with tracer.start_as_current_span(f"ws_process_page_{i + 1}") as page_span:
-                    page_span.set_attribute("page.number", i + 1)
-
-                    # Convert PIL Image to base64
-                    with tracer.start_as_current_span("ws_convert_image_to_base64"):
-                        buffered = io.BytesIO()
-                        page.save(buffered, format="PNG")
-                        img_base64 = base64.b64encode(
-                            buffered.getvalue()).decode()
-                        page_span.add_event("Image base64 encoded")
-
-                    # OCR text extraction
-                    with tracer.start_as_current_span("ws_ocr_extraction"):
-                        text = ocr_from_base64(img_base64)
-                        page_span.add_event("OCR complete")
-
-                    with tracer.start_as_current_span("ws_split_text_to_chunks"):
-                        tokens = split_paragraph(text, max_words=50)
-                        page_span.set_attribute("chunk.count", len(tokens))
-
-                    url = "http://localhost:3344/api/get"
-                    page_result = []
-
-                    for j, token in enumerate(tokens):
-                        with tracer.start_as_current_span(f"ws_classify_chunk_{j + 1}") as chunk_span:
-                            chunk_span.set_attribute("chunk.index", j + 1)
-                            payload = {"chars": token}
-
-                            try:
-                                async with httpx.AsyncClient() as client:
-                                    response = await client.post(url, json=payload)
-                                    chunk_span.set_attribute(
-                                        "http.status_code", response.status_code)
-
-                                if response.status_code == 200:
-                                    data = response.json()
-                                    page_result.append(data)
-
-                                    # Send each result to client immediately
-                                    await websocket.send_text(json.dumps({
-                                        "page": i + 1,
-                                        "chunk": j + 1,
-                                        "text": token,  # <--- MODIFIED: Added the actual text chunk
-                                        "data": data
-                                    }))
-                                    chunk_span.add_event(
-                                        "Chunk classification sent to client")
-                                    logger.info(
-                                        f"Page {i+1}, Chunk {j+1}: {data}")
-                                else:
-                                    await websocket.send_text(json.dumps({
-                                        "page": i + 1,
-                                        "chunk": j + 1,
-                                        "error": response.text
-                                    }))
-                                    chunk_span.set_status(
-                                        StatusCode.ERROR, description="Classification API Failed")
-                                    logger.error(
-                                        f"Error fetching random number: {response.text}")
-                            except WebSocketDisconnect:
-                                logger.info(
-                                    "Client disconnected during chunk transmission")
-                                raise  # Re-raise to be caught outside the loop
-                            except Exception as http_e:
-                                chunk_span.set_status(
-                                    StatusCode.ERROR, description="Classification API Connection Failed")
-                                chunk_span.record_exception(http_e)
-                                # Continue processing other chunks but log the error
-
-                    # Send page completion message
-                    try:
-                        await websocket.send_text(json.dumps({
-                            "page": i + 1,
-                            "status": "completed"
-                        }))
-                        page_span.add_event("Page completed message sent")
-                    except WebSocketDisconnect:
-                        logger.info(
-                            "Client disconnected during page completion")
-                        raise
-
-            await websocket.send_text(json.dumps({"status": "done"}))
+            await stream_job_events(websocket, scheduler, job["_id"], cursor,
+                                    is_final=lambda e: e.get("status") in ("done", "failed"))
             await websocket.close()
             span.add_event("WebSocket connection closed successfully")
 
         except WebSocketDisconnect:
-            logger.warning("Client disconnected")
+            logger.warning("Client disconnected, the OCR job keeps running")
             # Not an error, just connection termination
             span.set_status(StatusCode.OK, description="Client Disconnected")
         except Exception as e:
@@ -540,9 +573,10 @@ async def project_upload(
         span.set_attribute("project.name", project_name)
         span.set_attribute("file.name", zip_file.filename)
 
-        # Delegate to the core logic function, passing the span
-    return await NewProject(zip_file, project_name, current_user, 
-                            users_collection, documents_collection, projects_collection)
+        # Delegate to the core logic function, passing the tracer
+        return await NewProject(zip_file, project_name, current_user,
+                                users_collection, documents_collection, projects_collection,
+                                blobs_collection, tracer=tracer)
 
 @app.get("/api/project")
 async def GetProject(current_user: Dict = Depends(get_current_user)):
@@ -552,9 +586,28 @@ async def GetProject(current_user: Dict = Depends(get_current_user)):
 
     return await GetUserProjects(current_user, projects_collection, users_collection)
 
+@app.delete("/api/project/{project_id}")
+async def project_delete(project_id: str, current_user: Dict = Depends(get_current_user)):
+    with tracer.start_as_current_span("project_delete_endpoint") as span:
+        span.set_attribute("user.id", current_user.get("id", "Error"))
+        span.set_attribute("project.id", project_id)
+
+        return await DeleteProject(project_id, current_user, users_collection,
+                                   documents_collection, projects_collection, blobs_collection)
+
+
+@app.get("/api/document/{document_id}/analysis")
+async def DocumentAnalysis(document_id: str, download: bool = False, current_user: Dict = Depends(get_current_user)):
+    with tracer.start_as_current_span("DocumentAnalysis") as span:
+        span.set_attribute("user.id", current_user.get("id", "Error"))
+        span.set_attribute("document.id", document_id)
+
+    return await AnalyseDocument(document_id, current_user, documents_collection,
+                                 results_collection, download=download, tracer=tracer)
+
 @app.websocket("/ws/analyze")
 async def Analyser(websocket: WebSocket):
-   return await analyze_websocket(websocket)
+   return await analyze_websocket(websocket, scheduler, users_collection, projects_collection)
 
 if __name__ == "__main__":
     import uvicorn
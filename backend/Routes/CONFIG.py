@@ -1 +1,10 @@
-MAX_FILE_SIZE_BYTES = 50 * 1024 * 1024 # 50 MB
\ No newline at end of file
+MAX_FILE_SIZE_BYTES = 50 * 1024 * 1024 # 50 MB
+MAX_EXTRACTED_SIZE_BYTES = 500 * 1024 * 1024 # 500 MB uncompressed per project
+
+# Documents analysed at once by this process, and by one user across processes
+SCHEDULER_WORKERS = 4
+SCHEDULER_PER_USER_LIMIT = 2
+
+# Results/<result_id>.pdf and .json are deleted once unused for this long
+RESULT_TTL_SECONDS = 7 * 24 * 3600
+RESULT_SWEEP_INTERVAL = 3600
@@ -0,0 +1,74 @@
+import os
+from typing import Dict
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from motor.motor_asyncio import AsyncIOMotorCollection
+from opentelemetry.trace import Tracer
+
+from Database.Document import SetDocumentResult
+from Routes.Result import GetResultPDF
+from Utils.Analysis import ClassificationError, analyse_pdf
+from Utils.File import UPLOAD_DIR
+
+
+async def AnalyseDocument(
+    document_id: str,
+    current_user: Dict,
+    document_collection: AsyncIOMotorCollection,
+    result_collection: AsyncIOMotorCollection,
+    download: bool = False,
+    tracer: Tracer = None
+):
+    """
+    Returns the analysis of one of the user's uploaded documents, running it
+    only if no result is stored for its content and the current model.
+    The document's `result` field is filled with the stored result location.
+    """
+    if not ObjectId.is_valid(document_id):
+        raise HTTPException(status_code=400, detail="Invalid document ID format.")
+
+    document = await document_collection.find_one({"_id": ObjectId(document_id)})
+    user_dir = os.path.join(UPLOAD_DIR, current_user["id"]) + os.sep
+    if not document or not document["document_path"].startswith(user_dir):
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    try:
+        with open(document["document_path"], "rb") as f:
+            pdf_bytes = f.read()
+    except OSError:
+        raise HTTPException(status_code=404, detail="Document file is missing.")
+
+    try:
+        result, cached = await analyse_pdf(
+            pdf_bytes, result_collection, filename=document["document_name"], tracer=tracer,
+            known_hash=document.get("content_hash"))
+    except ClassificationError as e:
+        raise HTTPException(
+            status_code=503, detail=f"Classification service unavailable: {str(e)}")
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error during analysis: {str(e)}")
+
+    if not cached or document.get("result", {}).get("result_id") != result["result_id"]:
+        await SetDocumentResult(document_id, {
+            "result_id": result["result_id"],
+            "content_hash": result["content_hash"],
+            "model_version": result["model_version"],
+            "pdf_path": result["pdf_path"],
+            "summary": result["summary"]
+        }, document_collection)
+
+    if download:
+        return await GetResultPDF(result["result_id"], document["document_name"])
+
+    return JSONResponse({
+        "message": "Document analysed successfully",
+        "document_id": document_id,
+        "result_id": result["result_id"],
+        "cached": cached,
+        "model_version": result["model_version"],
+        "summary": result["summary"],
+        "data": result["data"],
+        "chunks": result["chunks"]
+    })
@@ -1,20 +1,36 @@
 
 import os
 import tempfile
+import time
+from contextlib import nullcontext
 from typing import Dict
+from uuid import uuid4
 import zipfile
+from bson import ObjectId
 from fastapi import UploadFile, HTTPException
 from fastapi.responses import JSONResponse
-
-from Routes.CONFIG import MAX_FILE_SIZE_BYTES
-from Utils.File import UPLOAD_DIR, calculate_directory_size, calculate_directory_size_for_user, copy_temp_tree_to_storage
+from fastapi.concurrency import run_in_threadpool
+
+from Routes.CONFIG import MAX_FILE_SIZE_BYTES, MAX_EXTRACTED_SIZE_BYTES
+from Utils.Blob import remove_blob
+from Utils.File import UPLOAD_DIR, move_tree, remove_files, remove_tree, UploadTooLargeError, spool_upload, extract_zip_members
+from Utils.Ingest import preprocess_document
+from Utils.Plagirarism import remove_documents
+from Utils.Result import remove_text_layer
 from motor.motor_asyncio import AsyncIOMotorCollection
-from Database.Document import RegisterDocument
-from Database.Project import RegisterProject
-from bson.int64 import Int64
+from opentelemetry.trace import Tracer
+from Database.Blob import AddBlobRefs, ReleaseBlobRefs
+from Database.Document import RegisterDocuments
+from Database.Project import DeleteProjectForUser, RegisterProjectForUser
 from Database.User import get_all_user_projects
 
 
+def _remove_content(content_hash: str) -> None:
+    """Deletes what was kept for a content no document refers to any more."""
+    remove_blob(content_hash)
+    remove_text_layer(content_hash)
+
+
 # New Project
 async def NewProject(
     zip_file: UploadFile,
@@ -22,80 +38,118 @@ async def NewProject(
     current_user: Dict,
     user_collection: AsyncIOMotorCollection,
     document_collection: AsyncIOMotorCollection,
-    project_collection: AsyncIOMotorCollection
+    project_collection: AsyncIOMotorCollection,
+    blob_collection: AsyncIOMotorCollection,
+    tracer: Tracer = None
 ):
     """
-    Accepts a ZIP file and project name, extracts the file, and calculates 
-    the total disk space used by the extracted contents.
+    Accepts a ZIP file and project name, streams the upload to disk and
+    extracts it into the user's storage. Every project gets its own directory
+    named after its ID, so projects with the same name never share files.
+    Members are extracted to a staging directory next to the project and
+    moved into place once every one of them succeeded, so a failed upload
+    leaves no partial files. Files are
+    deduplicated through the blob store. The disk space used is taken from
+    the archive's metadata.
     """
     if not zip_file.filename or not zip_file.filename.endswith(".zip"):
         raise HTTPException(
             status_code=400, detail="File must be a ZIP archive.")
+    if not project_name or os.path.basename(project_name) != project_name or project_name in (".", ".."):
+        raise HTTPException(
+            status_code=400, detail="Invalid project name.")
 
-    # Create a temporary directory to store the ZIP file and extracted contents
+    project_id = ObjectId()
+    uploads_dir = os.path.join(UPLOAD_DIR, current_user["id"], "uploads")
+    project_dir = os.path.join(uploads_dir, str(project_id))
+    # Same filesystem as the project, so moving it into place is a rename
+    staging_dir = os.path.join(uploads_dir, f".{project_id}.{uuid4().hex}.staging")
+
+    # Only the ZIP itself is spooled to a temporary directory
     with tempfile.TemporaryDirectory() as temp_dir:
-        zip_path = os.path.join(temp_dir, zip_file.filename)
-        extract_path = os.path.join(temp_dir, project_name)
-        os.makedirs(extract_path, exist_ok=True)  # Directory for extraction
+        zip_path = os.path.join(temp_dir, "upload.zip")
 
         try:
-            content = await zip_file.read()
-            if len(content) > MAX_FILE_SIZE_BYTES:
+            try:
+                _, archive_hash = await spool_upload(
+                    zip_file, zip_path, MAX_FILE_SIZE_BYTES)
+            except UploadTooLargeError:
                 raise HTTPException(
                     status_code=413, detail=f"File too large. Max size is {MAX_FILE_SIZE_BYTES / (1024 * 1024):.0f} MB.")
 
-            with open(zip_path, "wb") as f:
-                f.write(content)
-
-            files = []
-            # 2. Extract the ZIP file
-            with zipfile.ZipFile(zip_path, 'r') as zf:
-                # Prevent Zip Slip vulnerability by checking paths (best practice)
-
-                for member in zf.namelist():
-                    if '..' in member or member.startswith('/') or member.startswith('\\'):
-                        continue
-                    zf.extract(member, extract_path)
-                    file_id = await RegisterDocument(
-                        document_name=os.path.basename(member),
-                        document_path=os.path.join(
-                            UPLOAD_DIR, current_user["id"], project_name, "uploads", member),
-                        document_collection=document_collection
-                    )
-                    files.append(file_id)
-            copy_temp_tree_to_storage(
-                extract_path, current_user["id"], project_name)
+            try:
+                # Members are extracted and preprocessed in a thread pool
+                members = await run_in_threadpool(
+                    extract_zip_members, zip_path, staging_dir, MAX_EXTRACTED_SIZE_BYTES,
+                    on_member=preprocess_document)
+                await run_in_threadpool(move_tree, staging_dir, project_dir)
+            except FileExistsError:
+                raise HTTPException(
+                    status_code=409, detail="Project directory already exists.")
+            except UploadTooLargeError:
+                raise HTTPException(
+                    status_code=413, detail=f"Extracted contents too large. Max size is {MAX_EXTRACTED_SIZE_BYTES / (1024 * 1024):.0f} MB.")
+            finally:
+                # Already gone once moved into place
+                await run_in_threadpool(remove_tree, staging_dir)
+
+            for member in members:
+                member["document_path"] = os.path.join(
+                    project_dir, os.path.relpath(member["document_path"], staging_dir))
 
-            disk_space_bytes = calculate_directory_size(extract_path)
+            disk_space_bytes = sum(member["size_bytes"] for member in members)
             disk_space_mb = disk_space_bytes / (1024 * 1024)
 
-            # Update user's storage information in the database
-            project_uid = await RegisterProject(
-                project_name=project_name,
-                project_path=os.path.join(
-                    UPLOAD_DIR, current_user["id"], project_name),
-                documents=files,
-                project_collection=project_collection
-            )
-
-            await user_collection.update_one(
-                {"_id": current_user["id"]},
-                {
-                    # ensures storage is stored as int64
-                    "$set": {"storage": Int64(disk_space_bytes)},
-                    # appends new project to list
-                    "$push": {"projects": project_uid}
-                }
-            )
+            # Register every document, then the project and its owner, in batches
+            with tracer.start_as_current_span("register_project") if tracer else nullcontext() as span:
+                start = time.perf_counter()
+                refs_added = False
+                try:
+                    files = await RegisterDocuments(members, document_collection)
+                    await AddBlobRefs(members, blob_collection)
+                    refs_added = True
+                    documents_seconds = time.perf_counter() - start
+
+                    await RegisterProjectForUser(
+                        project_name=project_name,
+                        project_path=project_dir,
+                        documents=files,
+                        user_id=current_user["id"],
+                        storage=disk_space_bytes,
+                        project_collection=project_collection,
+                        user_collection=user_collection,
+                        archive_hash=archive_hash,
+                        project_id=project_id
+                    )
+                except Exception:
+                    # Nothing refers to the project yet, so its records and files are undone.
+                    # References of a half-applied AddBlobRefs are left over-counted, which
+                    # only keeps blobs alive until Database.Storage reconciles them.
+                    await document_collection.delete_many(
+                        {"document_path": {"$in": [member["document_path"] for member in members]}})
+                    orphans = await ReleaseBlobRefs(
+                        [member["content_hash"] for member in members], blob_collection) if refs_added else []
+                    await run_in_threadpool(remove_tree, project_dir)
+                    for content_hash in orphans:
+                        await run_in_threadpool(_remove_content, content_hash)
+                    raise
+
+                if span is not None:
+                    span.set_attribute("documents.count", len(files))
+                    span.set_attribute("documents.register_seconds", documents_seconds)
+                    span.set_attribute("project.register_seconds", time.perf_counter() - start - documents_seconds)
 
             return JSONResponse({
                 "message": "Project uploaded, extracted, and analyzed successfully",
                 "project_name": project_name,
-                "extracted_path": extract_path,  # For reference
+                "project_id": str(project_id),
+                "extracted_path": project_dir,  # For reference
                 "extracted_size_bytes": disk_space_bytes,
                 "extracted_size_mb": f"{disk_space_mb:.2f} MB",
             })
 
+        except HTTPException:
+            raise
         except zipfile.BadZipFile:
             raise HTTPException(
                 status_code=400, detail="The uploaded file is not a valid ZIP file.")
@@ -103,6 +157,48 @@ async def NewProject(
             raise HTTPException(
                 status_code=500, detail=f"Internal server error during processing: {str(e)}")
 
+async def DeleteProject(
+    project_id: str,
+    current_user: Dict,
+    user_collection: AsyncIOMotorCollection,
+    document_collection: AsyncIOMotorCollection,
+    project_collection: AsyncIOMotorCollection,
+    blob_collection: AsyncIOMotorCollection
+):
+    """
+    Deletes one of the user's projects with its documents and files. Only
+    the files the project's own documents point at are removed, so a project
+    sharing its directory with another one (uploaded before projects had
+    their own directories) leaves the other one's files alone. The user's
+    storage goes down by the recorded document sizes, and blobs no other
+    document refers to are removed with their text layer and plagiarism
+    index entries.
+    """
+    if not ObjectId.is_valid(project_id):
+        raise HTTPException(status_code=400, detail="Invalid project ID format.")
+
+    removed = await DeleteProjectForUser(
+        project_id, current_user["id"], project_collection, document_collection, user_collection)
+    if removed is None:
+        raise HTTPException(status_code=404, detail="Project not found.")
+
+    orphans = await ReleaseBlobRefs(removed["content_hashes"], blob_collection)
+    user_dir = os.path.join(UPLOAD_DIR, current_user["id"]) + os.sep
+    if removed["path"].startswith(user_dir):
+        await run_in_threadpool(remove_files, removed["document_paths"], removed["path"])
+    for content_hash in orphans:
+        await run_in_threadpool(_remove_content, content_hash)
+    if orphans:
+        # Indexed under their content hash, see Utils.Scheduler.run_plagiarism_model
+        await run_in_threadpool(remove_documents, orphans)
+
+    return JSONResponse({
+        "message": "Project deleted successfully",
+        "project_id": project_id,
+        "freed_size_bytes": removed["size_bytes"]
+    })
+
+
 async def GetUserProjects(
     current_user: Dict,
     project_collection: AsyncIOMotorCollection,
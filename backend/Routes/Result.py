@@ -0,0 +1,31 @@
+import os
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+
+from Utils.Result import is_valid_result_id, load_result_data, result_pdf_path
+
+
+async def GetResultData(result_id: str):
+    """
+    Returns the classification data stored for a result id.
+    """
+    data = load_result_data(result_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+
+    return JSONResponse({"result_id": result_id, **data})
+
+
+async def GetResultPDF(result_id: str, filename: str = None):
+    """
+    Streams the highlighted PDF stored for a result id as application/pdf.
+    """
+    if not is_valid_result_id(result_id) or not os.path.exists(result_pdf_path(result_id)):
+        raise HTTPException(status_code=404, detail="Result not found")
+
+    return FileResponse(
+        result_pdf_path(result_id),
+        media_type="application/pdf",
+        filename=filename or f"{result_id}.pdf",
+        headers={"X-Result-Id": result_id}
+    )
@@ -1,17 +1,57 @@
 
 # --- WebSocket Route ---
+import asyncio
 import json
+from typing import Callable, Dict
+from bson import ObjectId
 from fastapi import WebSocket, WebSocketDisconnect
+from motor.motor_asyncio import AsyncIOMotorCollection
 
-from Utils.Scheduler import process_documents
+from Auth.JWT import verify_access_token
+from Database.Job import DONE, FAILED
+from Utils.Scheduler import AnalysisScheduler
 
 
-async def analyze_websocket(websocket: WebSocket):
+async def analyze_websocket(
+    websocket: WebSocket,
+    scheduler: AnalysisScheduler,
+    user_collection: AsyncIOMotorCollection,
+    project_collection: AsyncIOMotorCollection
+):
+    """
+    Queues an analysis job for a project and streams its progress. The work
+    itself runs in the scheduler's workers; this socket only subscribes, so
+    closing it does not stop the job.
+
+    Send {"token", "project_id", "ai_model", "plagiarism_model"} to start a
+    job, or {"token", "job_id", "cursor"} to reconnect to one: events after
+    `cursor` (the last "seq" received) are replayed, then live ones follow.
+    """
     await websocket.accept()
     try:
         data = await websocket.receive_text()
         payload = json.loads(data)
 
+        user = verify_access_token(payload.get("token", ""))
+        if user is None:
+            await websocket.send_json({"error": "Invalid or expired authentication token"})
+            await websocket.close()
+            return
+
+        # Reconnect to a running or finished job
+        if payload.get("job_id"):
+            job = await scheduler.get_job(payload["job_id"])
+            if job is None or job.get("user_id") != user["id"]:
+                await websocket.send_json({"error": "Job not found"})
+                await websocket.close()
+                return
+            await websocket.send_json({
+                "status": "resumed", "job_id": job["_id"], "total_docs": job["total"]
+            })
+            await stream_job_events(websocket, scheduler, job["_id"], int(payload.get("cursor", 0)),
+                                    is_final=lambda e: e.get("status") == "completed")
+            return
+
         project_id = payload.get("project_id")
         ai_model = payload.get("ai_model")
         plag_model = payload.get("plagiarism_model")
@@ -21,11 +61,73 @@ async def analyze_websocket(websocket: WebSocket):
             await websocket.close()
             return
 
-        # Schedule the analysis in background
-        await process_documents(websocket, project_id, ai_model, plag_model)
+        owner = await user_collection.find_one({"_id": user["id"], "projects": project_id})
+        project = await project_collection.find_one({"_id": ObjectId(project_id)}) \
+            if owner and ObjectId.is_valid(project_id) else None
+        if project is None:
+            await websocket.send_json({"error": "Project not found"})
+            await websocket.close()
+            return
+
+        # Queue the analysis, workers pick it up in the background
+        job_id = await scheduler.submit(
+            project_id, user["id"], project.get("documents", []), ai_model, plag_model)
+        await websocket.send_json({
+            "status": "started", "job_id": job_id, "total_docs": len(project.get("documents", []))
+        })
+        await stream_job_events(websocket, scheduler, job_id, 0,
+                                is_final=lambda e: e.get("status") == "completed")
 
     except WebSocketDisconnect:
         print("Client disconnected")
     except Exception as e:
         await websocket.send_json({"error": str(e)})
-        await websocket.close()
\ No newline at end of file
+        await websocket.close()
+
+
+async def stream_job_events(
+    websocket: WebSocket,
+    scheduler: AnalysisScheduler,
+    job_id: str,
+    cursor: int,
+    is_final: Callable[[Dict], bool],
+    poll_interval: float = 5.0
+):
+    """
+    Sends a job's stored events after `cursor`, then live ones, until a
+    final event is sent. Live events come from this process; the store is
+    polled as well, so events published by other processes (or before a
+    restart) are not missed. Every event carries its "seq", the cursor to
+    reconnect with.
+    """
+    queue = scheduler.subscribe(job_id)
+    try:
+        while True:
+            # Catch up from the store, then wait for live events
+            for event in await scheduler.get_events(job_id, cursor):
+                await websocket.send_json(event)
+                cursor = event["seq"]
+                if is_final(event):
+                    return
+
+            job = await scheduler.get_job(job_id)
+            if job is None or (job["status"] in (DONE, FAILED) and job.get("seq", 0) <= cursor):
+                return
+
+            # Forward live events while they arrive in order
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    break
+                if event["seq"] <= cursor:
+                    continue
+                if event["seq"] > cursor + 1:
+                    # Missed events in between, the store replays them in order
+                    break
+                await websocket.send_json(event)
+                cursor = event["seq"]
+                if is_final(event):
+                    return
+    finally:
+        scheduler.unsubscribe(job_id, queue)
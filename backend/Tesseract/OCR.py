@@ -1,8 +1,16 @@
 import base64
 from io import BytesIO
+from typing import Dict, List, Tuple
 from PIL import Image
 import pytesseract
 
+# PyMuPDF compatible layout tuples
+# word:  (x0, y0, x1, y1, word, block_no, line_no, word_no)
+# block: (x0, y0, x1, y1, text, block_no, block_type)
+WordTuple = Tuple[float, float, float, float, str, int, int, int]
+BlockTuple = Tuple[float, float, float, float, str, int, int]
+
+
 def ocr_from_base64(base64_string):
     try:
         # Decode base64 to image bytes
@@ -18,6 +26,103 @@ def ocr_from_base64(base64_string):
     except Exception as e:
         return f"❌ Error during OCR: {e}"
 
+
+def ocr_from_image(image: Image.Image) -> str:
+    """OCRs an already decoded image, skipping the base64 round trip."""
+    return pytesseract.image_to_string(image).strip()
+
+
+def tesseract_data_to_layout(data: Dict[str, List], scale: float = 1.0) -> Tuple[List[BlockTuple], List[WordTuple]]:
+    """
+    Converts the output of `pytesseract.image_to_data` into the tuple shapes
+    produced by PyMuPDF's `page.get_text("blocks")` and `page.get_text("words")`.
+
+    Args:
+        data (Dict[str, List]): Output of image_to_data with Output.DICT.
+        scale (float): Factor converting image pixels to PDF points
+                       (72 / dpi for a rendered page).
+
+    Returns:
+        Tuple[List, List]: (blocks, words), both in reading order.
+    """
+    words: List[WordTuple] = []
+    # block_no -> [x0, y0, x1, y1, lines], lines is a list of word lists
+    block_boxes: Dict[int, list] = {}
+    # (block, par, line) from tesseract -> (block_no, line_no) as PyMuPDF numbers them
+    line_ids: Dict[Tuple[int, int, int], Tuple[int, int]] = {}
+    block_ids: Dict[int, int] = {}
+    line_counts: Dict[int, int] = {}
+
+    for i, text in enumerate(data["text"]):
+        text = (text or "").strip()
+        if not text or float(data["conf"][i]) < 0:
+            continue
+
+        tess_block = data["block_num"][i]
+        key = (tess_block, data["par_num"][i], data["line_num"][i])
+
+        if tess_block not in block_ids:
+            block_ids[tess_block] = len(block_ids)
+        block_no = block_ids[tess_block]
+
+        if key not in line_ids:
+            line_ids[key] = (block_no, line_counts.get(block_no, 0))
+            line_counts[block_no] = line_ids[key][1] + 1
+        _, line_no = line_ids[key]
+
+        x0 = data["left"][i] * scale
+        y0 = data["top"][i] * scale
+        x1 = (data["left"][i] + data["width"][i]) * scale
+        y1 = (data["top"][i] + data["height"][i]) * scale
+
+        box = block_boxes.get(block_no)
+        if box is None:
+            box = block_boxes[block_no] = [x0, y0, x1, y1, []]
+        else:
+            box[0], box[1] = min(box[0], x0), min(box[1], y0)
+            box[2], box[3] = max(box[2], x1), max(box[3], y1)
+
+        lines = box[4]
+        if line_no == len(lines):
+            lines.append([])
+        word_no = len(lines[line_no])
+        lines[line_no].append(text)
+
+        words.append((x0, y0, x1, y1, text, block_no, line_no, word_no))
+
+    blocks: List[BlockTuple] = []
+    for block_no, (x0, y0, x1, y1, lines) in block_boxes.items():
+        text = "\n".join(" ".join(line) for line in lines) + "\n"
+        blocks.append((x0, y0, x1, y1, text, block_no, 0))
+
+    return blocks, words
+
+
+def ocr_layout_from_image(image: Image.Image, scale: float = 1.0) -> Tuple[List[BlockTuple], List[WordTuple]]:
+    """
+    Runs a single OCR pass over an image and returns PyMuPDF shaped
+    (blocks, words) so OCRed pages can be grouped and highlighted like
+    born-digital ones.
+    """
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    return tesseract_data_to_layout(data, scale)
+
+
+def ocr_layout_from_base64(base64_string: str, scale: float = 1.0) -> Tuple[List[BlockTuple], List[WordTuple]]:
+    """Same as `ocr_layout_from_image` for a base64 encoded image."""
+    image = Image.open(BytesIO(base64.b64decode(base64_string)))
+    return ocr_layout_from_image(image, scale)
+
+
+def ocr_page_layout(page, dpi: int = 300) -> Tuple[List[BlockTuple], List[WordTuple]]:
+    """
+    Renders a PyMuPDF page and OCRs it, returning boxes in PDF points so they
+    can be passed straight to `page.add_highlight_annot`.
+    """
+    pix = page.get_pixmap(dpi=dpi)
+    image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    return ocr_layout_from_image(image, scale=72 / dpi)
+
 # --- Example usage ---
 if __name__ == "__main__":
     # Example base64 image (replace this with your own)
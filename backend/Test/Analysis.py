@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+import sys
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Utils.Analysis as analysis
+import Utils.Result as results
+from Utils.Analysis import ClassificationError, analyse_pdf, content_hash
+from Test.AsyncMongo import async_database
+
+PDF_BYTES = b"%PDF-1.4 analysis cache test"
+
+
+class TestAnalysisCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.results = async_database()("results")
+        self.calls = []
+
+        self.classes = [(1, 0.9)]
+
+        async def fake_highlight(pdf_bytes, output, mode="paragraphs", min_count=0, tracer=None):
+            self.calls.append(mode)
+            with open(output, "wb") as f:
+                f.write(b"%PDF highlighted")
+            data = [("some text", class_index, score) for class_index, score in self.classes]
+            return data, {"classify": 0.1}, [{"page": 0, "class": c} for _, c, _ in data]
+
+        self.patches = [mock.patch.object(results, "RESULT_DIR", self.tmp.name),
+                        mock.patch.object(analysis, "HighlightPDF", fake_highlight)]
+        for patch in self.patches:
+            patch.start()
+
+    async def asyncTearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+    async def test_cache_hit(self):
+        """The same content is analysed once, later requests read the stored result."""
+        first, cached = await analyse_pdf(PDF_BYTES, self.results, filename="a.pdf")
+        self.assertFalse(cached)
+        self.assertEqual(first["content_hash"], content_hash(PDF_BYTES))
+        self.assertEqual(first["summary"], {"1": len("some text")})
+
+        # Another file name, same content
+        second, cached = await analyse_pdf(PDF_BYTES, self.results, filename="b.pdf",
+                                           known_hash=content_hash(PDF_BYTES))
+        self.assertTrue(cached)
+        self.assertEqual(self.calls, ["paragraphs"])
+        self.assertEqual(second["result_id"], first["result_id"])
+        self.assertEqual(second["data"], [["some text", 1, 0.9]])
+        self.assertEqual(await self.results.count_documents({}), 1)
+
+        # A result whose files were removed is recomputed
+        os.remove(first["pdf_path"])
+        third, cached = await analyse_pdf(PDF_BYTES, self.results)
+        self.assertFalse(cached)
+        self.assertNotEqual(third["result_id"], first["result_id"])
+
+    async def test_model_version_bump(self):
+        """Results of an older model version are not reused."""
+        old, _ = await analyse_pdf(PDF_BYTES, self.results)
+        with mock.patch.object(analysis, "MODEL_VERSION", "bert-tiny-v2"):
+            new, cached = await analyse_pdf(PDF_BYTES, self.results)
+            again, cached_again = await analyse_pdf(PDF_BYTES, self.results)
+        self.assertFalse(cached)
+        self.assertEqual(new["model_version"], "bert-tiny-v2")
+        self.assertNotEqual(new["result_id"], old["result_id"])
+        self.assertTrue(cached_again)
+        self.assertEqual(again["result_id"], new["result_id"])
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_mode_key(self):
+        """Paragraph and sentence results of the same content are stored separately."""
+        paragraphs, _ = await analyse_pdf(PDF_BYTES, self.results, mode="paragraphs")
+        sentences, cached = await analyse_pdf(PDF_BYTES, self.results, mode="sentences")
+        self.assertFalse(cached)
+        self.assertNotEqual(sentences["result_id"], paragraphs["result_id"])
+        self.assertEqual(self.calls, ["paragraphs", "sentences"])
+
+        for mode, expected in [("paragraphs", paragraphs), ("sentences", sentences)]:
+            result, cached = await analyse_pdf(PDF_BYTES, self.results, mode=mode)
+            self.assertTrue(cached)
+            self.assertEqual(result["result_id"], expected["result_id"])
+        self.assertEqual(await self.results.count_documents({}), 2)
+
+    async def test_failed_classification(self):
+        """A result with units the model server did not classify is not stored."""
+        self.classes = [(1, 0.9), (4, -1)]
+        with self.assertRaises(ClassificationError):
+            await analyse_pdf(PDF_BYTES, self.results)
+        self.assertEqual(await self.results.count_documents({}), 0)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+        # The next attempt analyses the document again
+        self.classes = [(1, 0.9), (2, 0.7)]
+        result, cached = await analyse_pdf(PDF_BYTES, self.results)
+        self.assertFalse(cached)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(await self.results.count_documents({}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Motor-like async collections over mongomock, for tests of the Database
+functions and the scheduler without a MongoDB server.
+"""
+import mongomock
+from pymongo import UpdateOne
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.cursor)[:length]
+
+    def __aiter__(self):
+        self._rows = iter(self.cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._rows)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    """Exposes a mongomock collection's methods as coroutines, like motor."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    def aggregate(self, pipeline, **kwargs):
+        return AsyncCursor(self.collection.aggregate(pipeline))
+
+    async def bulk_write(self, requests, ordered=True):
+        # mongomock's bulk API does not accept newer pymongo request objects
+        for request in requests:
+            if not isinstance(request, UpdateOne):
+                raise NotImplementedError(type(request).__name__)
+            self.collection.update_one(request._filter, request._doc, upsert=request._upsert)
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+def async_database(name: str = "test"):
+    """Returns a function giving the async collections of a fresh in-memory database."""
+    db = mongomock.MongoClient(tz_aware=True)[name]
+    return lambda collection: AsyncCollection(db[collection])
@@ -0,0 +1,60 @@
+import os
+import unittest
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.Group import GroupPara
+from Utils.Para import align_sentences_to_words, club_sentences_by_word_count
+
+def block(text):
+    return (0, 0, 1, 1, text, 0, 0)
+
+class TestGroupPara(unittest.TestCase):
+    def test_groups_reach_min_count(self):
+        """Check paragraphs are grouped until minCount words are reached."""
+        blocks = [block("a b "), block("c d "), block("e f g "), block("h i ")]
+        grouped, paras = GroupPara(blocks, minCount=3)
+        self.assertEqual(paras, ["a b c d ", "e f g h i "])
+        self.assertEqual(len(grouped[0]), 2)
+
+    def test_trailing_group_is_kept(self):
+        """Check a short trailing group is merged instead of dropped."""
+        blocks = [block("a b c "), block("d ")]
+        grouped, paras = GroupPara(blocks, minCount=3)
+        self.assertEqual(paras, ["a b c d "])
+        self.assertEqual(sum(len(g) for g in grouped), 2)
+
+    def test_only_short_group(self):
+        """Check input shorter than minCount still yields one group."""
+        grouped, paras = GroupPara([block("a ")], minCount=50)
+        self.assertEqual(paras, ["a "])
+
+
+class TestClubSentences(unittest.TestCase):
+    def test_clubbing(self):
+        """Check sentences are clubbed until min_count words are reached."""
+        sentences = [
+            {'text': "One two.", 'words': [1, 2]},
+            {'text': "Three.", 'words': [3]},
+            {'text': "Four five six.", 'words': [4, 5, 6]},
+        ]
+        chunks = club_sentences_by_word_count(sentences, min_count=3)
+        self.assertEqual([c['text'] for c in chunks], ["One two. Three.", "Four five six."])
+        self.assertEqual(chunks[0]['words'], [1, 2, 3])
+        # Input lists are not mutated
+        self.assertEqual(sentences[0]['words'], [1, 2])
+
+
+class TestAlignSentences(unittest.TestCase):
+    def test_every_word_is_aligned(self):
+        """Check sentences map to consecutive word tuples with none dropped."""
+        words = [(i, 0, i + 1, 1, w, 0, 0, i) for i, w in
+                 enumerate(["Hello", "world.", "e.g.", "this", "is", "odd!", "Tail"])]
+        sentences = align_sentences_to_words(words)
+        self.assertEqual([s['text'] for s in sentences],
+                         ["Hello world.", "e.g.", "this is odd!", "Tail"])
+        self.assertEqual([w for s in sentences for w in s['words']], words)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+import sys
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import Utils.PDF as pdf_engine
+from Utils.PDF import HighlightPDF
+
+PARAGRAPHS = [
+    "The first paragraph talks about cats. Cats sit on mats all day long.",
+    "The second paragraph is about dogs. Dogs run in the park every morning."
+]
+
+
+def make_pdf(pages=1) -> bytes:
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        for i, text in enumerate(PARAGRAPHS):
+            page.insert_textbox(fitz.Rect(72, 72 + i * 120, 520, 172 + i * 120), text, fontsize=11)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+async def fake_class(text: str):
+    return (1 if "dogs" in text else 0), 0.9
+
+
+def highlights(pdf: bytes):
+    """(page, stroke colour, rect) of every highlight annotation, colours rounded."""
+    with fitz.open("pdf", pdf) as doc:
+        return [(page.number, tuple(round(c, 1) for c in annot.colors["stroke"]), tuple(annot.rect))
+                for page in doc for annot in page.annots() if annot.type[1] == "Highlight"]
+
+
+class TestHighlightPDF(unittest.IsolatedAsyncioTestCase):
+    async def test_text_pages(self):
+        """Paragraphs of pages with a text layer are classified and highlighted in their class colour."""
+        output = io.BytesIO()
+        with mock.patch.object(pdf_engine, "GetClass", fake_class), \
+                mock.patch.object(pdf_engine, "ocr_page_layout") as ocr:
+            data, timings, chunks = await HighlightPDF(make_pdf(pages=2), output)
+
+        ocr.assert_not_called()
+        self.assertEqual([(text.strip(), cls) for text, cls, _ in data], [(PARAGRAPHS[0], 0), (PARAGRAPHS[1], 1)] * 2)
+        self.assertEqual(set(timings), {"extract", "classify", "annotate", "save"})
+        self.assertEqual([(c["page"], c["class"]) for c in chunks], [(0, 0), (0, 1), (1, 0), (1, 1)])
+
+        found = highlights(output.getvalue())
+        colors = [tuple(round(c, 1) for c in color) for color in pdf_engine.CLASS_COLOR_MAP]
+        self.assertEqual([(page, color) for page, color, _ in found],
+                         [(0, colors[0]), (0, colors[1]), (1, colors[0]), (1, colors[1])])
+        # Each highlight covers the rect recorded in its chunk
+        for (_, _, rect), chunk in zip(found, chunks):
+            self.assertTrue(fitz.Rect(rect).contains(fitz.Rect(chunk["rects"][0])))
+
+    async def test_ocr_fallback(self):
+        """Pages without a text layer are OCRed and highlighted where the OCR found the words."""
+        doc = fitz.open(stream=make_pdf(pages=1), filetype="pdf")
+        doc.new_page()
+        pdf = doc.tobytes()
+        doc.close()
+        text = "Scanned text about dogs from the second page."
+        block = (72.0, 300.0, 400.0, 320.0, text, 0, 0)
+        words = [(72.0 + 40 * i, 300.0, 110.0 + 40 * i, 320.0, word, 0, 0, i) for i, word in enumerate(text.split())]
+
+        ocr_pages = []
+
+        def fake_ocr(page, dpi=300):
+            ocr_pages.append(page.number)
+            return [block], words
+
+        output = io.BytesIO()
+        with mock.patch.object(pdf_engine, "GetClass", fake_class), \
+                mock.patch.object(pdf_engine, "ocr_page_layout", fake_ocr):
+            data, _, chunks = await HighlightPDF(pdf, output)
+
+        # Only the blank page is OCRed
+        self.assertEqual(ocr_pages, [1])
+        self.assertEqual(data[-1], (text, 1, 0.9))
+        self.assertEqual(chunks[-1]["page"], 1)
+        self.assertEqual(chunks[-1]["rects"], [list(block[:4])])
+        self.assertEqual([page for page, _, _ in highlights(output.getvalue())], [0, 0, 1])
+
+        # Without OCR the scanned page is left alone
+        with mock.patch.object(pdf_engine, "GetClass", fake_class), \
+                mock.patch.object(pdf_engine, "ocr_page_layout") as ocr:
+            data, _, _ = await HighlightPDF(pdf, io.BytesIO(), use_ocr=False)
+        ocr.assert_not_called()
+        self.assertEqual(len(data), 2)
+
+    async def test_incremental_save(self):
+        """An incremental save appends the annotations to the source file."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "doc.pdf")
+            source = make_pdf(pages=1)
+            with open(path, "wb") as f:
+                f.write(source)
+
+            with self.assertRaises(ValueError):
+                await HighlightPDF(path, os.path.join(tmp, "other.pdf"), incremental=True)
+            with self.assertRaises(ValueError):
+                await HighlightPDF(source, path, incremental=True)
+
+            with mock.patch.object(pdf_engine, "GetClass", fake_class):
+                data, _, _ = await HighlightPDF(path, path, incremental=True)
+            with open(path, "rb") as f:
+                saved = f.read()
+
+        self.assertEqual(len(data), 2)
+        # The original bytes are kept as they were, the update follows them
+        self.assertTrue(saved.startswith(source))
+        self.assertGreater(len(saved), len(source))
+        self.assertEqual([page for page, _, _ in highlights(saved)], [0, 0])
+
+    async def test_event_loop_stays_responsive(self):
+        """Extraction and OCR run off the event loop, other coroutines keep running."""
+        real_layout = pdf_engine.get_page_layout
+
+        def slow_layout(page, use_ocr=True, dpi=300):
+            time.sleep(0.3)
+            return real_layout(page, use_ocr=use_ocr, dpi=dpi)
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.02)
+                ticks += 1
+
+        with mock.patch.object(pdf_engine, "GetClass", fake_class), \
+                mock.patch.object(pdf_engine, "get_page_layout", slow_layout):
+            task = asyncio.create_task(ticker())
+            await HighlightPDF(make_pdf(pages=2), io.BytesIO())
+            task.cancel()
+        # About 30 ticks in 0.6 s when the loop is free, none when it is blocked
+        self.assertGreater(ticks, 10)
+
+    async def test_fitz_thread(self):
+        """Concurrent calls do all PyMuPDF work on one thread and close the document when classification fails."""
+        threads = set()
+        real_layout = pdf_engine.get_page_layout
+
+        def recording_layout(page, use_ocr=True, dpi=300):
+            threads.add(threading.current_thread().name)
+            return real_layout(page, use_ocr=use_ocr, dpi=dpi)
+
+        with mock.patch.object(pdf_engine, "GetClass", fake_class), \
+                mock.patch.object(pdf_engine, "get_page_layout", recording_layout):
+            await asyncio.gather(*[HighlightPDF(make_pdf(pages=2), io.BytesIO()) for _ in range(3)])
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads.pop().startswith("fitz"))
+
+        async def failing_class(text: str):
+            raise ConnectionError("model server down")
+
+        opened = []
+        real_open = pdf_engine._open_document
+
+        def recording_open(pdf):
+            opened.append(real_open(pdf))
+            return opened[-1]
+
+        with mock.patch.object(pdf_engine, "GetClass", failing_class), \
+                mock.patch.object(pdf_engine, "_open_document", recording_open):
+            with self.assertRaises(ConnectionError):
+                await HighlightPDF(make_pdf(), io.BytesIO())
+        self.assertTrue(opened[0].is_closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import unittest
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Tesseract.OCR import tesseract_data_to_layout
+from Utils.Group import GroupPara
+
+# Two blocks, the first one spans two lines, plus tesseract's empty rows
+DATA = {
+    "text":      ["",  "Hello", "world", "again", "",  "Second"],
+    "conf":      [-1,  95,      90,      88,      -1,  91],
+    "block_num": [1,   1,       1,       1,       2,   2],
+    "par_num":   [0,   1,       1,       1,       0,   1],
+    "line_num":  [0,   1,       1,       2,       0,   1],
+    "left":      [0,   10,      70,      10,      0,   10],
+    "top":       [0,   10,      10,      40,      0,   100],
+    "width":     [0,   50,      50,      50,      0,   60],
+    "height":    [0,   20,      20,      20,      0,   20],
+}
+
+class TestOCRLayout(unittest.TestCase):
+    def test_word_tuples(self):
+        """Check words match PyMuPDF's (x0, y0, x1, y1, word, block, line, word) shape."""
+        _, words = tesseract_data_to_layout(DATA, scale=0.5)
+        self.assertEqual(len(words), 4)
+        self.assertEqual(words[0], (5.0, 5.0, 30.0, 15.0, "Hello", 0, 0, 0))
+        self.assertEqual(words[1][4:], ("world", 0, 0, 1))
+        self.assertEqual(words[2][4:], ("again", 0, 1, 0))
+        self.assertEqual(words[3][4:], ("Second", 1, 0, 0))
+
+    def test_block_tuples(self):
+        """Check blocks are the union of their words and carry their text."""
+        blocks, _ = tesseract_data_to_layout(DATA)
+        self.assertEqual(blocks[0], (10, 10, 120, 60, "Hello world\nagain\n", 0, 0))
+        self.assertEqual(blocks[1][4:], ("Second\n", 1, 0))
+
+    def test_blocks_group_like_native(self):
+        """Check OCR blocks can be fed to GroupPara unchanged."""
+        blocks, _ = tesseract_data_to_layout(DATA)
+        grouped, paras = GroupPara(blocks, minCount=0)
+        self.assertEqual(len(grouped), 2)
+        self.assertEqual(paras[1], "Second\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
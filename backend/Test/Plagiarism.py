@@ -0,0 +1,461 @@
+import dataclasses
+import hashlib
+import os
+import pickle
+import random
+import shutil
+import sqlite3
+import tempfile
+import types
+import unittest
+import sys
+from pathlib import Path
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import numpy as np
+import Utils.Plagirarism as plagiarism
+from Utils.Plagirarism import (HIGHLIGHT_CLOSE, HIGHLIGHT_OPEN, DocRepresentation, DocText, LSHIndex, RepresentationStore, ShingleIndex, fingerprints_by_position, winnow, PlagiarismVisualizer, estimate_jaccard, jaccard_similarity,
+                               highlighted_paragraphs, matching_intervals, minhash_signature, shingles_from_tokens)
+
+random.seed(7)
+VOCAB = [f"word{i}" for i in range(3000)]
+
+
+def random_tokens(n):
+    return [random.choice(VOCAB) for _ in range(n)]
+
+
+def write_pdf(path, tokens, per_page=400):
+    doc = fitz.open()
+    for i in range(0, len(tokens), per_page):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), " ".join(tokens[i:i + per_page]), fontsize=6)
+    doc.save(path)
+    doc.close()
+
+
+def legacy_doc_id(path):
+    """The path, size and mtime key documents were cached under before content hashes."""
+    st = os.stat(path)
+    return hashlib.sha1(f"{path}{st.st_size}{int(st.st_mtime)}".encode("utf-8")).hexdigest()
+
+
+def write_legacy_cache(path, reps):
+    """Pickles {doc_id: fields} the way the former dataclass cache stored them."""
+    module = types.ModuleType("legacy_plagiarism")
+    legacy_class = dataclasses.make_dataclass(
+        "DocRepresentation", ["doc_id", *next(iter(reps.values()))], namespace={"__module__": module.__name__})
+    module.DocRepresentation = legacy_class
+    sys.modules[module.__name__] = module
+    try:
+        with open(path, "wb") as f:
+            pickle.dump({doc_id: legacy_class(doc_id=doc_id, **fields) for doc_id, fields in reps.items()}, f)
+    finally:
+        del sys.modules[module.__name__]
+
+
+class TestFingerprints(unittest.TestCase):
+    def test_fingerprints(self):
+        """Check fingerprints are sorted, distinct and depend on token order."""
+        tokens = random_tokens(500)
+        shingles = shingles_from_tokens(tokens + tokens, 5)
+        self.assertEqual(shingles.dtype, np.uint64)
+        self.assertTrue(np.all(np.diff(shingles.astype(np.float64)) > 0))
+        self.assertEqual(len(np.intersect1d(shingles, shingles_from_tokens(tokens, 5))),
+                         len(shingles_from_tokens(tokens, 5)))
+        positions = fingerprints_by_position(["aa", "bb", "cc", "aa", "bb", "cc"], 3)
+        self.assertEqual(positions[0], positions[3])
+        self.assertNotEqual(positions[0], fingerprints_by_position(["bb", "aa", "cc"], 3)[0])
+
+    def test_jaccard(self):
+        """Check the vectorised Jaccard matches the set computation."""
+        a, b = random_tokens(800), random_tokens(800)
+        b[:400] = a[:400]
+        fa, fb = shingles_from_tokens(a, 5), shingles_from_tokens(b, 5)
+        sa, sb = set(fa.tolist()), set(fb.tolist())
+        self.assertAlmostEqual(jaccard_similarity(fa, fb), len(sa & sb) / len(sa | sb))
+
+
+    def test_matching_intervals(self):
+        """Overlapping and touching shingles merge, gaps split intervals."""
+        positions = np.array([0, 2, 5, 9, 20])
+        fps = np.array([10, 11, 12, 13, 14], dtype=np.uint64)
+        common = np.array([10, 11, 12, 14], dtype=np.uint64)
+        self.assertEqual(matching_intervals(fps, positions, common, 3), [(0, 8), (20, 23)])
+        self.assertEqual(matching_intervals(fps, positions, common[:0], 3), [])
+
+
+    def test_highlighted_paragraphs(self):
+        """Paragraphs break every max_chars, highlights are closed in each paragraph."""
+        tokens = ["aaaa"] * 10 + ["b<c"]
+        paragraphs = highlighted_paragraphs(tokens, [(2, 7), (9, 11)], max_chars=20)
+        self.assertEqual(len(paragraphs), 3)
+        for paragraph in paragraphs:
+            self.assertEqual(paragraph.count(HIGHLIGHT_OPEN), paragraph.count(HIGHLIGHT_CLOSE))
+        self.assertEqual(paragraphs[0], f"aaaa aaaa {HIGHLIGHT_OPEN}aaaa aaaa{HIGHLIGHT_CLOSE}")
+        self.assertEqual(paragraphs[2], f"aaaa {HIGHLIGHT_OPEN}aaaa b&lt;c{HIGHLIGHT_CLOSE}")
+        self.assertEqual(highlighted_paragraphs([], []), [])
+
+
+class TestWinnowing(unittest.TestCase):
+    def test_guaranteed_match(self):
+        """Check a shared run of window + k - 1 tokens always keeps a common fingerprint."""
+        k, window = 5, 4
+        for _ in range(20):
+            a, b = random_tokens(600), random_tokens(600)
+            i, j = random.randrange(590), random.randrange(590)
+            b[j:j + window + k - 1] = a[i:i + window + k - 1]
+            fa, pa = winnow(fingerprints_by_position(a, k), window)
+            fb, _ = winnow(fingerprints_by_position(b, k), window)
+            common = np.intersect1d(fa, fb)
+            self.assertGreater(len(common), 0)
+            # Positions point at the shingle the fingerprint was taken from
+            self.assertTrue(np.all(fingerprints_by_position(a, k)[pa] == fa))
+
+    def test_density(self):
+        """Check winnowing keeps about 2 / (window + 1) of the shingles."""
+        fps = fingerprints_by_position(random_tokens(5000), 5)
+        kept, _ = winnow(fps, 4)
+        self.assertAlmostEqual(len(kept) / len(fps), 0.4, delta=0.05)
+
+
+class TestMinHash(unittest.TestCase):
+    def test_estimate_is_close(self):
+        """Check the signature agreement tracks the exact Jaccard similarity."""
+        base = random_tokens(3000)
+        for keep in (3000, 2000, 1000):
+            other = base[:keep] + random_tokens(3000 - keep)
+            a, b = shingles_from_tokens(base, 5), shingles_from_tokens(other, 5)
+            estimate = estimate_jaccard(minhash_signature(a, 256), minhash_signature(b, 256))
+            self.assertAlmostEqual(estimate, jaccard_similarity(a, b), delta=0.1)
+
+    def test_lsh_candidates(self):
+        """Check near duplicates share a band and unrelated documents do not."""
+        lsh = LSHIndex(bands=32, rows=4)
+        base = random_tokens(2000)
+        docs = {
+            "copy": base[:1800] + random_tokens(200),
+            "other": random_tokens(2000),
+        }
+        for doc_id, tokens in docs.items():
+            lsh.add(doc_id, minhash_signature(shingles_from_tokens(tokens, 5), lsh.num_perm))
+        query = minhash_signature(shingles_from_tokens(base, 5), lsh.num_perm)
+        self.assertEqual(lsh.query(query), {"copy"})
+
+
+class TestPlagiarismVisualizer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index_db = plagiarism.INDEX_DB
+        plagiarism.INDEX_DB = Path(self.tmp.name) / "index.sqlite3"
+        # b copies the first 1000 tokens of a, c is unrelated
+        self.base = random_tokens(1200)
+        self.paths, self.tokens = {}, {}
+        for name, tokens in [("a", self.base), ("b", self.base[:1000] + random_tokens(200)),
+                             ("c", random_tokens(1200))]:
+            self.write(name, tokens)
+
+    def tearDown(self):
+        plagiarism.INDEX_DB = self.index_db
+        self.tmp.cleanup()
+
+    def write(self, name, tokens):
+        """Writes tokens to <name>.pdf and returns its path."""
+        self.tokens[name] = tokens
+        self.paths[name] = os.path.join(self.tmp.name, f"{name}.pdf")
+        write_pdf(self.paths[name], tokens)
+        return self.paths[name]
+
+    def process(self, visualizer, names="abc"):
+        """Indexes the named PDFs, returning {name: doc_id}."""
+        return {name: visualizer.process_document(self.paths[name]) for name in names}
+
+    def test_find_similar(self):
+        """Check the closest indexed document is found and scored exactly."""
+        visualizer = PlagiarismVisualizer()
+        ids = self.process(visualizer)
+        matches = visualizer.find_similar(ids["a"])
+        self.assertEqual([m[0] for m in matches], [ids["b"]])
+        expected = jaccard_similarity(visualizer.reps[ids["a"]].shingles, visualizer.reps[ids["b"]].shingles)
+        self.assertAlmostEqual(matches[0][1], expected)
+
+    def test_stored_text(self):
+        """Representations are slotted hot records, the tokens are read on demand."""
+        visualizer = PlagiarismVisualizer()
+        ids = self.process(visualizer, "a")
+        self.assertFalse(hasattr(visualizer.reps[ids["a"]], "__dict__"))
+        self.assertEqual(visualizer.reps.text(ids["a"]).tokens, self.base)
+
+    def test_find_matching_intervals(self):
+        """Check the copied token ranges are found in both documents."""
+        visualizer = PlagiarismVisualizer()
+        ids = self.process(visualizer)
+        self.assertEqual(visualizer.find_matching_intervals(ids["a"], ids["b"]), ([(0, 1000)], [(0, 1000)]))
+        self.assertEqual(visualizer.find_matching_intervals(ids["a"], ids["c"]), ([], []))
+
+    def test_annotate(self):
+        """The original PDF gets the copied words highlighted in place, the report counts them."""
+        visualizer = PlagiarismVisualizer()
+        ids = self.process(visualizer)
+        annotated = os.path.join(self.tmp.name, "annotated.pdf")
+        self.assertEqual(visualizer.annotate_source_pdf(ids["a"], ids["b"], annotated), 1000)
+        with fitz.open(annotated) as doc:
+            self.assertEqual([len(list(page.annots())) for page in doc], [1, 1, 1])
+        self.assertEqual(visualizer.annotate_source_pdf(ids["a"], ids["c"], annotated), 0)
+
+        report = os.path.join(self.tmp.name, "report.pdf")
+        visualizer.create_highlighted_pdf(ids["a"], [(0, 1000)], self.paths["b"], 0.8, report)
+        with fitz.open(report) as doc:
+            self.assertIn("Matching Tokens: 1000 / 1200", doc[0].get_text())
+
+    def test_reload(self):
+        """The next start reads the stored buckets and postings on demand."""
+        visualizer = PlagiarismVisualizer()
+        ids = self.process(visualizer)
+        reloaded = PlagiarismVisualizer()
+        self.assertEqual(len(reloaded.reps), 3)
+        self.assertEqual(reloaded.lsh.buckets, [])
+        self.assertEqual(reloaded.find_similar(ids["b"], top_k=1)[0][0], ids["a"])
+        np.testing.assert_array_equal(reloaded.reps[ids["c"]].shingles, visualizer.reps[ids["c"]].shingles)
+
+    def test_shingle_index(self):
+        """The mmap'd index answers like the stored postings, before and after a rebuild."""
+        visualizer = PlagiarismVisualizer()
+        ids = self.process(visualizer)
+        index = visualizer.shingle_index
+        sample = visualizer.reps[ids["a"]].shingles[:50]
+        expected = [{doc_id for doc_id in ids.values() if fp in visualizer.reps[doc_id].shingles} for fp in sample]
+        self.assertEqual([index.get(int(fp)) for fp in sample], expected)
+        index.rebuild()
+        self.assertEqual((index.max_ordinal, len(index.delta_fps)), (3, 0))
+        self.assertEqual([index.get(int(fp)) for fp in sample], expected)
+        self.assertEqual(index.get(12345), ())
+
+        # Every fingerprint of a document points back at it
+        ordinal_c = visualizer.reps.ordinals([ids["c"]])[ids["c"]]
+        shingles_c = visualizer.reps[ids["c"]].shingles
+        self.assertEqual(np.bincount(index.lookup(shingles_c))[ordinal_c], len(shingles_c))
+        reopened = ShingleIndex(visualizer.reps)
+        np.testing.assert_array_equal(reopened.fps, index.fps)
+
+    def test_lsh_settings(self):
+        """Other LSH settings recompute and store the signatures."""
+        ids = self.process(PlagiarismVisualizer(), "a")
+        rebanded = PlagiarismVisualizer(bands=16, rows=2)
+        self.assertEqual(len(rebanded.reps[ids["a"]].signature), 32)
+
+    def test_winnowing(self):
+        """Winnowing keeps fewer fingerprints and still finds the copy."""
+        shingling = PlagiarismVisualizer()
+        winnowing = PlagiarismVisualizer(mode="winnowing")
+        ids = self.process(winnowing)
+        self.assertEqual(self.process(shingling, "a"), {"a": ids["a"]})
+        self.assertLess(len(winnowing.reps[ids["a"]].shingles), len(shingling.reps[ids["a"]].shingles))
+        self.assertEqual(winnowing.find_similar(ids["a"], top_k=1)[0][0], ids["b"])
+        intervals_a, _ = winnowing.find_matching_intervals(ids["a"], ids["b"])
+        self.assertTrue(intervals_a and intervals_a[-1][1] <= 1000)
+
+    def test_legacy_cache(self):
+        """Check a pickle cache of earlier versions is imported into the store once."""
+        base, paths, reps = self.base, self.paths, {}
+        for name in "cd":
+            self.write(name, random_tokens(300))
+        for name in "abcd":
+            tokens = self.tokens[name]
+            text = " ".join(tokens)
+            reps[name] = dict(path=paths[name], shingles=shingles_from_tokens(tokens, 5), token_count=len(tokens),
+                              raw_text_excerpt=text[:400], full_text=text, tokens=tokens)
+        # Cached before the text was kept, it is fingerprinted again when next processed
+        reps["c"].update(full_text="", tokens=None)
+        newest = plagiarism.INDEX_DB.with_name("doc_reps_v2.pkl")
+        write_legacy_cache(newest, {legacy_doc_id(paths[name]): dict(reps[name], signature=None) for name in "abc"})
+        # The first version's cache, with a document of its own and one also in the newer cache
+        baseline = plagiarism.INDEX_DB.with_name("doc_reps.pkl")
+        write_legacy_cache(baseline, {legacy_doc_id(paths[name]): reps[name] for name in "ad"})
+
+        visualizer = PlagiarismVisualizer()
+        for legacy in (newest, baseline):
+            self.assertFalse(legacy.exists())
+            self.assertTrue(legacy.with_name(legacy.name + ".imported").exists())
+        self.assertEqual(len(visualizer.reps), 3)
+        id_a, id_b, id_c, id_d = (PlagiarismVisualizer.document_id(None, paths[name]) for name in "abcd")
+        self.assertEqual(list(visualizer.reps), [id_a, id_b, id_d])
+        np.testing.assert_array_equal(visualizer.reps[id_a].shingles, shingles_from_tokens(base, 5))
+        self.assertEqual(visualizer.reps.text(id_a).tokens, base)
+        self.assertEqual([m[0] for m in visualizer.find_similar(id_a)], [id_b])
+        self.assertEqual(visualizer.find_matching_intervals(id_a, id_b), ([(0, 1000)], [(0, 1000)]))
+
+        # Imported documents are not processed again, the others are
+        with mock.patch.object(plagiarism, "extract_text_and_ocr_from_pdf",
+                               side_effect=plagiarism.extract_text_and_ocr_from_pdf) as extract:
+            self.assertEqual([visualizer.process_document(paths[name]) for name in "abcd"], [id_a, id_b, id_c, id_d])
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(len(PlagiarismVisualizer().reps), 4)
+
+    def test_shared_store(self):
+        """Check documents indexed through one store connection are found through another, without a restart."""
+        paths = self.paths
+        # Two workers of the API, each with its own connection and index
+        first, second = PlagiarismVisualizer(), PlagiarismVisualizer()
+        id_a = first.process_document(paths["a"])
+        id_b = second.process_document(paths["b"])
+        self.assertEqual([m[0] for m in first.find_similar(id_a)], [id_b])
+        self.assertEqual([m["doc_id"] for m in first.query(id_a)], [id_b])
+        self.assertEqual([m["doc_id"] for m in second.query(id_b)], [id_a])
+
+        # A snapshot rebuilt by one is picked up by the other
+        first.shingle_index.rebuild()
+        id_c = first.process_document(paths["c"])
+        ordinals = second.reps.ordinals([id_a, id_b, id_c])
+        sizes = second.shingle_index.doc_sizes(np.array([ordinals[i] for i in (id_a, id_b, id_c)]))
+        self.assertEqual((second.shingle_index.max_ordinal, len(second.shingle_index.delta_fps)),
+                         (2, len(second.reps[id_c].shingles)))
+        self.assertEqual(sizes.tolist(), [len(second.reps[i].shingles) for i in (id_a, id_b, id_c)])
+        self.assertEqual(second.query(id_c), [])
+
+        # Too many documents past the snapshot rebuild it on the next lookup
+        second.shingle_index.rebuild_after = 0
+        second.query(id_a)
+        self.assertEqual(first.shingle_index.get(int(first.reps[id_c].shingles[0])), {id_c})
+        self.assertEqual((first.shingle_index.max_ordinal, len(first.shingle_index.delta_fps)), (3, 0))
+
+    def test_query(self):
+        """Check corpus queries and project pairs match the exact set scores."""
+        paths = self.paths
+        self.write("d", self.base[:500])
+        visualizer = PlagiarismVisualizer()
+        ids = self.process(visualizer, "abcd")
+        shingles = {name: visualizer.reps[doc_id].shingles for name, doc_id in ids.items()}
+
+        matches = visualizer.query(ids["a"])
+        self.assertEqual([m["doc_id"] for m in matches], [ids["b"], ids["d"]])
+        self.assertEqual(matches[0]["path"], paths["b"])
+        self.assertAlmostEqual(matches[0]["similarity"], jaccard_similarity(shingles["a"], shingles["b"]))
+
+        # d is wholly contained in a, though far from similar
+        best = visualizer.query(ids["d"], top_k=1, order_by="containment")[0]
+        self.assertEqual(best["doc_id"], ids["a"])
+        self.assertEqual(best["containment"], 1.0)
+        self.assertEqual(visualizer.query_path(paths["c"]), [])
+
+        pairs = visualizer.project_pairs(list(ids.values()))
+        found = {frozenset((p["a"], p["b"])): p for p in pairs}
+        self.assertEqual(set(found), {frozenset((ids[x], ids[y])) for x, y in ["ab", "ad", "bd"]})
+        self.assertEqual(pairs[0]["similarity"], max(p["similarity"] for p in pairs))
+        for x, y in ["ab", "ad", "bd"]:
+            pair = found[frozenset((ids[x], ids[y]))]
+            self.assertAlmostEqual(pair["similarity"], jaccard_similarity(shingles[x], shingles[y]))
+        self.assertEqual(len(visualizer.project_pairs(list(ids.values()), min_similarity=0.5)), 1)
+
+    def test_identical_copies(self):
+        """An identical file is indexed once, under its content hash, and never matches itself."""
+        paths = self.paths
+        copy = os.path.join(self.tmp.name, "copy", "a.pdf")
+        os.makedirs(os.path.dirname(copy))
+        shutil.copy(paths["a"], copy)
+        with open(paths["a"], "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        visualizer = PlagiarismVisualizer()
+        ids = visualizer.process_documents([paths["a"], paths["b"], copy], workers=1)
+        self.assertEqual((ids[0], ids[2]), (digest, digest))
+        self.assertEqual(len(visualizer.reps), 2)
+        self.assertEqual(visualizer.process_document(copy, content_hash=digest), digest)
+        self.assertEqual([m["doc_id"] for m in visualizer.query_path(copy)], [ids[1]])
+        self.assertEqual([(p["a"], p["b"]) for p in visualizer.project_pairs(ids)], [(ids[0], ids[1])])
+
+    def test_text_layer(self):
+        """The text layer extracted at ingest is used instead of reading it from the PDF again."""
+        path = self.write("layer", random_tokens(800))
+        text_path = os.path.join(self.tmp.name, "text-a.txt")
+        stored = [random_tokens(400), random_tokens(400)]
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write("\f".join(" ".join(tokens) for tokens in stored))
+
+        visualizer = PlagiarismVisualizer()
+        doc_id = visualizer.process_document(path, text_path=text_path)
+        self.assertEqual(visualizer.reps.text(doc_id).tokens, stored[0] + stored[1])
+
+        # Without the file the PDF is read
+        os.remove(text_path)
+        self.assertNotEqual(plagiarism.extract_text_and_ocr_from_pdf(path, text_path).split(), stored[0] + stored[1])
+
+    def test_remove_documents(self):
+        """Removed documents leave no rows behind and are no longer found, even through an older snapshot."""
+        self.write("d", self.base[:600])
+        visualizer = PlagiarismVisualizer()
+        ids = self.process(visualizer, "abd")
+        visualizer.shingle_index.rebuild()
+        ordinal_b = visualizer.reps.ordinals([ids["b"]])[ids["b"]]
+        self.assertIn(ids["b"], [m[0] for m in visualizer.find_similar(ids["a"])])
+
+        # Through another connection, as DeleteProject does
+        self.assertEqual(plagiarism.remove_documents([ids["b"], "unknown"]), 1)
+        self.assertNotIn(ids["b"], visualizer.reps)
+        conn = sqlite3.connect(str(plagiarism.INDEX_DB))
+        for table in ("docs", "texts", "lsh_bands"):
+            count = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE ordinal = ?", (ordinal_b,)).fetchone()[0]
+            self.assertEqual(count, 0, table)
+        conn.close()
+        self.assertEqual([m["doc_id"] for m in visualizer.query(ids["a"])], [ids["d"]])
+        self.assertNotIn(ids["b"], [m[0] for m in visualizer.find_similar(ids["a"])])
+
+        # Indexed again when it comes back
+        self.assertEqual(visualizer.process_document(self.paths["b"]), ids["b"])
+        self.assertEqual([m["doc_id"] for m in visualizer.query(ids["a"])], [ids["b"], ids["d"]])
+        self.assertEqual(visualizer.remove_documents([ids["b"], ids["d"]]), 2)
+        self.assertEqual(visualizer.query(ids["a"]), [])
+        visualizer.shingle_index.rebuild()
+        self.assertEqual(visualizer.query(ids["a"]), [])
+
+    def test_process_documents(self):
+        """Check batch ingest in a process pool matches one-by-one ingest."""
+        paths = [self.write(f"batch{i}", random_tokens(600)) for i in range(3)]
+        broken = os.path.join(self.tmp.name, "broken.pdf")
+        with open(broken, "wb") as f:
+            f.write(b"not a pdf")
+
+        progress = []
+        visualizer = PlagiarismVisualizer()
+        ids = visualizer.process_documents(paths + [broken, paths[0]], workers=2,
+                                           progress_callback=lambda pct, status: progress.append((pct, status)))
+        self.assertIsNone(ids[3])
+        self.assertEqual(ids[4], ids[0])
+        self.assertEqual([visualizer.reps.ordinals([i])[i] for i in ids[:3]], [1, 2, 3])
+        self.assertEqual(progress[-1], (100, "indexed"))
+        self.assertEqual([p for p, _ in progress[:-1]], [25.0, 50.0, 75.0, 100.0])
+
+        # A separate store, filled one document at a time
+        plagiarism.INDEX_DB = Path(self.tmp.name) / "single.sqlite3"
+        single = PlagiarismVisualizer()
+        self.assertEqual([single.process_document(path) for path in paths], ids[:3])
+        for doc_id in ids[:3]:
+            np.testing.assert_array_equal(single.reps[doc_id].shingles, visualizer.reps[doc_id].shingles)
+            np.testing.assert_array_equal(single.reps[doc_id].signature, visualizer.reps[doc_id].signature)
+        self.assertEqual(visualizer.query(ids[0], top_k=1), [])
+
+    def test_split_texts(self):
+        """Stores written with the texts in the docs table are migrated on open."""
+        conn = sqlite3.connect(str(plagiarism.INDEX_DB))
+        conn.execute("CREATE TABLE docs (ordinal INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT UNIQUE NOT NULL, "
+                     "path TEXT NOT NULL, token_count INTEGER NOT NULL, excerpt TEXT NOT NULL, "
+                     "shingles BLOB NOT NULL, signature BLOB, positions BLOB, position_fps BLOB, "
+                     "full_text TEXT NOT NULL, tokens TEXT NOT NULL)")
+        shingles = shingles_from_tokens(["one", "two", "three"], 2)
+        conn.execute("INSERT INTO docs (doc_id, path, token_count, excerpt, shingles, full_text, tokens) "
+                     "VALUES ('old', 'old.pdf', 3, 'One two', ?, 'One two three', 'one two three')",
+                     (shingles.tobytes(),))
+        conn.commit()
+        conn.close()
+
+        store = RepresentationStore(plagiarism.INDEX_DB)
+        self.assertEqual(store.text("old"), ("One two three", ["one", "two", "three"]))
+        np.testing.assert_array_equal(store["old"].shingles, shingles)
+        self.assertEqual(store.add(DocRepresentation("new", "new.pdf", shingles, 3, ""), DocText("", [])), 2)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,262 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+import sys
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from bson import ObjectId
+from fastapi import HTTPException, UploadFile
+
+import Routes.ProjectManager as project_manager
+from Database.Storage import ReconcileBlobRefs
+import Utils.Blob as blob
+import Utils.Result as results
+from Routes.ProjectManager import DeleteProject, NewProject
+from Test.AsyncMongo import async_database
+from Utils.File import move_tree, remove_tree
+from Utils.Ingest import preprocess_document
+
+USER = {"id": "user-1"}
+
+
+def make_zip(members: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for i in range(members):
+            zf.writestr(f"docs/file{i}.txt", f"content {i}\n")
+    return buffer.getvalue()
+
+
+class TestNewProject(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        collection = async_database()
+        self.users, self.documents = collection("users"), collection("documents")
+        self.projects, self.blobs = collection("projects"), collection("blobs")
+        await self.users.insert_one({"_id": USER["id"], "storage": 0, "projects": []})
+        self.patches = [mock.patch.object(project_manager, "UPLOAD_DIR", self.tmp.name),
+                        mock.patch.object(blob, "BLOB_DIR", os.path.join(self.tmp.name, ".blobs")),
+                        mock.patch.object(results, "RESULT_DIR", self.tmp.name)]
+        for patch in self.patches:
+            patch.start()
+        self.uploads = os.path.join(self.tmp.name, USER["id"], "uploads")
+
+    async def asyncTearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+    async def upload(self, data: bytes, name: str = "thesis"):
+        return await NewProject(UploadFile(io.BytesIO(data), filename="project.zip"), name, USER,
+                                self.users, self.documents, self.projects, self.blobs)
+
+    async def test_upload(self):
+        """Members end up in the project directory and the records point at them."""
+        project_id = json.loads((await self.upload(make_zip(20))).body)["project_id"]
+        self.assertEqual(os.listdir(self.uploads), [project_id])
+        documents = await self.documents.find({}).to_list(length=None)
+        self.assertEqual(len(documents), 20)
+        for document in documents:
+            self.assertTrue(document["document_path"].startswith(os.path.join(self.uploads, project_id) + os.sep))
+            with open(document["document_path"]) as f:
+                self.assertTrue(f.read().startswith("content "))
+
+        # A second project with the same name gets its own directory
+        second_id = json.loads((await self.upload(make_zip(1))).body)["project_id"]
+        self.assertEqual(sorted(os.listdir(self.uploads)), sorted([project_id, second_id]))
+        self.assertEqual(len(os.listdir(os.path.join(self.uploads, project_id, "docs"))), 20)
+
+    async def test_delete_same_name(self):
+        """Deleting one of two projects with the same name keeps the other one's files."""
+        first = json.loads((await self.upload(make_zip(3))).body)["project_id"]
+        second = json.loads((await self.upload(make_zip(3))).body)["project_id"]
+        await DeleteProject(first, USER, self.users, self.documents, self.projects, self.blobs)
+
+        self.assertEqual(os.listdir(self.uploads), [second])
+        documents = await self.documents.find({}).to_list(length=None)
+        self.assertEqual(len(documents), 3)
+        for document in documents:
+            self.assertTrue(os.path.exists(document["document_path"]))
+
+    async def test_delete_removes_text_layer(self):
+        """The text layer and plagiarism entry of a PDF go with the last project that has the PDF."""
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), "A page with a text layer")
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            zf.writestr("docs/paper.pdf", doc.tobytes())
+        doc.close()
+        first = json.loads((await self.upload(buffer.getvalue())).body)["project_id"]
+        second = json.loads((await self.upload(buffer.getvalue())).body)["project_id"]
+        text_path = (await self.documents.find_one({}))["text_path"]
+        self.assertTrue(os.path.exists(text_path))
+
+        content_hash = (await self.documents.find_one({}))["content_hash"]
+
+        with mock.patch.object(project_manager, "remove_documents") as remove_documents:
+            await DeleteProject(first, USER, self.users, self.documents, self.projects, self.blobs)
+            self.assertTrue(os.path.exists(text_path))
+            remove_documents.assert_not_called()
+            await DeleteProject(second, USER, self.users, self.documents, self.projects, self.blobs)
+        self.assertFalse(os.path.exists(text_path))
+        # The plagiarism index drops the content too
+        remove_documents.assert_called_once_with([content_hash])
+
+    async def test_concurrent_delete(self):
+        """Deleting the same project twice at once frees its storage and blob references once."""
+        await self.upload(make_zip(1))
+        project_id = json.loads((await self.upload(make_zip(3))).body)["project_id"]
+        storage = (await self.users.find_one({"_id": USER["id"]}))["storage"]
+
+        results = await asyncio.gather(*[
+            DeleteProject(project_id, USER, self.users, self.documents, self.projects, self.blobs)
+            for _ in range(2)], return_exceptions=True)
+        statuses = sorted(getattr(result, "status_code", None) for result in results)
+        self.assertEqual(statuses, [200, 404])
+        self.assertEqual((await self.users.find_one({"_id": USER["id"]}))["storage"],
+                         storage - 3 * len("content 0\n"))
+        # file0 is still used by the first project
+        blobs = await self.blobs.find({}).to_list(length=None)
+        self.assertEqual([blob["refs"] for blob in blobs], [1])
+
+    async def test_reconcile_missing_blob(self):
+        """Blob records lost for documents that still exist are recreated."""
+        await self.upload(make_zip(2))
+        blob = await self.blobs.find_one({})
+        await self.blobs.delete_one({"_id": blob["_id"]})
+
+        self.assertEqual(await ReconcileBlobRefs(self.documents, self.blobs), {blob["_id"]: 1})
+        restored = await self.blobs.find_one({"_id": blob["_id"]})
+        self.assertEqual((restored["refs"], restored["size_bytes"]), (1, blob["size_bytes"]))
+        self.assertEqual(await ReconcileBlobRefs(self.documents, self.blobs), {})
+
+    async def test_delete_shared_directory(self):
+        """A project sharing its directory with another one only takes its own files."""
+        first = json.loads((await self.upload(make_zip(2))).body)["project_id"]
+        second = json.loads((await self.upload(make_zip(2))).body)["project_id"]
+        # Move both into one directory, the way projects were stored by name
+        shared = os.path.join(self.uploads, "thesis")
+        for project_id, prefix in [(first, "a"), (second, "b")]:
+            project = await self.projects.find_one({"_id": ObjectId(project_id)})
+            await self.projects.update_one({"_id": project["_id"]}, {"$set": {"path": shared}})
+            async for document in self.documents.find({"_id": {"$in": [ObjectId(i) for i in project["documents"]]}}):
+                path = os.path.join(shared, f"{prefix}-{os.path.basename(document['document_path'])}")
+                os.makedirs(shared, exist_ok=True)
+                os.replace(document["document_path"], path)
+                await self.documents.update_one({"_id": document["_id"]}, {"$set": {"document_path": path}})
+            remove_tree(os.path.join(self.uploads, project_id))
+
+        await DeleteProject(first, USER, self.users, self.documents, self.projects, self.blobs)
+        self.assertEqual(sorted(os.listdir(shared)), ["b-file0.txt", "b-file1.txt"])
+
+        await DeleteProject(second, USER, self.users, self.documents, self.projects, self.blobs)
+        self.assertEqual(os.listdir(self.uploads), [])
+
+    async def test_failed_member(self):
+        """A member failing half-way leaves nothing in the user's storage."""
+        seen = []
+
+        def failing(record):
+            seen.append(record["member"])
+            if len(seen) == 10:
+                raise OSError("disk full")
+            return preprocess_document(record)
+
+        with mock.patch.object(project_manager, "preprocess_document", failing):
+            with self.assertRaises(HTTPException) as raised:
+                await self.upload(make_zip(20))
+        self.assertEqual(raised.exception.status_code, 500)
+        self.assertEqual(os.listdir(self.uploads), [])
+        self.assertEqual(await self.documents.count_documents({}), 0)
+        self.assertEqual((await self.users.find_one({"_id": USER["id"]}))["projects"], [])
+
+    async def test_failed_registration(self):
+        """A project that cannot be registered is undone with its documents, references and files."""
+        await self.upload(make_zip(1))
+        before = await self.users.find_one({"_id": USER["id"]})
+
+        async def failing(*args, **kwargs):
+            raise OSError("connection reset")
+
+        with mock.patch.object(self.projects, "insert_one", failing, create=True):
+            with self.assertRaises(HTTPException) as raised:
+                await self.upload(make_zip(3))
+        self.assertEqual(raised.exception.status_code, 500)
+        self.assertEqual(await self.users.find_one({"_id": USER["id"]}), before)
+        self.assertEqual(await self.documents.count_documents({}), 1)
+        self.assertEqual(await self.projects.count_documents({}), 1)
+        self.assertEqual([blob["refs"] for blob in await self.blobs.find({}).to_list(length=None)], [1])
+        self.assertEqual(os.listdir(self.uploads), before["projects"])
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(blob.BLOB_DIR)), 1)
+
+
+class TestMoveTree(unittest.TestCase):
+    def test_existing_destination(self):
+        """A tree is moved with one rename and never merged into an existing directory."""
+        with tempfile.TemporaryDirectory() as tmp:
+            src, dest = os.path.join(tmp, "staging"), os.path.join(tmp, "uploads", "project")
+            os.makedirs(os.path.join(src, "docs"))
+            open(os.path.join(src, "docs", "a.txt"), "w").close()
+            move_tree(src, dest)
+            self.assertFalse(os.path.exists(src))
+            self.assertEqual(os.listdir(os.path.join(dest, "docs")), ["a.txt"])
+
+            os.makedirs(os.path.join(src, "docs"))
+            open(os.path.join(src, "docs", "b.txt"), "w").close()
+            with self.assertRaises(FileExistsError):
+                move_tree(src, dest)
+            self.assertEqual(os.listdir(os.path.join(dest, "docs")), ["a.txt"])
+            self.assertEqual(os.listdir(os.path.join(src, "docs")), ["b.txt"])
+
+
+class TestStoreBlob(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(blob, "BLOB_DIR", os.path.join(self.tmp.name, ".blobs"))
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def write(self, name: str, content: bytes = b"content") -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_shared_content(self):
+        """The second copy of a content is replaced by a link to the first one's blob."""
+        first, second = self.write("a.txt"), self.write("b.txt")
+        self.assertTrue(blob.store_blob(first, "ab12"))
+        self.assertFalse(blob.store_blob(second, "ab12"))
+        self.assertEqual(os.stat(second).st_ino, os.stat(blob.blob_path("ab12")).st_ino)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), [".blobs", "a.txt", "b.txt"])
+
+    def test_blob_removed_while_linking(self):
+        """A blob removed between the existence check and the link is stored again from the new copy."""
+        first, second = self.write("a.txt"), self.write("b.txt")
+        blob.store_blob(first, "ab12")
+        real_link = os.link
+
+        def racing_link(src, dst):
+            if src == blob.blob_path("ab12"):
+                blob.remove_blob("ab12")
+            return real_link(src, dst)
+
+        with mock.patch.object(blob.os, "link", racing_link):
+            self.assertTrue(blob.store_blob(second, "ab12"))
+        with open(second, "rb") as f:
+            self.assertEqual(f.read(), b"content")
+        self.assertEqual(os.stat(second).st_ino, os.stat(blob.blob_path("ab12")).st_ino)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), [".blobs", "a.txt", "b.txt"])
+
+
+if __name__ == '__main__':
+    unittest.main()
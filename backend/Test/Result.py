@@ -0,0 +1,115 @@
+import os
+import tempfile
+import time
+import unittest
+import sys
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import Utils.Result as results
+from Database.Result import StoreResult
+from Routes.Result import GetResultData, GetResultPDF
+from Test.AsyncMongo import async_database
+from Utils.Analysis import expire_results
+from Utils.Result import new_result_id, result_pdf_path, save_result_data, sweep_results, touch_result
+
+PDF_BYTES = b"%PDF-1.4 highlighted"
+
+# The result routes as Main.py mounts them
+app = FastAPI()
+app.get("/api/result/{result_id}")(GetResultData)
+app.get("/api/result/{result_id}/pdf")(GetResultPDF)
+
+
+def write_result(data: dict, age: float = 0) -> str:
+    result_id = new_result_id()
+    with open(result_pdf_path(result_id), "wb") as f:
+        f.write(PDF_BYTES)
+    save_result_data(result_id, data)
+    if age:
+        stamp = time.time() - age
+        for path in (result_pdf_path(result_id), results.result_data_path(result_id)):
+            os.utime(path, (stamp, stamp))
+    return result_id
+
+
+class ResultDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(results, "RESULT_DIR", self.tmp.name)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+
+class TestResultRoutes(ResultDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = TestClient(app)
+
+    def test_result_data(self):
+        """The stored classification data is returned with its id."""
+        result_id = write_result({"filename": "a.pdf", "data": [["text", 1, 0.9]]})
+        response = self.client.get(f"/api/result/{result_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"result_id": result_id, "filename": "a.pdf", "data": [["text", 1, 0.9]]})
+
+    def test_result_pdf(self):
+        """The highlighted PDF is streamed with its id in a header."""
+        result_id = write_result({"data": []})
+        response = self.client.get(f"/api/result/{result_id}/pdf")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, PDF_BYTES)
+        self.assertEqual(response.headers["content-type"], "application/pdf")
+        self.assertEqual(response.headers["x-result-id"], result_id)
+
+    def test_not_found(self):
+        """Unknown, malformed and swept result ids get a 404."""
+        swept = write_result({"data": []}, age=3600)
+        sweep_results(60)
+        for result_id in [new_result_id(), "not-a-result-id", new_result_id().upper(), swept]:
+            for url in [f"/api/result/{result_id}", f"/api/result/{result_id}/pdf"]:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404, url)
+                self.assertEqual(response.json(), {"detail": "Result not found"})
+
+
+class TestResultSweep(ResultDirTestCase):
+    def test_sweep(self):
+        """Results unused for longer than the lifetime are deleted, other files are left alone."""
+        fresh = write_result({"data": []})
+        old = write_result({"data": []}, age=3600)
+        reused = write_result({"data": []}, age=3600)
+        touch_result(reused)
+        other = os.path.join(self.tmp.name, "text-abc.txt")
+        open(other, "w").close()
+        os.utime(other, (0, 0))
+
+        self.assertEqual(sweep_results(60), [old])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)),
+                         sorted([f"{fresh}.pdf", f"{fresh}.json", f"{reused}.pdf", f"{reused}.json", "text-abc.txt"]))
+        self.assertEqual(sweep_results(60), [])
+
+
+class TestExpireResults(unittest.IsolatedAsyncioTestCase):
+    async def test_records_removed(self):
+        """The records of swept results are dropped with their files."""
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(results, "RESULT_DIR", tmp):
+            collection = async_database()("results")
+            old = write_result({"data": []}, age=3600)
+            fresh = write_result({"data": []})
+            await StoreResult("hash-old", "v1", "paragraphs", old, result_pdf_path(old), {}, collection)
+            await StoreResult("hash-new", "v1", "paragraphs", fresh, result_pdf_path(fresh), {}, collection)
+
+            self.assertEqual(await expire_results(collection, 60), [old])
+            remaining = await collection.find({}).to_list(length=None)
+            self.assertEqual([record["result_id"] for record in remaining], [fresh])
+
+
+if __name__ == '__main__':
+    unittest.main()
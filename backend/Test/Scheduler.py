@@ -0,0 +1,260 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+import sys
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import Utils.Plagirarism as plagiarism
+import Utils.Scheduler as scheduler
+from Database.Job import (
+    FAILED, QUEUED, RUNNING, CompleteTask, CreateOCRJob, ExtendLease, FailOCRJob, FindOCRJob,
+    RecoverExpiredTasks, SetJobCheckpoint
+)
+from Routes.Sheduler import stream_job_events
+from Test.AsyncMongo import async_database
+from Utils.Scheduler import AnalysisScheduler
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+class TestOCRJobs(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        collection = async_database()
+        self.jobs = collection("jobs")
+        self.scheduler = AnalysisScheduler(
+            collection("documents"), collection("results"), self.jobs,
+            collection("tasks"), collection("events"), workers=2, poll_interval=0.01,
+            recovery_interval=0.05)
+
+    async def asyncTearDown(self):
+        await self.scheduler.stop()
+        self.tmp.cleanup()
+
+    async def test_failed_job_ends_stream(self):
+        """A failing page marks the job failed and ends its event stream."""
+        pdf_path = os.path.join(self.tmp.name, "job.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"not a pdf")
+        job_id = await CreateOCRJob(pdf_path, 2, self.jobs, content_hash="abc", model_version="v1")
+
+        await self.scheduler._run_ocr_job(await self.scheduler.get_job(job_id))
+        job = await self.scheduler.get_job(job_id)
+        self.assertEqual(job["status"], FAILED)
+        self.assertNotIn("lease_until", job)
+        self.assertFalse(os.path.exists(pdf_path))
+
+        websocket = FakeWebSocket()
+        await asyncio.wait_for(stream_job_events(
+            websocket, self.scheduler, job_id, 0,
+            is_final=lambda e: e.get("status") in ("done", "failed")), timeout=5)
+        self.assertEqual(websocket.sent[-1]["status"], "failed")
+        # The failed job is not handed to later uploads of the same content
+        self.assertIsNone(await FindOCRJob("abc", "v1", self.jobs))
+
+    async def test_resume_keeps_events(self):
+        """A job resumed in the middle of a page publishes each of its events once."""
+        pdf_path = os.path.join(self.tmp.name, "job.pdf")
+        open(pdf_path, "wb").close()
+        job_id = await CreateOCRJob(pdf_path, 2, self.jobs, content_hash="abc", model_version="v1")
+        # The previous runner stopped after the first chunk of page 1
+        await self.scheduler.publish(job_id, {"page": 1, "chunk": 1, "text": "one", "data": []})
+
+        async def classify(chunk):
+            return []
+
+        with mock.patch.object(scheduler, "convert_from_path", lambda *args, **kwargs: [None]), \
+                mock.patch.object(scheduler, "ocr_from_image", lambda image: "text"), \
+                mock.patch.object(scheduler, "chunk_by_tokens", lambda text: [{"text": "one"}, {"text": "two"}]), \
+                mock.patch.object(scheduler, "GetClassification", classify):
+            await self.scheduler._run_ocr_job(await self.scheduler.get_job(job_id))
+
+        events = await self.scheduler.get_events(job_id)
+        self.assertEqual([event["seq"] for event in events], list(range(1, 8)))
+        self.assertEqual([(event.get("page"), event.get("chunk"), event.get("status")) for event in events],
+                         [(1, 1, None), (1, 2, None), (1, None, "completed"),
+                          (2, 1, None), (2, 2, None), (2, None, "completed"), (None, None, "done")])
+
+    async def test_submit_skips_dead_jobs(self):
+        """Uploads reuse live or finished OCR jobs, but start over after an expired or failed one."""
+        doc = fitz.open()
+        doc.new_page()
+        pdf_bytes = doc.tobytes()
+        doc.close()
+        started = []
+        self.scheduler._spawn_ocr_job = lambda job: started.append(job["_id"])
+
+        first = await self.scheduler.submit_ocr(pdf_bytes)
+        self.assertEqual((await self.scheduler.submit_ocr(pdf_bytes))["_id"], first["_id"])
+
+        await self.jobs.update_one(
+            {"_id": first["_id"]}, {"$set": {"lease_until": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+        second = await self.scheduler.submit_ocr(pdf_bytes)
+        self.assertNotEqual(second["_id"], first["_id"])
+
+        await FailOCRJob(second["_id"], "page 1 failed", self.jobs)
+        third = await self.scheduler.submit_ocr(pdf_bytes)
+        self.assertNotIn(third["_id"], (first["_id"], second["_id"]))
+        self.assertEqual(started, [first["_id"], second["_id"], third["_id"]])
+
+        await SetJobCheckpoint(third["_id"], 1, self.jobs, done=True)
+        await self.jobs.update_one(
+            {"_id": third["_id"]}, {"$set": {"lease_until": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+        self.assertEqual((await self.scheduler.submit_ocr(pdf_bytes))["_id"], third["_id"])
+        for job in (first, second, third):
+            if os.path.exists(job["pdf_path"]):
+                os.remove(job["pdf_path"])
+
+    async def test_workers_resume_expired_jobs(self):
+        """OCR jobs whose lease ran out are taken over while running, not only at startup."""
+        resumed = []
+        self.scheduler._spawn_ocr_job = lambda job: resumed.append(job["_id"])
+        await self.scheduler.start()
+        recovering = mock.AsyncMock(wraps=self.scheduler._resume_expired_ocr_jobs)
+        self.scheduler._resume_expired_ocr_jobs = recovering
+
+        job_id = await CreateOCRJob("missing.pdf", 1, self.jobs)
+        await self.jobs.update_one(
+            {"_id": job_id}, {"$set": {"lease_until": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+        for _ in range(100):
+            if resumed:
+                break
+            await asyncio.sleep(0.02)
+        self.assertEqual(resumed, [job_id])
+
+        # Recovery runs once per interval, not once per idle worker poll
+        calls = recovering.await_count
+        await asyncio.sleep(0.25)
+        self.assertLessEqual(recovering.await_count - calls, 6)
+
+
+class TestTaskQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        collection = async_database()
+        self.tasks = collection("tasks")
+        self.scheduler = AnalysisScheduler(
+            collection("documents"), collection("results"), collection("jobs"),
+            self.tasks, collection("events"), workers=1, per_user_limit=2, poll_interval=0.05)
+
+    async def test_fair_claiming(self):
+        """Users take turns up to their running limit, whoever queued first or most."""
+        await self.scheduler.submit("p1", "alice", ["a1", "a2", "a3", "a4"], "ai", "plag")
+        await self.scheduler.submit("p2", "bob", ["b1", "b2", "b3"], "ai", "plag")
+
+        claimed = [await self.scheduler._claim_fair() for _ in range(4)]
+        # Either user may go first, then they alternate, oldest task first
+        first, second = claimed[0]["user_id"], claimed[1]["user_id"]
+        self.assertEqual({first, second}, {"alice", "bob"})
+        self.assertEqual([task["user_id"] for task in claimed], [first, second, first, second])
+        documents = {user: [task["document_id"] for task in claimed if task["user_id"] == user]
+                     for user in (first, second)}
+        self.assertEqual(documents, {"alice": ["a1", "a2"], "bob": ["b1", "b2"]})
+        self.assertTrue(all(task["status"] == RUNNING and task["attempts"] == 1 for task in claimed))
+
+        # Both users are at their limit, until one of their tasks finishes
+        self.assertIsNone(await self.scheduler._claim_fair())
+        await CompleteTask(claimed[1]["_id"], {}, self.tasks)
+        self.assertEqual((await self.scheduler._claim_fair())["user_id"], second)
+        self.assertIsNone(await self.scheduler._claim_fair())
+        await CompleteTask(claimed[0]["_id"], {}, self.tasks)
+        self.assertEqual((await self.scheduler._claim_fair())["user_id"], first)
+
+    async def test_lease_expiry(self):
+        """A task whose lease runs out is queued again and claimed by the next worker."""
+        await self.scheduler.submit("p1", "alice", ["a1", "a2"], "ai", "plag")
+        first = await self.scheduler._claim_fair()
+        second = await self.scheduler._claim_fair()
+
+        # Nothing is recovered while the leases hold, or once renewed
+        self.assertEqual(await RecoverExpiredTasks(self.tasks), 0)
+        past = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await self.tasks.update_many({}, {"$set": {"lease_until": past}})
+        await ExtendLease(second["_id"], self.tasks)
+        self.assertEqual(await RecoverExpiredTasks(self.tasks), 1)
+
+        task = await self.tasks.find_one({"_id": first["_id"]})
+        self.assertEqual(task["status"], QUEUED)
+        reclaimed = await self.scheduler._claim_fair()
+        self.assertEqual((reclaimed["_id"], reclaimed["attempts"]), (first["_id"], 2))
+        self.assertGreater(reclaimed["lease_until"], datetime.now(timezone.utc))
+        self.assertIsNone(await self.scheduler._claim_fair())
+
+    async def test_event_replay(self):
+        """Events are stored in sequence and replayed from any cursor."""
+        job_id = await self.scheduler.submit("p1", "alice", ["a1"], "ai", "plag")
+        queue = self.scheduler.subscribe(job_id)
+        for i in range(4):
+            await self.scheduler.publish(job_id, {"progress": f"{i}/4"})
+        await self.scheduler.publish(job_id, {"status": "completed"})
+
+        self.assertEqual([e["seq"] for e in await self.scheduler.get_events(job_id)], [1, 2, 3, 4, 5])
+        replayed = await self.scheduler.get_events(job_id, after=2)
+        self.assertEqual([(e["seq"], e.get("progress")) for e in replayed],
+                         [(3, "2/4"), (4, "3/4"), (5, None)])
+        self.assertEqual(queue.qsize(), 5)
+        self.scheduler.unsubscribe(job_id, queue)
+
+        # A client reconnecting with cursor 3 gets the rest and the stream ends
+        websocket = FakeWebSocket()
+        await asyncio.wait_for(stream_job_events(
+            websocket, self.scheduler, job_id, 3,
+            is_final=lambda e: e.get("status") == "completed"), timeout=5)
+        self.assertEqual([e["seq"] for e in websocket.sent], [4, 5])
+        self.assertEqual(await self.scheduler.get_events(job_id, after=5), [])
+
+
+class TestPlagiarismTasks(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.patch = mock.patch.object(plagiarism, "INDEX_DB", Path(self.tmp.name) / "index.sqlite3")
+        self.patch.start()
+        collection = async_database()
+        self.scheduler = AnalysisScheduler(collection("documents"), collection("results"), collection("jobs"),
+                                           collection("tasks"), collection("events"))
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def test_parallel_extraction(self):
+        """Workers extract their documents at the same time and only take turns on the index."""
+        words = " ".join(f"word{i}" for i in range(300))
+        paths = []
+        for name in ("a", "b"):
+            paths.append(os.path.join(self.tmp.name, f"{name}.pdf"))
+            doc = fitz.open()
+            doc.new_page().insert_text((72, 72), name)
+            doc.save(paths[-1])
+            doc.close()
+        # Both extractions must be running for either to finish
+        barrier = threading.Barrier(2, timeout=5)
+
+        def extract(path, text_path=None):
+            barrier.wait()
+            return words
+
+        with mock.patch.object(plagiarism, "extract_text_and_ocr_from_pdf", extract), \
+                ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda path: self.scheduler._run_plagiarism("shingles", path), paths))
+        # The one indexed last is scored against the other, both may be
+        self.assertIn(sorted(result["p_score"] for result in results), [[0.0, 1.0], [1.0, 1.0]])
+        for result, other in zip(results, ["b.pdf", "a.pdf"]):
+            self.assertIn(result["match"], [None, other])
+        self.assertEqual(len(self.scheduler._visualizer.reps), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+import sys
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tokenizers import BertWordPieceTokenizer
+
+from Utils.CONFIG import TOKENIZER_NAME
+from Utils.Para import chunk_by_tokens, get_tokenizer
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", ".", "!",
+         "the", "cat", "sat", "on", "mat", "dog", "ran", "token", "##ization", "##s"]
+
+class TestChunkByTokens(unittest.TestCase):
+    def setUp(self):
+        self.tokenizer = BertWordPieceTokenizer({w: i for i, w in enumerate(VOCAB)})
+
+    def test_spans_map_back_to_text(self):
+        """Check every chunk's character span reproduces its text."""
+        text = "The cat sat on the mat. The dog ran! The cat ran."
+        chunks = chunk_by_tokens(text, max_tokens=10, tokenizer=self.tokenizer)
+        for chunk in chunks:
+            self.assertEqual(text[chunk['start']:chunk['end']], chunk['text'])
+            self.assertLessEqual(chunk['tokens'], 8)
+
+    def test_packs_whole_sentences(self):
+        """Check sentences are packed together until the token budget is full."""
+        text = "The cat sat on the mat. The dog ran! The cat ran."
+        chunks = chunk_by_tokens(text, max_tokens=13, tokenizer=self.tokenizer)
+        self.assertEqual([c['text'] for c in chunks],
+                         ["The cat sat on the mat. The dog ran!", "The cat ran."])
+        self.assertEqual(chunks[0]['tokens'], 11)
+
+    def test_long_sentence_split_on_word_boundary(self):
+        """Check an over-long sentence is split without breaking word pieces."""
+        text = "tokenizations tokenizations tokenizations"
+        chunks = chunk_by_tokens(text, max_tokens=6, tokenizer=self.tokenizer)
+        self.assertEqual([c['text'] for c in chunks],
+                         ["tokenizations", "tokenizations", "tokenizations"])
+
+    def test_empty_text(self):
+        """Check blank text yields no chunks."""
+        self.assertEqual(chunk_by_tokens("   ", tokenizer=self.tokenizer), [])
+
+
+
+class TestGetTokenizer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.vocab_path = os.path.join(self.tmp.name, "vocab.txt")
+        with open(self.vocab_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(VOCAB) + "\n")
+        get_tokenizer.cache_clear()
+
+    def tearDown(self):
+        get_tokenizer.cache_clear()
+        self.tmp.cleanup()
+
+    def test_downloads_vocab(self):
+        """Check the model's vocab.txt is fetched from the hub and tokenizes uncased text."""
+        with mock.patch("huggingface_hub.hf_hub_download", return_value=self.vocab_path) as download:
+            tokenizer = get_tokenizer()
+            self.assertIs(get_tokenizer(), tokenizer)
+        download.assert_called_once_with(TOKENIZER_NAME, "vocab.txt")
+        encoding = tokenizer.encode("The Cat tokenizations", add_special_tokens=False)
+        self.assertEqual(encoding.tokens, ["the", "cat", "token", "##ization", "##s"])
+        chunks = chunk_by_tokens("The cat sat on the mat. The dog ran!", max_tokens=10, tokenizer=tokenizer)
+        self.assertEqual([c['text'] for c in chunks], ["The cat sat on the mat.", "The dog ran!"])
+
+    def test_local_model(self):
+        """Check a local model directory or vocab file is used without the hub."""
+        with mock.patch("huggingface_hub.hf_hub_download") as download:
+            from_dir = get_tokenizer(self.tmp.name)
+            from_file = get_tokenizer(self.vocab_path)
+        download.assert_not_called()
+        for tokenizer in (from_dir, from_file):
+            self.assertEqual(tokenizer.encode("dogs", add_special_tokens=False).tokens, ["dog", "##s"])
+
+
+if __name__ == "__main__":
+    unittest.main()
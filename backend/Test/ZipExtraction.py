@@ -0,0 +1,64 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+import sys
+from unittest import mock
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Utils.File import UploadTooLargeError, extract_zip_members
+
+MEMBERS = 3000
+
+
+class TestExtractZipMembers(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.tmp.name, "project.zip")
+        with zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for i in range(MEMBERS):
+                zf.writestr(f"docs/{i % 10}/file{i}.txt", f"content {i}\n" * 20)
+            zf.writestr("../escape.txt", "outside")
+            zf.writestr("docs/empty/", "")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_many_members(self):
+        """Check thousands of members are extracted with one archive handle per worker."""
+        out = os.path.join(self.tmp.name, "out")
+        progress = []
+        with mock.patch("zipfile.ZipFile", side_effect=zipfile.ZipFile) as opened:
+            start = time.perf_counter()
+            records = extract_zip_members(self.zip_path, out, workers=4,
+                                          progress_callback=lambda pct, status: progress.append(pct))
+            elapsed = time.perf_counter() - start
+
+        # One listing handle plus at most one per worker, not one per member
+        self.assertLessEqual(opened.call_count, 1 + 4)
+        self.assertLess(elapsed, 10)
+        self.assertEqual(len(records), MEMBERS)
+        self.assertEqual(progress[-1], 100)
+
+        record = records[1234]
+        self.assertEqual(record["member"], "docs/4/file1234.txt")
+        with open(record["document_path"], "rb") as f:
+            content = f.read()
+        self.assertEqual(content, b"content 1234\n" * 20)
+        self.assertEqual(record["content_hash"], hashlib.sha256(content).hexdigest())
+        self.assertEqual(record["size_bytes"], len(content))
+        # Zip Slip members are skipped
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "escape.txt")))
+
+    def test_size_limit(self):
+        """Check the declared uncompressed size is enforced before writing anything."""
+        out = os.path.join(self.tmp.name, "out")
+        with self.assertRaises(UploadTooLargeError):
+            extract_zip_members(self.zip_path, out, max_total_bytes=1000)
+        self.assertEqual(os.listdir(out), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
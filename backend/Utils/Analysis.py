@@ -0,0 +1,128 @@
+import hashlib
+import os
+from typing import Any, Dict, List, Tuple
+from motor.motor_asyncio import AsyncIOMotorCollection
+from opentelemetry.trace import Tracer
+from fastapi.concurrency import run_in_threadpool
+
+from Database.Result import DeleteResults, FindResult, StoreResult
+from Utils.CONFIG import MODEL_VERSION
+from Utils.PDF import HighlightPDF
+from Utils.Result import (
+    load_result_data, new_result_id, result_pdf_path, save_result_data, sweep_results, touch_result
+)
+
+
+# Score Utils.Request.GetClass gives a unit the model server did not classify
+UNCLASSIFIED_SCORE = -1
+
+
+class ClassificationError(Exception):
+    """Raised when the model server failed to classify part of a document."""
+
+
+def content_hash(pdf_bytes: bytes) -> str:
+    """SHA-256 of a file's content, the key analysis results are stored under."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def summarise(data) -> Dict[str, int]:
+    """Characters of text per predicted class, as the dashboard weighs them."""
+    summary: Dict[str, int] = {}
+    for text, class_index, _ in data:
+        key = str(class_index)
+        summary[key] = summary.get(key, 0) + len(text)
+    return summary
+
+
+async def analyse_pdf(
+    pdf_bytes: bytes,
+    result_collection: AsyncIOMotorCollection,
+    filename: str = None,
+    mode: str = "paragraphs",
+    min_count: int = 0,
+    tracer: Tracer = None,
+    known_hash: str = None
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Classifies and highlights a PDF, reusing the stored result when the same
+    content was already analysed with the current model version.
+
+    Args:
+        pdf_bytes (bytes): The PDF content.
+        result_collection (AsyncIOMotorCollection): Index of stored results.
+        filename (str, optional): Original file name, kept with the result.
+        mode (str): Highlight mode, see Utils.PDF.HighlightPDF.
+        min_count (int): Minimum word count of a highlighted unit.
+        tracer (Tracer, optional): The tracer for request tracking.
+        known_hash (str, optional): Content hash computed at ingestion, so the
+            PDF does not have to be hashed again.
+
+    Returns:
+        Tuple[Dict, bool]: The result ({'result_id', 'content_hash',
+        'model_version', 'pdf_path', 'summary', 'data', 'chunks', ...}) and
+        whether it came from the store.
+
+    Raises:
+        ClassificationError: If any unit could not be classified. Nothing is
+            stored then, so a retry analyses the document again.
+    """
+    digest = known_hash or content_hash(pdf_bytes)
+
+    record = await FindResult(digest, MODEL_VERSION, mode, result_collection)
+    if record and os.path.exists(record["pdf_path"]):
+        stored = load_result_data(record["result_id"])
+        if stored is not None:
+            touch_result(record["result_id"])
+            return {**stored, "result_id": record["result_id"], "pdf_path": record["pdf_path"]}, True
+
+    result_id = new_result_id()
+    pdf_path = result_pdf_path(result_id)
+    data, timings, chunks = await HighlightPDF(
+        pdf_bytes, pdf_path, mode=mode, min_count=min_count, tracer=tracer)
+
+    failed = sum(1 for _, _, score in data if score == UNCLASSIFIED_SCORE)
+    if failed:
+        await run_in_threadpool(_remove_file, pdf_path)
+        raise ClassificationError(f"{failed} of {len(data)} unit(s) could not be classified")
+
+    result = {
+        "filename": filename,
+        "content_hash": digest,
+        "model_version": MODEL_VERSION,
+        "mode": mode,
+        "summary": summarise(data),
+        "timings": timings,
+        "data": data,
+        "chunks": chunks
+    }
+    save_result_data(result_id, result)
+    await StoreResult(digest, MODEL_VERSION, mode, result_id, pdf_path,
+                      result["summary"], result_collection)
+
+    return {**result, "result_id": result_id, "pdf_path": pdf_path}, False
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def expire_results(result_collection: AsyncIOMotorCollection, max_age_seconds: float) -> List[str]:
+    """
+    Deletes the files of results unused for `max_age_seconds` and the
+    records pointing at them, so later uploads of the same content are
+    analysed again.
+
+    Args:
+        result_collection (AsyncIOMotorCollection): Index of stored results.
+        max_age_seconds (float): Lifetime of a result since its last use.
+
+    Returns:
+        List[str]: Ids of the deleted results.
+    """
+    expired = await run_in_threadpool(sweep_results, max_age_seconds)
+    await DeleteResults(expired, result_collection)
+    return expired
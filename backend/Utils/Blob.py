@@ -0,0 +1,91 @@
+import os
+import shutil
+from uuid import uuid4
+
+from Utils.File import UPLOAD_DIR
+
+# Content-addressed store, one file per distinct SHA-256
+BLOB_DIR = os.path.join(UPLOAD_DIR, ".blobs")
+os.makedirs(BLOB_DIR, exist_ok=True)
+# Tries of store_blob against blobs being removed concurrently
+BLOB_STORE_ATTEMPTS = 5
+
+
+def blob_path(content_hash: str) -> str:
+    """Path of the blob holding the content with this SHA-256."""
+    return os.path.join(BLOB_DIR, content_hash[:2], content_hash)
+
+
+def link_blob(content_hash: str, path: str) -> None:
+    """
+    Makes `path` point at a blob. Hard links keep the project tree browsable
+    without storing the content twice; a copy is made where linking fails.
+    The link is made under a temporary name and renamed over `path`, so an
+    existing `path` is only replaced once the blob is safely linked.
+
+    Raises:
+        FileNotFoundError: If the blob does not exist (any more).
+    """
+    blob = blob_path(content_hash)
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    try:
+        try:
+            os.link(blob, tmp_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(blob, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+
+def store_blob(path: str, content_hash: str) -> bool:
+    """
+    Moves a freshly written file into the blob store and links it back in
+    place. If the content is already stored, the new copy is dropped.
+
+    The blob is published with a single link, so of two uploads of the same
+    content only one creates it. When a blob is removed while a copy is
+    being linked to it, the copy is stored as the blob again; `path` keeps
+    its content throughout.
+
+    Args:
+        path (str): The extracted file.
+        content_hash (str): Its SHA-256.
+
+    Returns:
+        bool: Whether the blob is new.
+    """
+    blob = blob_path(content_hash)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+
+    for _ in range(BLOB_STORE_ATTEMPTS):
+        if not os.path.exists(blob):
+            try:
+                os.link(path, blob)
+                return True
+            except FileExistsError:
+                # Another upload stored it first, link to theirs
+                pass
+            except OSError:
+                tmp_blob = f"{blob}.{uuid4().hex}.tmp"
+                shutil.copyfile(path, tmp_blob)
+                os.replace(tmp_blob, blob)
+                return True
+        try:
+            link_blob(content_hash, path)
+            return False
+        except FileNotFoundError:
+            # Removed in the meantime, store this copy instead
+            continue
+    raise RuntimeError(f"Could not store blob {content_hash}")
+
+
+def remove_blob(content_hash: str) -> None:
+    """Deletes a blob's file; links to it in project trees stay valid."""
+    try:
+        os.remove(blob_path(content_hash))
+    except FileNotFoundError:
+        pass
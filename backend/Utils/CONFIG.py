@@ -3,4 +3,22 @@ COLOR_MAP = [
     (0, 1, 1),   # cyan
     (1, 0.6, 0),  # orange
     (0.7, 0.9, 0.2)  # lime
-]
\ No newline at end of file
+]
+
+# Tokenizer of the classification model, chunks are packed to its context length
+TOKENIZER_NAME = "prajjwal1/bert-tiny"
+# bert-tiny is an uncased model
+TOKENIZER_LOWERCASE = True
+MODEL_MAX_TOKENS = 128
+
+# Highlight colour per model class index
+CLASS_COLOR_MAP = [
+    (0.6, 1.0, 0.6),   # #99FF99 - Light Green - Humanise
+    (0.6, 0.6, 1.0),   # #9999FF - Light Blue - Polished
+    (1.0, 0.6, 0.6),   # #FF9999 - Light Red - AI
+    (1.0, 1.0, 0.6),   # #FFFF99 - Light Yellow - Humanised
+    (1.0, 1.0, 1.0),   # #FFFFFF - Light (default) - Undetermined
+]
+
+# Version of the classification model, stored results are only reused for the same version
+MODEL_VERSION = "bert-tiny-v1"
@@ -15,8 +15,21 @@ EXTRACT_DIR = "Static/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 import os
+import hashlib
+import threading
 import zipfile
-from typing import Callable, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Tuple
+
+# Chunk size used when streaming uploads and ZIP members to disk
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Threads extracting ZIP members
+EXTRACT_WORKERS = 4
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload or its extracted contents exceed the allowed size."""
+
 
 def extract_zip(
     zip_path: str,
@@ -33,17 +46,143 @@ def extract_zip(
             A callback function to report progress.
             Receives (percentage, status) as arguments.
     """
+    extract_zip_members(zip_path, extract_to, progress_callback=progress_callback)
+
+
+async def spool_upload(upload, dest_path: str, max_bytes: int,
+                       chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[int, str]:
+    """
+    Streams an UploadFile to disk chunk by chunk, hashing it on the way and
+    stopping as soon as it grows past max_bytes.
+
+    Args:
+        upload (UploadFile): The uploaded file.
+        dest_path (str): Where to write it.
+        max_bytes (int): Maximum accepted size.
+        chunk_size (int): Bytes read per chunk.
+
+    Returns:
+        Tuple[int, str]: The size in bytes and the SHA-256 hex digest.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(dest_path, "wb") as f:
+        while chunk := await upload.read(chunk_size):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+            hasher.update(chunk)
+            f.write(chunk)
+    return size, hasher.hexdigest()
+
+
+def safe_zip_members(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """
+    Returns the regular file members of an archive, skipping directories and
+    any name that would escape the extraction directory (Zip Slip).
+    """
+    members = []
+    for info in zf.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith(('/', '\\')) or '..' in name.replace('\\', '/').split('/'):
+            continue
+        members.append(info)
+    return members
+
+
+def _extract_member(
+    zf: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    extract_to: str,
+    on_member: Callable[[Dict], Dict] = None
+) -> Dict:
+    """
+    Streams one member to disk, hashing it on the way. `zf` must be the
+    calling thread's own handle on the archive.
+    """
+    dest = os.path.join(extract_to, *info.filename.replace('\\', '/').split('/'))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+    hasher = hashlib.sha256()
+    with zf.open(info) as src, open(dest, "wb") as dst:
+        while chunk := src.read(STREAM_CHUNK_SIZE):
+            hasher.update(chunk)
+            dst.write(chunk)
+
+    record = {
+        "member": info.filename,
+        "document_name": os.path.basename(info.filename),
+        "document_path": dest,
+        "size_bytes": info.file_size,
+        "content_hash": hasher.hexdigest()
+    }
+    return on_member(record) if on_member else record
+
+
+def extract_zip_members(
+    zip_path: str,
+    extract_to: str,
+    max_total_bytes: int = None,
+    workers: int = EXTRACT_WORKERS,
+    on_member: Callable[[Dict], Dict] = None,
+    progress_callback: Callable[[float, str], None] = None
+) -> List[Dict]:
+    """
+    Extracts the regular files of a ZIP straight into their final directory.
+    Members are streamed by a thread pool instead of being loaded in memory.
+    Each worker opens the archive once and reuses that handle for all of its
+    members, so the central directory is read once per thread.
+
+    Sizes come from the archive's metadata, so no directory walk is needed
+    afterwards. Extraction stops if the declared uncompressed total exceeds
+    max_total_bytes (ZIP bombs).
+
+    Args:
+        zip_path (str): Path to the zip file.
+        extract_to (str): Destination folder.
+        max_total_bytes (int, optional): Limit on the uncompressed size.
+        workers (int): Threads extracting members.
+        on_member (Callable[[Dict], Dict], optional): Runs in the worker thread
+            right after a member is written, and may add fields to its record.
+        progress_callback (Callable[[float, str], None], optional):
+            Receives (percentage, status), always on the calling thread.
+
+    Returns:
+        List[Dict]: One record per member, in archive order, with 'member',
+        'document_name', 'document_path', 'size_bytes' and 'content_hash'.
+    """
     os.makedirs(extract_to, exist_ok=True)
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        members = safe_zip_members(zf)
+    total = sum(info.file_size for info in members)
+    if max_total_bytes is not None and total > max_total_bytes:
+        raise UploadTooLargeError(f"Extracted contents exceed {max_total_bytes} bytes")
+
+    local = threading.local()
+    handles: List[zipfile.ZipFile] = []
+    handles_lock = threading.Lock()
 
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        members: List[str] = zip_ref.namelist()
-        total_files = len(members)
+    def open_handle():
+        local.zf = zipfile.ZipFile(zip_path, 'r')
+        with handles_lock:
+            handles.append(local.zf)
+
+    def extract(info: zipfile.ZipInfo) -> Dict:
+        return _extract_member(local.zf, info, extract_to, on_member)
+
+    records: List[Dict] = [None] * len(members)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, initializer=open_handle) as pool:
+            futures = {pool.submit(extract, info): i for i, info in enumerate(members)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                records[futures[future]] = future.result()
+                if progress_callback:
+                    progress_callback(done / len(members) * 100, "extracting")
+    finally:
+        for handle in handles:
+            handle.close()
+    return records
 
-        for i, member in enumerate(members):
-            zip_ref.extract(member, extract_to)
-            if progress_callback:
-                percent = ((i + 1) / total_files) * 100
-                progress_callback(percent, "extracting")
 
 def pdf_to_xml(pdf_path, xml_path):
     """
@@ -124,33 +263,47 @@ def xml_to_pdf_with_underlines(xml_path, pdf_path):
     print(f"✅ Converted {xml_path} → {pdf_path} with {num_to_underline} underlined paragraphs.")
 
 
-# --- Utility Function for Disk Space Calculation ---
-def calculate_directory_size(path: str) -> int:
+def remove_tree(path: str) -> None:
+    """Deletes a directory tree, ignoring files that are already gone."""
+    shutil.rmtree(path, ignore_errors=True)
+
+def remove_files(paths: List[str], root: str) -> None:
     """
-    Calculates the total size of a directory and its contents in bytes.
-    NOTE: This is a simplified function. For production, consider using
-    os.path.getsize(f) and summing up all file sizes.
+    Deletes files under `root`, then the directories under it that were left
+    empty, `root` included. Files outside `root` and files that are already
+    gone are skipped, other files in the same directories are kept.
     """
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            # Add file size. Use a mock size if real os.path.getsize is restricted.
-            try:
-                total_size += os.path.getsize(fp)
-            except OSError:
-                # Mock size calculation for sandbox environment
-                total_size += 512 + len(f) * 100 # Mock file size
-    
-    # Add a baseline size to ensure a meaningful result for an empty or mocked directory
-    return max(total_size, 1024 * 512) # Minimum 512KB mock size
+    root = os.path.abspath(root)
+    dirs = set()
+    for path in paths:
+        path = os.path.abspath(path)
+        if not path.startswith(root + os.sep):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        parent = os.path.dirname(path)
+        while parent.startswith(root):
+            dirs.add(parent)
+            parent = os.path.dirname(parent)
+    # Deepest first, so parents are only tried once their children are gone
+    for directory in sorted(dirs, key=len, reverse=True):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
 
-def calculate_directory_size_for_user(uuid: str) -> int:
+def move_tree(src: str, dest: str) -> None:
     """
-    Calculates the total size of a user's upload directory in bytes.
+    Moves a directory tree to `dest` with a single rename. Both must be on
+    the same filesystem. An existing `dest` is never merged into, it raises
+    FileExistsError and `src` is left in place.
     """
-    user_dir = os.path.join(UPLOAD_DIR, uuid)
-    return calculate_directory_size(user_dir)
+    if os.path.lexists(dest):
+        raise FileExistsError(f"{dest} already exists")
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.rename(src, dest)
 
 def generate_directory_structure_new_user(uuid: str) -> str:
     """
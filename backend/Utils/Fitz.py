@@ -0,0 +1,40 @@
+"""
+PyMuPDF is not thread safe, so all fitz work done by threads of this process
+(highlighting, ingest, plagiarism extraction, the scheduler) runs on one
+dedicated thread. Process pools get their own copy of the library and do
+not need it.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+_local = threading.local()
+
+
+def _mark_fitz_thread():
+    _local.fitz_thread = True
+
+
+# A forked pool worker inherits the executor without its thread
+_FITZ_PID = os.getpid()
+FITZ_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fitz",
+                                   initializer=_mark_fitz_thread)
+
+
+def in_fitz_thread(func: Callable, *args, **kwargs) -> Any:
+    """
+    Runs `func` on the fitz thread and waits for its result. Called from the
+    fitz thread itself, or from a pool worker process, it just runs `func`.
+    """
+    if getattr(_local, "fitz_thread", False) or os.getpid() != _FITZ_PID:
+        return func(*args, **kwargs)
+    return FITZ_EXECUTOR.submit(func, *args, **kwargs).result()
+
+
+async def run_in_fitz_thread(func: Callable, *args, **kwargs) -> Any:
+    """Awaits `func` run on the fitz thread, keeping the event loop free."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(FITZ_EXECUTOR, partial(func, *args, **kwargs))
@@ -5,6 +5,11 @@ def GroupPara(paragraphs: List, minCount: int = 50, tracer: Tracer=None) -> Tupl
     """
     Groups paragraphs into clusters based on their similarity.
 
+    Runs in a single linear pass: word counts are kept as a running total
+    and each group's text is joined once when the group is closed. A
+    trailing group smaller than minCount is merged into the previous group
+    (or kept on its own if it is the only one) instead of being dropped.
+
     Args:
         paragraphs (List): List of paragraph strings.
         minCount (int): Minimum number of words in paragraphs required to form a group.
@@ -13,26 +18,29 @@ def GroupPara(paragraphs: List, minCount: int = 50, tracer: Tracer=None) -> Tupl
     Returns:
         List: A list of grouped paragraphs.
     """
-    paras = list(paragraphs)
     grouped = []
-    current_paras = []
     para = []
+    current_paras = []
     words = 0
-    
-    while paras:
-        base_para = paras.pop(0)
-        base_words = base_para[4].split()
-        words += len(base_words)
+
+    for base_para in paragraphs:
+        words += len(base_para[4].split())
         current_paras.append(base_para)
-        
+
         if words >= minCount:
             grouped.append(current_paras)
-            para.append("")
-            for p in current_paras:
-                para[-1] += (p[4])
+            para.append("".join(p[4] for p in current_paras))
             current_paras = []
             words = 0
-            
+
+    if current_paras:
+        if grouped:
+            grouped[-1].extend(current_paras)
+            para[-1] += "".join(p[4] for p in current_paras)
+        else:
+            grouped.append(current_paras)
+            para.append("".join(p[4] for p in current_paras))
+
     print("Grouped Paragraphs:", len(para))
     print("Number of Groups:", len(grouped))
     return grouped, para
@@ -0,0 +1,61 @@
+import os
+from typing import Dict, Tuple
+from uuid import uuid4
+import fitz  # PyMuPDF
+
+from Utils.Blob import store_blob
+from Utils.Fitz import in_fitz_thread
+from Utils.Result import text_layer_path
+
+
+def _read_text_layer(path: str) -> Tuple[int, str]:
+    with fitz.open(path) as doc:
+        return doc.page_count, "\f".join(page.get_text() for page in doc)
+
+
+def preprocess_document(record: Dict) -> Dict:
+    """
+    Adds what later stages need from an extracted file to its record, so
+    analysis and deduplication start from precomputed data.
+
+    The file is first moved into the content-addressed blob store and linked
+    back at its path, so identical uploads share one copy on disk.
+
+    PDFs get their page count and text layer. The text is written once per
+    content hash and its path is kept on the record; scans without a text
+    layer only get `has_text_layer` set to False.
+
+    Args:
+        record (Dict): A member record from Utils.File.extract_zip_members.
+
+    Returns:
+        Dict: The same record, with 'page_count', 'has_text_layer' and
+        'text_path' for PDFs.
+    """
+    store_blob(record["document_path"], record["content_hash"])
+    if not record["document_path"].lower().endswith(".pdf"):
+        return record
+
+    try:
+        page_count, text = in_fitz_thread(_read_text_layer, record["document_path"])
+    except Exception as e:
+        print(f"[WARN] Could not read PDF {record['document_path']}: {e}")
+        return {**record, "page_count": 0, "has_text_layer": False, "text_path": None}
+
+    has_text_layer = bool(text.strip())
+    text_path = None
+    if has_text_layer:
+        text_path = text_layer_path(record["content_hash"])
+        if not os.path.exists(text_path):
+            # Unique temporary name, the same content may be extracted twice at once
+            tmp_path = f"{text_path}.{uuid4().hex}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, text_path)
+
+    return {
+        **record,
+        "page_count": page_count,
+        "has_text_layer": has_text_layer,
+        "text_path": text_path
+    }
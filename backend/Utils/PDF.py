@@ -1,14 +1,49 @@
+import asyncio
 import io
-import random
-import re
-from typing import Any, Dict, List, Tuple
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Any, BinaryIO, Dict, List, Tuple, Union
 import fitz  # PyMuPDF
+import numpy as np
 from opentelemetry.trace import Tracer
 
+from Utils.Fitz import run_in_fitz_thread
 from Utils.Group import GroupPara
 from Utils.Request import GetClass
-from Utils.CONFIG import COLOR_MAP
-from Utils.Para import club_sentences_by_word_count
+from Utils.CONFIG import CLASS_COLOR_MAP, COLOR_MAP
+from Utils.Para import align_sentences_to_words, club_sentences_by_word_count
+from Tesseract.OCR import ocr_page_layout
+
+
+def get_page_layout(page: fitz.Page, use_ocr: bool = True, dpi: int = 300) -> Tuple[List, List]:
+    """
+    Returns the (blocks, words) of a page in PyMuPDF's tuple shapes.
+
+    Pages without a text layer (scans) are OCRed once and the word/block
+    boxes are returned in PDF points, so callers can group and highlight
+    them exactly like born-digital pages.
+
+    :param page: The PyMuPDF page.
+    :param use_ocr: Fall back to OCR when the page has no text layer.
+    :param dpi: Render resolution used for OCR.
+    :return: A tuple of (blocks, words).
+    """
+    blocks = page.get_text("blocks")
+    if any(b[4].strip() for b in blocks):
+        return blocks, page.get_text("words")
+    if not use_ocr:
+        return blocks, []
+    return ocr_page_layout(page, dpi=dpi)
+
+
+def bounding_rect(boxes: np.ndarray) -> fitz.Rect:
+    """
+    Returns the rectangle enclosing an (n, 4) array of (x0, y0, x1, y1) boxes.
+    """
+    x0, y0 = boxes[:, :2].min(axis=0)
+    x1, y1 = boxes[:, 2:].max(axis=0)
+    return fitz.Rect(x0, y0, x1, y1)
 
 
 def highlight_sentences(pdf_input, pdf_output, highlights):
@@ -39,7 +74,11 @@ def highlight_sentences(pdf_input, pdf_output, highlights):
     print(f"✅ Saved highlighted PDF to {pdf_output}")
 
 
-def highlight_paragraphs(pdf_bytes: bytes) -> bytes:
+def highlight_paragraphs(pdf_bytes: bytes, output: Union[str, BinaryIO] = None) -> bytes:
+    """
+    Highlights every text block with a rotating colour. The result is saved
+    to `output` (path or stream) when given, otherwise returned as bytes.
+    """
     # Load PDF from bytes
     doc = fitz.open("pdf", pdf_bytes)
     colors = [
@@ -62,6 +101,11 @@ def highlight_paragraphs(pdf_bytes: bytes) -> bytes:
             highlight.set_colors(stroke=colors[i % len(colors)])
             highlight.update()
 
+    if output is not None:
+        doc.save(output, garbage=1, deflate=True)
+        doc.close()
+        return None
+
     output_stream = io.BytesIO()
     doc.save(output_stream)
     doc.close()
@@ -69,55 +113,240 @@ def highlight_paragraphs(pdf_bytes: bytes) -> bytes:
     return output_stream.getvalue()
 
 
-async def HighlightParagraphs(pdf_bytes: bytes, tracer: Tracer = None) -> bytes:
-    # Load PDF from bytes
-    doc = fitz.open("pdf", pdf_bytes)
-    color_map = [
-        (0.6, 1.0, 0.6),   # #99FF99 - Light Green - Humanise
-        (0.6, 0.6, 1.0),   # #9999FF - Light Blue - Polished
-        (1.0, 0.6, 0.6),   # #FF9999 - Light Red - AI
-        (1.0, 1.0, 0.6),   # #FFFF99 - Light Yellow - Humanised
-        (1.0, 1.0, 1.0),   # #FFFFFF - Light (default) - Undetermined
-    ]
+# --- Highlighting Engine ---
+# Extract (optionally in worker processes) -> classify everything -> annotate
+# in bulk -> save once to the caller's file or stream.
+
+@contextmanager
+def _phase(name: str, timings: Dict[str, float], tracer: Tracer = None):
+    """Times a phase of the engine and wraps it in a span when traced."""
+    span = tracer.start_as_current_span(f"highlight_{name}") if tracer else nullcontext()
+    start = time.perf_counter()
+    with span:
+        yield
+    timings[name] = time.perf_counter() - start
 
-    data = []
-    for page in doc:
-        blocks = page.get_text("blocks")
-        chosen = [b for b in blocks if b[4].strip()]
 
+def plan_page(blocks: List, words: List, mode: str, min_count: int) -> List[Tuple[str, List[tuple]]]:
+    """
+    Splits one page into the units that get classified and highlighted.
+
+    :param blocks: fitz block tuples of the page.
+    :param words: fitz word tuples of the page.
+    :param mode: "paragraphs" (groups of blocks) or "sentences" (clubbed sentences).
+    :param min_count: Minimum word count of a unit.
+    :return: List of (text, rects), rects being (x0, y0, x1, y1) tuples.
+    """
+    if mode == "paragraphs":
+        chosen = [b for b in blocks if b[4].strip()]
         if not chosen:
-            continue
+            return []
+        grouped, paragraphs = GroupPara(chosen, minCount=min_count)
+        return [
+            (text, [tuple(b[:4]) for b in group])
+            for group, text in zip(grouped, paragraphs)
+        ]
+
+    if mode == "sentences":
+        if not words:
+            return []
+        chunks = club_sentences_by_word_count(align_sentences_to_words(words), min_count)
+        boxes = np.asarray([w[:4] for w in words], dtype=float)
+        units = []
+        first = 0
+        # Sentences cover every word in order, so chunks are consecutive word ranges
+        for chunk in chunks:
+            last = first + len(chunk['words'])
+            units.append((chunk['text'], [tuple(bounding_rect(boxes[first:last]))]))
+            first = last
+        return units
+
+    raise ValueError(f"Unknown highlight mode: {mode}")
+
+
+def plan_page_range(
+    pdf: Union[bytes, str], start: int, stop: int, mode: str, min_count: int, use_ocr: bool = True
+) -> List[List[Tuple[str, List[tuple]]]]:
+    """
+    Plans pages start..stop (exclusive). Runs in worker processes, so it
+    opens its own copy of the document.
+    """
+    doc = fitz.open(pdf) if isinstance(pdf, str) else fitz.open("pdf", pdf)
+    try:
+        return [
+            plan_page(*get_page_layout(doc[i], use_ocr=use_ocr), mode, min_count)
+            for i in range(start, stop)
+        ]
+    finally:
+        doc.close()
+
+
+def _open_document(pdf: Union[bytes, str]) -> fitz.Document:
+    return fitz.open(pdf) if isinstance(pdf, str) else fitz.open("pdf", pdf)
+
+
+def plan_document(doc: fitz.Document, mode: str, min_count: int,
+                  use_ocr: bool = True) -> List[List[Tuple[str, List[tuple]]]]:
+    """Plans every page of an open document, see `plan_page`."""
+    return [
+        plan_page(*get_page_layout(page, use_ocr=use_ocr), mode, min_count)
+        for page in doc
+    ]
 
-        grouped, paragraphs = GroupPara(chosen, minCount=0)
 
-        if len(paragraphs) == 0:
+def annotate_document(
+    doc: fitz.Document,
+    plans: List[List[Tuple[str, List[tuple]]]],
+    classes: List[Tuple[int, float]],
+    mode: str
+) -> Tuple[List[Tuple[str, int, float]], List[Dict[str, Any]]]:
+    """
+    Highlights every planned unit with its class colour.
+
+    :param doc: The open document, annotated in place.
+    :param plans: Units of each page, from `plan_page`.
+    :param classes: (class_index, score) of every unit, in plan order.
+    :param mode: "paragraphs" or "sentences" (sentences are also underlined).
+    :return: The (text, class_index, score) classifications and one chunk
+             record per unit.
+    """
+    colors = CLASS_COLOR_MAP if mode == "paragraphs" else COLOR_MAP
+    data = []
+    chunks = []
+    results = iter(classes)
+    for page_no, plan in enumerate(plans):
+        if not plan:
             continue
-
-        for j, p in enumerate(paragraphs):
-            class_name = await GetClass(p)
-            data.append((p, class_name[0], class_name[1]))
-            # print("\n'" + class_name + "'")
-            # Just to simulate async call per paragraph
-            for _, para in enumerate(grouped[j]):
-                x0, y0, x1, y1, *_ = para
-                highlight = page.add_highlight_annot(fitz.Rect(x0, y0, x1, y1))
-                highlight.set_colors(
-                    stroke=color_map[int(class_name[0]) % len(color_map)]
-                )
+        page = doc[page_no]
+        for text, rects in plan:
+            class_index, class_score = next(results)
+            data.append((text, class_index, class_score))
+            chunks.append({
+                'page': page_no, 'rects': [list(r) for r in rects],
+                'text': text, 'class': class_index, 'score': class_score
+            })
+            color = colors[int(class_index) % len(colors)]
+            for rect in rects:
+                if mode == "sentences":
+                    underline = page.add_underline_annot(fitz.Rect(rect))
+                    underline.set_colors(stroke=color)
+                    underline.update()
+                highlight = page.add_highlight_annot(fitz.Rect(rect))
+                highlight.set_colors(stroke=color)
                 highlight.update()
-
+    return data, chunks
+
+
+def _save_document(doc: fitz.Document, output: Union[str, BinaryIO], incremental: bool,
+                   garbage: int, deflate: bool) -> None:
+    if incremental:
+        doc.save(output, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+    else:
+        doc.save(output, garbage=garbage, deflate=deflate)
+
+
+async def HighlightPDF(
+    pdf: Union[bytes, str],
+    output: Union[str, BinaryIO],
+    mode: str = "paragraphs",
+    min_count: int = 0,
+    workers: int = 1,
+    concurrency: int = 8,
+    garbage: int = 1,
+    deflate: bool = True,
+    incremental: bool = False,
+    use_ocr: bool = True,
+    tracer: Tracer = None
+) -> Tuple[List[Tuple[str, int, float]], Dict[str, float], List[Dict[str, Any]]]:
+    """
+    Classifies and highlights a whole PDF, saving it once.
+
+    Every page's blocks and words are extracted and split into units first
+    (across `workers` processes by page range when workers > 1, otherwise on
+    the fitz thread), all units are classified concurrently, then annotations
+    are applied in bulk and the document is written straight to `output`.
+    Only the classification requests run on the event loop.
+
+    :param pdf: PDF bytes or a path to the PDF.
+    :param output: Path or writable binary stream the highlighted PDF is saved to.
+    :param mode: "paragraphs" or "sentences", see `plan_page`.
+    :param min_count: Minimum word count of a highlighted unit.
+    :param workers: Number of processes used for extraction.
+    :param concurrency: Maximum classification requests in flight.
+    :param garbage: PyMuPDF garbage collection level used when saving.
+    :param deflate: Compress streams when saving.
+    :param incremental: Append the annotations to the source file instead of
+                        rewriting it. Requires `output` to be the path of `pdf`.
+    :param use_ocr: OCR pages that have no text layer.
+    :param tracer: Optional tracer, each phase gets its own span.
+    :return: A tuple of the (text, class_index, score) classifications,
+             the per-phase timings in seconds and one chunk record per
+             unit ({'page', 'rects', 'text', 'class', 'score'}) locating it
+             in the document.
+    """
+    if incremental and not (isinstance(pdf, str) and output == pdf):
+        raise ValueError("Incremental save requires output to be the source PDF path")
+
+    timings: Dict[str, float] = {}
+
+    loop = asyncio.get_running_loop()
+
+    # Parsing, OCR, annotation and saving are CPU-bound and run off the
+    # event loop, so the server and lease renewals keep running meanwhile.
+    # PyMuPDF is not thread safe, the document is only touched on the fitz thread.
+    doc = None
+    try:
+        with _phase("extract", timings, tracer):
+            doc = await run_in_fitz_thread(_open_document, pdf)
+            page_count = await run_in_fitz_thread(lambda: doc.page_count)
+            if workers > 1 and page_count > 1:
+                step = -(-page_count // workers)
+                ranges = [(s, min(s + step, page_count)) for s in range(0, page_count, step)]
+                with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+                    parts = await asyncio.gather(*[
+                        loop.run_in_executor(pool, plan_page_range, pdf, s, e, mode, min_count, use_ocr)
+                        for s, e in ranges
+                    ])
+                plans = [plan for part in parts for plan in part]
+            else:
+                plans = await run_in_fitz_thread(plan_document, doc, mode, min_count, use_ocr)
+
+        with _phase("classify", timings, tracer):
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def classify(text: str):
+                async with semaphore:
+                    return await GetClass(text)
+
+            units = [unit for plan in plans for unit in plan]
+            classes = await asyncio.gather(*[classify(text) for text, _ in units])
+
+        with _phase("annotate", timings, tracer):
+            data, chunks = await run_in_fitz_thread(annotate_document, doc, plans, classes, mode)
+
+        with _phase("save", timings, tracer):
+            await run_in_fitz_thread(_save_document, doc, output, incremental, garbage, deflate)
+    finally:
+        if doc is not None:
+            await run_in_fitz_thread(doc.close)
+
+    return data, timings, chunks
+
+
+async def HighlightParagraphs(pdf_bytes: bytes, tracer: Tracer = None, use_ocr: bool = True) -> bytes:
     output_stream = io.BytesIO()
-    doc.save(output_stream)
-    doc.close()
-
+    data, _, _ = await HighlightPDF(
+        pdf_bytes, output_stream, mode="paragraphs", min_count=0,
+        use_ocr=use_ocr, tracer=tracer
+    )
     return output_stream.getvalue(), data
 
-# --- Main Highlighting Function ---
 
 async def HighlightSentences(
     pdf_bytes: bytes, 
     min_count: int = 20, 
-    tracer: Tracer = None
+    tracer: Tracer = None,
+    use_ocr: bool = True
 ) -> Tuple[bytes, List[Tuple[str, int, float]]]:
     """
     Highlights and underlines the text in a PDF sentence by sentence, 
@@ -126,99 +355,16 @@ async def HighlightSentences(
     :param pdf_bytes: The byte content of the PDF file.
     :param min_count: The minimum word count required for a sentence segment.
     :param tracer: Optional tracer object (stubbed).
+    :param use_ocr: OCR pages that have no text layer instead of skipping them.
     :return: A tuple containing the modified PDF bytes and a list of 
              (text, class_index, score) classifications.
     """
-    doc = fitz.open("pdf", pdf_bytes)
-    output_data = []
-
-    for page_index, page in enumerate(doc):
-        # 1. Get all words with their bounding boxes
-        # (x0, y0, x1, y1, word, block_no, line_no, word_no)
-        words: List[Tuple[float, float, float, float, str, int, int, int]] = page.get_text("words")
-
-        if not words:
-            continue
-
-        full_page_text = ' '.join(w[4] for w in words)
-        
-        # 2. Simple Sentence Tokenization (non-robust, depends on standard punctuation/spacing)
-        # Split by typical sentence-ending punctuation followed by whitespace.
-        raw_sentences = re.split(r'(?<=[.!?])\s+', full_page_text.strip())
-        
-        # 3. Map sentences back to their constituent words and bounding boxes
-        sentences_info: List[Dict[str, Any]] = []
-        word_index = 0
-        
-        for raw_sentence in raw_sentences:
-            if not raw_sentence.strip():
-                continue
-                
-            sentence_words_tuples = []
-            sentence_text_parts = raw_sentence.split()
-            
-            # Find the words in the global word list that make up this sentence
-            for part in sentence_text_parts:
-                # Simple matching: find the next word in the global list that matches the part
-                # This assumes no words are duplicated immediately or skipped.
-                if word_index < len(words) and words[word_index][4].strip() == part.strip():
-                    sentence_words_tuples.append(words[word_index])
-                    word_index += 1
-                else:
-                    # Fallback for more complex tokenization issues/missing words
-                    # If the full_page_text contains merged words that the simple splitter 
-                    # can't handle, we might skip a word. We'll skip this whole sentence.
-                    print(f"Warning: Failed to match word part '{part}' at index {word_index}. Skipping sentence.")
-                    sentence_words_tuples = []
-                    break
-            
-            if sentence_words_tuples:
-                sentences_info.append({
-                    'text': raw_sentence.strip(),
-                    'words': sentence_words_tuples
-                })
-        
-        # 4. Club Sentences
-        clubbed_chunks = club_sentences_by_word_count(sentences_info, min_count)
-
-        # 5. Classify and Annotate each chunk
-        for chunk in clubbed_chunks:
-            chunk_text = chunk['text']
-            chunk_words = chunk['words']
-            
-            # Call async function to classify the chunk
-            class_index, class_score = await GetClass(chunk_text)
-            output_data.append((chunk_text, class_index, class_score))
-
-            # Determine the color
-            color = COLOR_MAP[class_index % len(COLOR_MAP)]
-
-            # Calculate the overall bounding box for the chunk
-            # The word tuples are (x0, y0, x1, y1, ...)
-            min_x0 = min(w[0] for w in chunk_words)
-            min_y0 = min(w[1] for w in chunk_words)
-            max_x1 = max(w[2] for w in chunk_words)
-            max_y1 = max(w[3] for w in chunk_words)
-            
-            rect = fitz.Rect(min_x0, min_y0, max_x1, max_y1)
-
-            # Apply Underline Annotation (as requested)
-            underline = page.add_underline_annot(rect)
-            underline.set_colors(stroke=color)
-            underline.update()
-            
-            # Apply Highlight Annotation (to provide the color coding)
-            highlight = page.add_highlight_annot(rect)
-            highlight.set_colors(stroke=color)
-            highlight.update()
-
-
-    # 6. Save the modified PDF
     output_stream = io.BytesIO()
-    doc.save(output_stream)
-    doc.close()
-
-    return output_stream.getvalue(), output_data
+    data, _, _ = await HighlightPDF(
+        pdf_bytes, output_stream, mode="sentences", min_count=min_count,
+        use_ocr=use_ocr, tracer=tracer
+    )
+    return output_stream.getvalue(), data
 
 if __name__ == "__main__":
     # --- Example Usage ---
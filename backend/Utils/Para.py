@@ -1,16 +1,32 @@
+import os
 import re
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from Utils.CONFIG import MODEL_MAX_TOKENS, TOKENIZER_LOWERCASE, TOKENIZER_NAME
+
+# Precompiled once, these run for every page of every document
+SEPARATOR_RE = re.compile(r'(\s+|[.;\n])')
+WORD_RE = re.compile(r'\w+')
+# A sentence runs up to terminal punctuation or a line break (or the end of text)
+SENTENCE_RE = re.compile(r'[^.!?\n]*(?:[.!?]+|\n|$)')
+# Whitespace following sentence-ending punctuation
+SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Special tokens the model adds around every chunk ([CLS] ... [SEP])
+SPECIAL_TOKENS = 2
+
 
 def split_paragraph(paragraph: str, max_words: int = 100):
     # Split paragraph into tokens (words and separators)
-    tokens = re.split(r'(\s+|[.;\n])', paragraph)
+    tokens = SEPARATOR_RE.split(paragraph)
     chunks = []
     current_chunk = []
     word_count = 0
 
     for token in tokens:
         # Count words only (ignore whitespace and punctuation)
-        if re.match(r'\w+', token):
+        if WORD_RE.match(token):
             word_count += 1
 
         current_chunk.append(token)
@@ -27,6 +43,162 @@ def split_paragraph(paragraph: str, max_words: int = 100):
 
     return chunks
 
+@lru_cache(maxsize=None)
+def get_tokenizer(name: str = TOKENIZER_NAME):
+    """
+    Loads (once per process) the WordPiece tokenizer of the classification
+    model from its vocab.txt, with truncation and padding disabled so
+    offsets cover the whole text. BERT checkpoints such as bert-tiny ship
+    only the vocabulary, not a tokenizer.json.
+
+    :param name: A Hugging Face model id, a local model directory or a vocab file.
+    """
+    from tokenizers import BertWordPieceTokenizer
+
+    if os.path.isdir(name):
+        vocab_path = os.path.join(name, "vocab.txt")
+    elif os.path.isfile(name):
+        vocab_path = name
+    else:
+        from huggingface_hub import hf_hub_download
+        vocab_path = hf_hub_download(name, "vocab.txt")
+
+    tokenizer = BertWordPieceTokenizer(vocab_path, lowercase=TOKENIZER_LOWERCASE)
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+
+def _split_long_span(
+    offsets: List[Tuple[int, int]], first: int, last: int, budget: int
+) -> List[Tuple[int, int]]:
+    """
+    Splits the tokens first..last (exclusive) of an over-long sentence into
+    runs of at most `budget` tokens, preferring to cut where a new word starts
+    so word pieces of one word stay together.
+    """
+    runs = []
+    while last - first > budget:
+        cut = first + budget
+        while cut > first + 1 and offsets[cut][0] == offsets[cut - 1][1]:
+            cut -= 1
+        if cut == first + 1:
+            cut = first + budget
+        runs.append((first, cut))
+        first = cut
+    runs.append((first, last))
+    return runs
+
+
+def chunk_by_tokens(
+    text: str,
+    max_tokens: int = MODEL_MAX_TOKENS,
+    tokenizer=None
+) -> List[Dict[str, Any]]:
+    """
+    Packs whole sentences into chunks that fit the model's real context
+    length, measured in wordpiece tokens rather than words.
+
+    The text is tokenized once; sentence boundaries are mapped onto the
+    token offsets in a single linear pass. A sentence longer than the budget
+    is split at word boundaries.
+
+    :param text: The text to chunk.
+    :param max_tokens: The model's maximum sequence length, including the
+                       [CLS] and [SEP] tokens.
+    :param tokenizer: A `tokenizers.Tokenizer`, defaults to the model's one.
+    :return: List of chunks, each a dict with 'text', 'start', 'end'
+             (character span in `text`) and 'tokens' (token count).
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    budget = max(1, max_tokens - SPECIAL_TOKENS)
+    offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+    if not offsets:
+        return []
+
+    # 1. Sentence spans expressed as token index ranges [first, last)
+    sentences: List[Tuple[int, int]] = []
+    t = 0
+    for match in SENTENCE_RE.finditer(text):
+        end = match.end()
+        first = t
+        while t < len(offsets) and offsets[t][0] < end:
+            t += 1
+        if t > first:
+            sentences.extend(_split_long_span(offsets, first, t, budget))
+        if t == len(offsets):
+            break
+
+    # 2. Greedily pack sentences up to the token budget
+    chunks = []
+    chunk_first, chunk_last = sentences[0]
+    for first, last in sentences[1:]:
+        if last - chunk_first <= budget:
+            chunk_last = last
+            continue
+        chunks.append((chunk_first, chunk_last))
+        chunk_first, chunk_last = first, last
+    chunks.append((chunk_first, chunk_last))
+
+    result = []
+    for first, last in chunks:
+        start, end = offsets[first][0], offsets[last - 1][1]
+        result.append({
+            'text': text[start:end],
+            'start': start,
+            'end': end,
+            'tokens': last - first
+        })
+    return result
+
+def align_sentences_to_words(words: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Splits a page into sentences and maps each one to its word tuples.
+
+    The page text is the words joined by single spaces, so every word's
+    character offset is known up front. Sentence spans from
+    SENTENCE_BREAK_RE are then matched to words with one pointer walking
+    the offsets: every word lands in exactly one sentence and nothing is
+    discarded on a mismatch.
+
+    :param words: fitz word tuples (x0, y0, x1, y1, word, block, line, word_no).
+    :return: List of dictionaries with 'text' (str) and 'words' (list of
+             fitz word tuples), covering all words in order.
+    """
+    if not words:
+        return []
+
+    texts = [w[4] for w in words]
+    page_text = ' '.join(texts)
+
+    # Character offset at which each word starts
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += len(text) + 1
+
+    # Sentence end offsets, the last sentence runs to the end of the page
+    ends = [m.start() for m in SENTENCE_BREAK_RE.finditer(page_text)]
+    ends.append(len(page_text))
+
+    sentences_info = []
+    first = 0
+    sentence_start = 0
+    for end in ends:
+        last = first
+        while last < len(words) and starts[last] < end:
+            last += 1
+        if last > first:
+            sentences_info.append({
+                'text': page_text[sentence_start:end].strip(),
+                'words': words[first:last]
+            })
+        first = last
+        sentence_start = end
+
+    return sentences_info
+
 # --- Core Sentence Clubbing Function ---
 
 def club_sentences_by_word_count(
@@ -37,6 +209,9 @@ def club_sentences_by_word_count(
     Clubs multiple sentences together if the combined word count is less than 
     min_count, only stopping when the minimum is met or exceeded.
 
+    Word counts are tracked incrementally and each chunk's text is joined
+    once, so the whole pass is linear in the number of words.
+
     :param sentences_info: List of dictionaries, each containing 'text' (str)
                            and 'words' (list of fitz word tuples).
     :param min_count: The minimum desired word count for a chunk.
@@ -46,35 +221,33 @@ def club_sentences_by_word_count(
         return []
 
     final_chunks = []
-    current_chunk = None
+    current_texts: List[str] = []
+    current_words: List = []
+    current_word_count = 0
 
     for sentence_info in sentences_info:
         sentence_text = sentence_info['text']
-        sentence_words = sentence_info['words']
-        
-        # Calculate current chunk's word count (assuming simple split is sufficient)
-        current_word_count = len(current_chunk['text'].split()) if current_chunk else 0
-
-        # If no chunk yet, start one.
-        if current_chunk is None:
-            current_chunk = {
-                'text': sentence_text,
-                'words': sentence_words
-            }
-        # If the current chunk is too small, try to club the new sentence into it.
-        elif current_word_count < min_count:
-            current_chunk['text'] += ' ' + sentence_text
-            current_chunk['words'].extend(sentence_words)
+
         # If the current chunk is already big enough, finalize it and start a new one.
-        else:
-            final_chunks.append(current_chunk)
-            current_chunk = {
-                'text': sentence_text,
-                'words': sentence_words
-            }
+        if current_texts and current_word_count >= min_count:
+            final_chunks.append({
+                'text': ' '.join(current_texts),
+                'words': current_words
+            })
+            current_texts = []
+            current_words = []
+            current_word_count = 0
+
+        # Otherwise club the sentence into the current chunk, keeping a running word count
+        current_texts.append(sentence_text)
+        current_words.extend(sentence_info['words'])
+        current_word_count += len(sentence_text.split())
 
     # Add the last pending chunk
-    if current_chunk:
-        final_chunks.append(current_chunk)
-        
+    if current_texts:
+        final_chunks.append({
+            'text': ' '.join(current_texts),
+            'words': current_words
+        })
+
     return final_chunks
@@ -1,28 +1,84 @@
 import base64
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 import os
 import pickle
-from typing import List, Set, Dict, Tuple
-from dataclasses import dataclass
+import sqlite3
+from typing import Callable, Iterator, List, NamedTuple, Optional, Set, Dict, Tuple
 import hashlib
 from pathlib import Path
 import re
+from xml.sax.saxutils import escape
 
 import fitz
+import numpy as np
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_JUSTIFY
-from reportlab.lib.colors import yellow, red, orange, HexColor
+from reportlab.lib.colors import HexColor
 
 from Tesseract.OCR import ocr_from_base64
+from Utils.Fitz import in_fitz_thread
 
 
 CACHE_DIR = Path("plagiarism_cache")
 CACHE_DIR.mkdir(exist_ok=True)
-DOC_REP_FILE = CACHE_DIR / "doc_reps.pkl"
+INDEX_DB = CACHE_DIR / "index.sqlite3"
+# Pickle cache of earlier versions, imported into the store once and renamed
+# Pickle caches of earlier versions, newest first
+LEGACY_REP_FILE_NAMES = ("doc_reps_v2.pkl", "doc_reps.pkl")
+# Representations kept in memory after being read from the store
+REP_CACHE_SIZE = 256
+# Documents stored after the mmap'd index snapshot before it is rebuilt
+INDEX_REBUILD_DOCS = 500
+# Parameters per SQLite statement
+SQL_BATCH = 900
+# Processes extracting and fingerprinting PDFs in process_documents
+INGEST_WORKERS = 4
 SHINGLE_SIZE = 5
 MIN_TOKEN_LEN = 2
+# LSH banding: documents become candidates when one band of ROWS signature
+# values matches. Pairs above roughly (1 / BANDS) ** (1 / ROWS) Jaccard
+# (about 0.42 here) are found with high probability.
+LSH_BANDS = 32
+LSH_ROWS = 4
+MINHASH_SEED = 42
+MINHASH_CHUNK = 4096
+MAX_HASH = np.uint64(np.iinfo(np.uint64).max)
+FINGERPRINT_BASE = np.uint64(1099511628211)
+FINGERPRINT_MIX = np.uint64(0xff51afd7ed558ccd)
+# Winnowing window: matches of WINNOW_WINDOW + SHINGLE_SIZE - 1 tokens or more
+# are always detected
+WINNOW_WINDOW = 4
+# Characters of text per report paragraph (reportlab slows down on huge ones)
+REPORT_CHUNK_CHARS = 3000
+# Colour of the matched words highlighted on the source PDF
+ANNOTATION_COLOR = (1, 1, 0)
+
+# Report styles are built once and shared by every report
+_SAMPLE_STYLES = getSampleStyleSheet()
+REPORT_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_SAMPLE_STYLES['Heading1'],
+    fontSize=16,
+    textColor=HexColor('#1a1a1a'),
+    spaceAfter=30
+)
+REPORT_INFO_STYLE = _SAMPLE_STYLES['Normal']
+REPORT_HEADING_STYLE = _SAMPLE_STYLES['Heading2']
+REPORT_TEXT_STYLE = ParagraphStyle(
+    'Highlighted',
+    parent=_SAMPLE_STYLES['Normal'],
+    fontSize=10,
+    alignment=TA_JUSTIFY,
+    leading=14
+)
+HIGHLIGHT_OPEN = '<font backColor="yellow"><b>'
+HIGHLIGHT_CLOSE = '</b></font>'
+
 
 def normalize_text(text: str) -> str:
     text = text.lower()
@@ -36,253 +92,1267 @@ def tokenize(text: str) -> List:
     return tokens
 
 
-def shingles_from_tokens(tokens: List[str], k: int) -> Set:
-    if k <= 0:
-        return set()
-    out = set()
-    for i in range(max(0, len(tokens) - k + 1)):
-        sh = " ".join(tokens[i : i + k])
-        h = hashlib.sha1(sh.encode("utf-8")).hexdigest()
-        out.add(h)
-    return out
+@lru_cache(maxsize=1 << 20)
+def token_hash(token: str) -> int:
+    """Stable 64-bit hash of a token (Python's hash() changes between runs)."""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
 
 
-def shingles_from_tokens_with_positions(tokens: List[str], k: int) -> Dict[str, List[int]]:
-    """Returns dict of shingle_hash -> list of starting token positions"""
-    if k <= 0:
-        return {}
-    out = defaultdict(list)
-    for i in range(max(0, len(tokens) - k + 1)):
-        sh = " ".join(tokens[i : i + k])
-        h = hashlib.sha1(sh.encode("utf-8")).hexdigest()
-        out[h].append(i)
-    return dict(out)
+def fingerprints_by_position(tokens: List[str], k: int) -> np.ndarray:
+    """
+    64-bit fingerprint of the k-shingle starting at every token position.
+
+    Tokens are hashed once each, then combined with a polynomial rolling hash
+    over all windows at once (k vectorised steps, wrapping mod 2^64) and
+    finally mixed so every bit depends on the whole shingle.
+    """
+    n = len(tokens) - k + 1
+    if k <= 0 or n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.fromiter((token_hash(t) for t in tokens), dtype=np.uint64, count=len(tokens))
+    fp = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        fp = fp * FINGERPRINT_BASE + hashes[j:j + n]
+    fp ^= fp >> np.uint64(33)
+    fp *= FINGERPRINT_MIX
+    fp ^= fp >> np.uint64(29)
+    return fp
+
+
+def shingles_from_tokens(tokens: List[str], k: int) -> np.ndarray:
+    """Sorted array of the distinct k-shingle fingerprints of a document."""
+    return np.unique(fingerprints_by_position(tokens, k))
+
+
+def matching_intervals(position_fps: np.ndarray, positions: np.ndarray,
+                       common: np.ndarray, k: int) -> List[Tuple[int, int]]:
+    """
+    Token spans covered by the shingles of a document found in `common`,
+    merged into disjoint intervals.
+
+    :param position_fps: The document's fingerprints, by position.
+    :param positions: Their token positions, ascending.
+    :param common: Sorted fingerprints shared with the other document.
+    :param k: Shingle size.
+    :return: Sorted (start, end) token intervals, end excluded.
+    """
+    starts = positions[np.isin(position_fps, common, assume_unique=False)]
+    if not len(starts):
+        return []
+    ends = np.maximum.accumulate(starts + k)
+    # A new interval starts where a shingle begins after everything before it ended
+    first = np.flatnonzero(np.r_[True, starts[1:] > ends[:-1]])
+    last = np.r_[first[1:] - 1, len(starts) - 1]
+    return list(zip(starts[first].tolist(), ends[last].tolist()))
+
+
+def highlighted_paragraphs(tokens: List[str], intervals: List[Tuple[int, int]],
+                           max_chars: int = REPORT_CHUNK_CHARS) -> List[str]:
+    """
+    Paragraph markup of a document's tokens with the matched intervals
+    highlighted. Paragraphs break between tokens every max_chars characters
+    of text, and a highlight crossing a break is closed and reopened, so no
+    tag is ever split.
+
+    :param tokens: The document's tokens.
+    :param intervals: Sorted, disjoint (start, end) token intervals to highlight.
+    :param max_chars: Characters of text per paragraph.
+    :return: One reportlab Paragraph markup string per paragraph.
+    """
+    if not tokens:
+        return []
+    n = len(tokens)
+    ends = np.cumsum([len(t) + 1 for t in tokens])
+    breaks = set((np.flatnonzero(np.diff((ends - 1) // max_chars)) + 1).tolist())
+    # Every piece between two consecutive marks is in one paragraph and either fully matched or not
+    marks = sorted({0, n} | breaks | {p for span in intervals for p in span if 0 < p < n})
 
+    paragraphs, parts = [], []
+    spans = iter(intervals)
+    span = next(spans, None)
+    for start, end in zip(marks, marks[1:]):
+        if start in breaks:
+            paragraphs.append(" ".join(parts))
+            parts = []
+        while span is not None and span[1] <= start:
+            span = next(spans, None)
+        text = escape(" ".join(tokens[start:end]))
+        parts.append(f"{HIGHLIGHT_OPEN}{text}{HIGHLIGHT_CLOSE}" if span is not None and span[0] <= start else text)
+    paragraphs.append(" ".join(parts))
+    return paragraphs
 
-def jaccard_similarity(set_a: Set[str], set_b: Set[str]) -> float:
-    if not set_a and not set_b:
+
+def winnow(fingerprints: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Winnowing (Schleimer et al., MOSS): keeps the minimum fingerprint of every
+    `window` consecutive shingles, the rightmost one on ties, once per
+    position. Any match of at least window + k - 1 tokens shares a selected
+    fingerprint, while only about 2 / (window + 1) of the shingles are kept.
+
+    :param fingerprints: Fingerprints by position, from fingerprints_by_position.
+    :param window: Number of consecutive shingles per window.
+    :return: (selected fingerprints, their token positions), by position.
+    """
+    if len(fingerprints) == 0:
+        return fingerprints, np.empty(0, dtype=np.int64)
+    if window <= 1:
+        return fingerprints, np.arange(len(fingerprints))
+    if len(fingerprints) < window:
+        window = len(fingerprints)
+    windows = np.lib.stride_tricks.sliding_window_view(fingerprints, window)
+    rightmost_min = window - 1 - np.argmin(windows[:, ::-1], axis=1)
+    positions = np.unique(np.arange(len(windows)) + rightmost_min)
+    return fingerprints[positions], positions
+
+
+def fingerprint_tokens(tokens: List[str], k: int, mode: str = "shingles",
+                       window: int = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fingerprints a token list for the index.
+
+    :param tokens: Normalised tokens of the document.
+    :param k: Shingle size.
+    :param mode: "shingles" keeps every shingle, "winnowing" the window minima.
+    :param window: Winnowing window, WINNOW_WINDOW if None.
+    :return: (sorted distinct fingerprints, kept fingerprints by position,
+        their token positions).
+    """
+    by_position = fingerprints_by_position(tokens, k)
+    if mode == "winnowing":
+        kept, positions = winnow(by_position, window or WINNOW_WINDOW)
+    elif mode == "shingles":
+        kept, positions = by_position, np.arange(len(by_position))
+    else:
+        raise ValueError(f"Unknown fingerprint mode: {mode}")
+    return np.unique(kept), kept, positions
+
+
+def jaccard_similarity(shingles_a: np.ndarray, shingles_b: np.ndarray) -> float:
+    """Jaccard similarity of two sorted fingerprint arrays, by a vectorised merge."""
+    if not len(shingles_a) and not len(shingles_b):
         return 1.0
-    if not set_a or not set_b:
+    if not len(shingles_a) or not len(shingles_b):
         return 0.0
-    inter = len(set_a & set_b)
-    union = len(set_a | set_b)
+    inter = np.intersect1d(shingles_a, shingles_b, assume_unique=True).size
+    union = len(shingles_a) + len(shingles_b) - inter
     return inter / union
 
 
-@dataclass
+@lru_cache(maxsize=None)
+def _minhash_params(num_perm: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(MINHASH_SEED)
+    a = rng.integers(1, MAX_HASH, size=num_perm, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, MAX_HASH, size=num_perm, dtype=np.uint64, endpoint=True)
+    return a, b
+
+
+def minhash_signature(values: np.ndarray, num_perm: int) -> np.ndarray:
+    """
+    MinHash signature of a set of 64-bit shingle hashes: the minimum of each
+    of num_perm hash functions (a * x + b mod 2^64, then mixed) over the set.
+    The share of equal positions between two signatures estimates Jaccard.
+    """
+    a, b = _minhash_params(num_perm)
+    signature = np.full(num_perm, MAX_HASH, dtype=np.uint64)
+    for i in range(0, len(values), MINHASH_CHUNK):
+        chunk = values[i:i + MINHASH_CHUNK]
+        hashed = chunk[None, :] * a[:, None] + b[:, None]
+        hashed ^= hashed >> np.uint64(31)
+        np.minimum(signature, hashed.min(axis=1), out=signature)
+    return signature
+
+
+def estimate_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+
+class LSHIndex:
+    """
+    Banding index over MinHash signatures. Each signature is cut into
+    `bands` bands of `rows` values; documents sharing any band are returned
+    as candidates, so a query touches a few buckets instead of the corpus.
+    More rows per band raise the similarity threshold, more bands lower it.
+
+    Given a RepresentationStore, the buckets are rows of its `lsh_bands`
+    table: nothing is loaded at startup and documents added by other
+    processes are candidates as soon as they are committed. Without one,
+    the buckets are kept in memory.
+    """
+
+    def __init__(self, bands: int = LSH_BANDS, rows: int = LSH_ROWS, store: "RepresentationStore" = None):
+        self.bands = bands
+        self.rows = rows
+        self.store = store
+        self.buckets: List[Dict[int, Set[str]]] = [defaultdict(set) for _ in range(bands)] if store is None else []
+
+    @property
+    def num_perm(self) -> int:
+        return self.bands * self.rows
+
+    @property
+    def threshold(self) -> float:
+        """Jaccard similarity at which a pair becomes a candidate with probability ~1/2."""
+        return (1 / self.bands) ** (1 / self.rows)
+
+    @property
+    def config(self) -> str:
+        return f"{self.bands}x{self.rows}"
+
+    def band_keys(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        """(band, bucket key) pairs of a signature, keys hashed to signed 64-bit integers."""
+        keys = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                     digest_size=8).digest()
+            keys.append((band, int.from_bytes(digest, "little", signed=True)))
+        return keys
+
+    def add(self, doc_id: str, signature: np.ndarray):
+        if self.store is not None:
+            self.store.add_bands(doc_id, self.band_keys(signature))
+            return
+        for band, key in self.band_keys(signature):
+            self.buckets[band][key].add(doc_id)
+
+    def query(self, signature: np.ndarray) -> Set[str]:
+        if self.store is not None:
+            return self.store.band_candidates(self.band_keys(signature))
+        candidates: Set[str] = set()
+        for band, key in self.band_keys(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+        return candidates
+
+
 class DocRepresentation:
-    doc_id: str
-    path: str
-    shingles: Set[str]
-    token_count: int
-    raw_text_excerpt: str
-    full_text: str = ""  # Store full text for visualization
-    tokens: List[str] = None  # Store tokens for position mapping
-    
+    """
+    Hot record of an indexed document: everything queries and matching
+    need. The full text and tokens are only read for reports, see DocText.
+    """
+    __slots__ = ("doc_id", "path", "shingles", "token_count", "raw_text_excerpt",
+                 "signature", "positions", "position_fps")
 
-def extract_text_and_ocr_from_pdf(path: str) -> str:
+    def __init__(self, doc_id: str, path: str, shingles: np.ndarray, token_count: int,
+                 raw_text_excerpt: str, signature: np.ndarray = None,
+                 positions: np.ndarray = None, position_fps: np.ndarray = None):
+        self.doc_id = doc_id
+        self.path = path
+        self.shingles = shingles  # sorted distinct uint64 fingerprints
+        self.token_count = token_count
+        self.raw_text_excerpt = raw_text_excerpt
+        self.signature = signature  # MinHash signature for the LSH index
+        self.positions = positions  # token positions of the kept fingerprints
+        self.position_fps = position_fps  # the kept fingerprints, by position
+
+
+class DocText(NamedTuple):
+    """Cold part of a representation, loaded on demand by RepresentationStore.text."""
+    full_text: str
+    tokens: List[str]
+
+
+def _read_pages(path: str, with_text: bool = True) -> List[Tuple[str, List[bytes]]]:
+    """(text layer, embedded images) of every page. Runs on the fitz thread."""
+    pages = []
+    with fitz.open(path) as doc:
+        for page in doc:
+            images = [doc.extract_image(img_meta[0])["image"] for img_meta in page.get_images(full=True)]
+            pages.append(((page.get_text("text") or "") if with_text else "", images))
+    return pages
+
+
+def _read_text_layer(text_path: str) -> Optional[List[str]]:
+    """Page texts written at ingest by Utils.Ingest, None if the file is gone."""
+    try:
+        with open(text_path, encoding="utf-8") as f:
+            return f.read().split("\f")
+    except (OSError, TypeError):
+        return None
+
+
+def extract_text_and_ocr_from_pdf(path: str, text_path: str = None) -> str:
+    """
+    Text of a PDF, with the text of its embedded images OCRed. The text
+    layer extracted at ingest is reused when `text_path` is given, only the
+    images are then read from the PDF.
+    """
     texts = []
-    doc = fitz.open(path)
-    for page in doc:
-        page_text = page.get_text("text") or ""
+    text_layer = _read_text_layer(text_path) if text_path else None
+    # Only the PDF parsing is serialised, the images are OCRed on the calling thread
+    pages = in_fitz_thread(_read_pages, path, with_text=text_layer is None)
+    if text_layer is not None and len(text_layer) == len(pages):
+        pages = [(page_text, images) for page_text, (_, images) in zip(text_layer, pages)]
+    elif text_layer is not None:
+        pages = in_fitz_thread(_read_pages, path)
+    for page_text, images in pages:
         texts.append(page_text)
 
-        image_list = page.get_images(full=True)
-        if image_list:
-            for img_meta in image_list:
-                xref = img_meta[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                b64 = base64.b64encode(image_bytes).decode("utf-8")
-                try:
-                    ocr_text = ocr_from_base64(b64)
-                    if ocr_text.strip():
-                        texts.append(ocr_text)
-                except Exception as e:
-                    print(f"[WARN] OCR failed on image in {path}: {e}")
-
-    doc.close()
+        for image_bytes in images:
+            b64 = base64.b64encode(image_bytes).decode("utf-8")
+            try:
+                ocr_text = ocr_from_base64(b64)
+                if ocr_text.strip():
+                    texts.append(ocr_text)
+            except Exception as e:
+                print(f"[WARN] OCR failed on image in {path}: {e}")
+
     return "\n".join(texts)
 
 
-def load_cached_representations() -> Dict[str, DocRepresentation]:
-    if DOC_REP_FILE.exists():
-        with open(DOC_REP_FILE, "rb") as f:
-            return pickle.load(f)
-    return {}
+def _build_representation(path: str, doc_id: str, shingle_size: int, mode: str,
+                          window: int, num_perm: int, text_path: str = None) -> Tuple[DocRepresentation, DocText]:
+    """
+    Extracts, normalises and fingerprints one PDF. Kept at module level so
+    process pools can run it; nothing here touches the store.
+    """
+    print(f"[INFO] Processing: {path}")
+    full_text = extract_text_and_ocr_from_pdf(path, text_path)
+    tokens = tokenize(normalize_text(full_text))
+    shingles, position_fps, positions = fingerprint_tokens(tokens, shingle_size, mode, window)
+    excerpt = (full_text[:400] + "...") if len(full_text) > 400 else full_text
+
+    rep = DocRepresentation(
+        doc_id=doc_id,
+        path=path,
+        shingles=shingles,
+        token_count=len(tokens),
+        raw_text_excerpt=excerpt,
+        signature=minhash_signature(shingles, num_perm),
+        positions=positions.astype(np.int64, copy=False),
+        position_fps=position_fps
+    )
+    return rep, DocText(full_text, tokens)
+
+
+def store_file(mode: str = "shingles", window: int = WINNOW_WINDOW) -> Path:
+    """Representations of each fingerprint mode are stored separately."""
+    if mode == "shingles":
+        return INDEX_DB
+    return INDEX_DB.with_name(f"{INDEX_DB.stem}_{mode}{window}{INDEX_DB.suffix}")
+
+
+def legacy_cache_files(mode: str = "shingles", window: int = WINNOW_WINDOW) -> List[Path]:
+    """Pickle caches the same mode was kept in before the SQLite store, next to it, newest first."""
+    paths = [INDEX_DB.with_name(name) for name in LEGACY_REP_FILE_NAMES]
+    if mode == "shingles":
+        return paths
+    return [path.with_name(f"{path.stem}_{mode}{window}{path.suffix}") for path in paths]
+
+
+class _LegacyRepresentation:
+    """Attribute bag standing in for the dataclass the pickle caches were written with."""
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str):
+        if name == "DocRepresentation":
+            return _LegacyRepresentation
+        return super().find_class(module, name)
+
+
+def load_legacy_representations(path: Path) -> Dict[str, "_LegacyRepresentation"]:
+    """Reads a pickle cache of earlier versions, an empty dict if there is none."""
+    if not path.exists():
+        return {}
+    with open(path, "rb") as f:
+        return _LegacyUnpickler(f).load()
+
+
+def _to_blob(array: np.ndarray) -> bytes:
+    return None if array is None else array.tobytes()
+
+
+def _from_blob(blob: bytes, dtype) -> np.ndarray:
+    return None if blob is None else np.frombuffer(blob, dtype=dtype)
+
+
+class RepresentationStore(Mapping):
+    """
+    SQLite-backed mapping of doc_id -> DocRepresentation.
+
+    Every document is one row, written in its own transaction, so adding a
+    document costs O(document) instead of rewriting the whole corpus. The
+    row's fingerprint array doubles as the document's postings, which
+    ShingleIndex turns into an inverted index. Rows are read only when a
+    representation is asked for, and the last few are kept in memory.
+
+    The full text and tokens live in a separate `texts` table, so the hot
+    rows stay small and the texts are read only when a report needs them.
+    The LSH buckets of every document are rows of `lsh_bands`, written in
+    the same transaction as the document. Removed documents are listed in
+    `removed`, so inverted index snapshots still holding their postings can
+    skip them.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS docs (
+            ordinal INTEGER PRIMARY KEY AUTOINCREMENT,
+            doc_id TEXT UNIQUE NOT NULL,
+            path TEXT NOT NULL,
+            token_count INTEGER NOT NULL,
+            excerpt TEXT NOT NULL,
+            shingles BLOB NOT NULL,
+            signature BLOB,
+            positions BLOB,
+            position_fps BLOB
+        );
+        CREATE TABLE IF NOT EXISTS texts (
+            ordinal INTEGER PRIMARY KEY,
+            full_text TEXT NOT NULL,
+            tokens TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS lsh_bands (
+            band INTEGER NOT NULL,
+            key INTEGER NOT NULL,
+            ordinal INTEGER NOT NULL,
+            PRIMARY KEY (band, key, ordinal)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS removed (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            ordinal INTEGER NOT NULL
+        );
+        DROP TABLE IF EXISTS postings;
+    """
+
+    def __init__(self, path: Path, cache_size: int = REP_CACHE_SIZE):
+        self.path = Path(path)
+        # Workers share one store behind the caller's lock, from several threads
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL stays consistent without a sync per transaction
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._split_texts()
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, DocRepresentation]" = OrderedDict()
+
+    def _split_texts(self):
+        """Moves the texts of stores written before the hot/cold split to their table."""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(docs)")}
+        if "full_text" not in columns:
+            return
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO texts SELECT ordinal, full_text, tokens FROM docs")
+            self.conn.execute("ALTER TABLE docs DROP COLUMN full_text")
+            self.conn.execute("ALTER TABLE docs DROP COLUMN tokens")
+        self.conn.execute("VACUUM")
+
+    def __contains__(self, doc_id) -> bool:
+        # Not answered from the cache, another connection may have removed it
+        return self.conn.execute("SELECT 1 FROM docs WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def __getitem__(self, doc_id: str) -> DocRepresentation:
+        if doc_id in self._cache:
+            self._cache.move_to_end(doc_id)
+            return self._cache[doc_id]
+        row = self.conn.execute(
+            "SELECT doc_id, path, shingles, token_count, excerpt, signature, positions, position_fps "
+            "FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is None:
+            raise KeyError(doc_id)
+        rep = DocRepresentation(
+            doc_id=row[0],
+            path=row[1],
+            shingles=_from_blob(row[2], np.uint64),
+            token_count=row[3],
+            raw_text_excerpt=row[4],
+            signature=_from_blob(row[5], np.uint64),
+            positions=_from_blob(row[6], np.int64),
+            position_fps=_from_blob(row[7], np.uint64)
+        )
+        self._remember(rep)
+        return rep
+
+    def __iter__(self) -> Iterator[str]:
+        return (row[0] for row in self.conn.execute("SELECT doc_id FROM docs ORDER BY ordinal"))
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def _remember(self, rep: DocRepresentation):
+        self._cache[rep.doc_id] = rep
+        self._cache.move_to_end(rep.doc_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def add(self, rep: DocRepresentation, text: DocText) -> int:
+        """Writes a representation and its text, and returns its ordinal."""
+        return self.add_many([rep], [text])[0]
+
+    def add_many(self, reps: List[DocRepresentation], texts: List[DocText],
+                 bands: List[List[Tuple[int, int]]] = None) -> List[int]:
+        """
+        Writes representations, their texts and their LSH buckets in a
+        single transaction and returns their ordinals.
+        """
+        ordinals = []
+        with self.conn:
+            for i, (rep, text) in enumerate(zip(reps, texts)):
+                cursor = self.conn.execute(
+                    "INSERT INTO docs (doc_id, path, token_count, excerpt, shingles, signature, "
+                    "positions, position_fps) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (rep.doc_id, rep.path, rep.token_count, rep.raw_text_excerpt, _to_blob(rep.shingles),
+                     _to_blob(rep.signature), _to_blob(rep.positions), _to_blob(rep.position_fps)))
+                self.conn.execute("INSERT INTO texts (ordinal, full_text, tokens) VALUES (?, ?, ?)",
+                                  (cursor.lastrowid, text.full_text, " ".join(text.tokens)))
+                if bands:
+                    self.conn.executemany("INSERT OR IGNORE INTO lsh_bands (band, key, ordinal) VALUES (?, ?, ?)",
+                                          [(band, key, cursor.lastrowid) for band, key in bands[i]])
+                ordinals.append(cursor.lastrowid)
+        for rep in reps:
+            self._remember(rep)
+        return ordinals
+
+    def remove(self, doc_ids, bands: Dict[str, List[Tuple[int, int]]] = None) -> int:
+        """
+        Deletes documents with their texts and LSH buckets in one transaction
+        and returns how many were stored. Ordinals are never reused, the
+        removed ones are recorded for ShingleIndex.
+
+        :param doc_ids: Documents to delete, unknown ones are ignored.
+        :param bands: The (band, key) pairs of each document, so its buckets
+            are deleted by key. Documents without are looked up by ordinal,
+            which scans the bucket table.
+        """
+        bands = bands or {}
+        found = self.ordinals(doc_ids)
+        with self.conn:
+            keyed = [(band, key, ordinal) for doc_id, ordinal in found.items() for band, key in bands.get(doc_id, ())]
+            self.conn.executemany("DELETE FROM lsh_bands WHERE band = ? AND key = ? AND ordinal = ?", keyed)
+            unkeyed = [ordinal for doc_id, ordinal in found.items() if doc_id not in bands]
+            for i in range(0, len(unkeyed), SQL_BATCH):
+                batch = unkeyed[i:i + SQL_BATCH]
+                self.conn.execute(f"DELETE FROM lsh_bands WHERE ordinal IN ({','.join('?' * len(batch))})", batch)
+            ordinals = [(ordinal,) for ordinal in found.values()]
+            self.conn.executemany("DELETE FROM texts WHERE ordinal = ?", ordinals)
+            self.conn.executemany("DELETE FROM docs WHERE ordinal = ?", ordinals)
+            self.conn.executemany("INSERT INTO removed (ordinal) VALUES (?)", ordinals)
+        for doc_id in found:
+            self._cache.pop(doc_id, None)
+        return len(found)
+
+    def removed_since(self, seq: int) -> Tuple[int, List[int]]:
+        """(last seq, ordinals) of the documents removed after `seq`."""
+        rows = self.conn.execute("SELECT seq, ordinal FROM removed WHERE seq > ? ORDER BY seq", (seq,)).fetchall()
+        return (rows[-1][0] if rows else seq), [ordinal for _, ordinal in rows]
+
+    def text(self, doc_id: str) -> DocText:
+        """Full text and tokens of a document, read from disk on every call."""
+        row = self.conn.execute(
+            "SELECT full_text, tokens FROM texts JOIN docs USING (ordinal) WHERE doc_id = ?",
+            (doc_id,)).fetchone()
+        if row is None:
+            raise KeyError(doc_id)
+        return DocText(row[0], row[1].split())
+
+    def signatures(self) -> Iterator[Tuple[str, np.ndarray]]:
+        """(doc_id, MinHash signature) of every document, without loading the rest."""
+        for doc_id, blob in self.conn.execute("SELECT doc_id, signature FROM docs ORDER BY ordinal"):
+            yield doc_id, _from_blob(blob, np.uint64)
+
+    def set_signature(self, doc_id: str, signature: np.ndarray):
+        with self.conn:
+            self.conn.execute("UPDATE docs SET signature = ? WHERE doc_id = ?", (_to_blob(signature), doc_id))
+        if doc_id in self._cache:
+            self._cache[doc_id].signature = signature
+
+    def add_bands(self, doc_id: str, keys: List[Tuple[int, int]]):
+        """Puts a stored document in the LSH buckets of its (band, key) pairs."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO lsh_bands (band, key, ordinal) SELECT ?, ?, ordinal FROM docs WHERE doc_id = ?",
+                [(band, key, doc_id) for band, key in keys])
+
+    def band_candidates(self, keys: List[Tuple[int, int]]) -> Set[str]:
+        """doc_ids sharing any of the (band, key) buckets, one index seek per band."""
+        candidates: Set[str] = set()
+        for band, key in keys:
+            candidates.update(row[0] for row in self.conn.execute(
+                "SELECT doc_id FROM lsh_bands JOIN docs USING (ordinal) WHERE band = ? AND key = ?", (band, key)))
+        return candidates
+
+    def lsh_config(self) -> Optional[str]:
+        """LSH settings the stored buckets were written with, None before any were."""
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'lsh'").fetchone()
+        return row[0] if row else None
+
+    def replace_bands(self, config: str, bands: Dict[str, List[Tuple[int, int]]]):
+        """Swaps every LSH bucket for ones written with other settings, in one transaction."""
+        with self.conn:
+            self.conn.execute("DELETE FROM lsh_bands")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO lsh_bands (band, key, ordinal) SELECT ?, ?, ordinal FROM docs WHERE doc_id = ?",
+                [(band, key, doc_id) for doc_id, keys in bands.items() for band, key in keys])
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('lsh', ?)", (config,))
+
+    def doc_ids(self, ordinals) -> Dict[int, str]:
+        """Maps document ordinals to doc_ids."""
+        ordinals = [int(o) for o in ordinals]
+        out = {}
+        for i in range(0, len(ordinals), SQL_BATCH):
+            batch = ordinals[i:i + SQL_BATCH]
+            out.update(self.conn.execute(
+                f"SELECT ordinal, doc_id FROM docs WHERE ordinal IN ({','.join('?' * len(batch))})",
+                batch).fetchall())
+        return out
+
+    def ordinals(self, doc_ids) -> Dict[str, int]:
+        """Maps doc_ids to document ordinals."""
+        doc_ids = list(doc_ids)
+        out = {}
+        for i in range(0, len(doc_ids), SQL_BATCH):
+            batch = doc_ids[i:i + SQL_BATCH]
+            out.update(self.conn.execute(
+                f"SELECT doc_id, ordinal FROM docs WHERE doc_id IN ({','.join('?' * len(batch))})",
+                batch).fetchall())
+        return out
+
+    def paths(self, ordinals) -> Dict[int, Tuple[str, str]]:
+        """Maps document ordinals to (doc_id, path)."""
+        ordinals = [int(o) for o in ordinals]
+        out = {}
+        for i in range(0, len(ordinals), SQL_BATCH):
+            batch = ordinals[i:i + SQL_BATCH]
+            for ordinal, doc_id, path in self.conn.execute(
+                    f"SELECT ordinal, doc_id, path FROM docs WHERE ordinal IN ({','.join('?' * len(batch))})",
+                    batch):
+                out[ordinal] = (doc_id, path)
+        return out
+
+    def max_ordinal(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(ordinal), 0) FROM docs").fetchone()[0]
 
+    def postings_between(self, after: int, upto: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(fingerprints, ordinals) of the documents with after < ordinal <= upto."""
+        upto = self.max_ordinal() if upto is None else upto
+        fps, ordinals = [np.empty(0, dtype=np.uint64)], [np.empty(0, dtype=np.int64)]
+        for ordinal, blob in self.conn.execute(
+                "SELECT ordinal, shingles FROM docs WHERE ordinal > ? AND ordinal <= ?", (after, upto)):
+            shingles = _from_blob(blob, np.uint64)
+            fps.append(shingles)
+            ordinals.append(np.full(len(shingles), ordinal, dtype=np.int64))
+        return np.concatenate(fps), np.concatenate(ordinals)
 
-def save_cached_representations(reps: Dict[str, DocRepresentation]):
-    with open(DOC_REP_FILE, "wb") as f:
-        pickle.dump(reps, f)
+    def close(self):
+        self.conn.close()
+
+
+class ShingleIndex:
+    """
+    Read-optimised inverted index over a RepresentationStore.
+
+    A snapshot of the postings is kept in one file: a header, the sorted
+    distinct fingerprints, CSR offsets into the postings, the document
+    ordinals of every posting list and the fingerprint count of every
+    document. It is opened with mmap, so startup reads nothing, processes
+    share the page cache, and a lookup is a binary search. Documents stored
+    after the snapshot, by this process or any other, are read from the
+    store at lookup time into sorted arrays, and the snapshot is rebuilt
+    once they pass `rebuild_after`. Postings of documents removed from the
+    store stay in the snapshot until the next rebuild and are filtered out
+    of lookups.
+    """
+
+    MAGIC = 0x504C4147 + 1  # "PLAG", version 2 adds document sizes
+    HEADER = 4  # int64s: magic, fingerprints, postings, last ordinal covered
+
+    def __init__(self, store: RepresentationStore, rebuild_after: int = INDEX_REBUILD_DOCS):
+        self.store = store
+        self.path = store.path.with_suffix(".postings")
+        self.rebuild_after = rebuild_after
+        self.removed = np.empty(0, dtype=np.int64)
+        self.removed_seq = 0
+        # Snapshots of an older layout are rebuilt
+        if not self._open() or store.max_ordinal() - self.max_ordinal > rebuild_after:
+            self.rebuild()
+
+    def _snapshot_id(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open(self) -> bool:
+        self.fps = np.empty(0, dtype=np.uint64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.ordinals = np.empty(0, dtype=np.int32)
+        self.sizes = np.zeros(1, dtype=np.int32)
+        self.max_ordinal = 0
+        self.snapshot_id = self._snapshot_id()
+        self._reset_delta()
+        if self.snapshot_id is None:
+            return True
+        header = np.fromfile(self.path, dtype=np.int64, count=self.HEADER)
+        if len(header) < self.HEADER or header[0] != self.MAGIC:
+            return False
+        n, m, self.max_ordinal = int(header[1]), int(header[2]), int(header[3])
+        start = self.HEADER * 8
+        self.fps = np.memmap(self.path, dtype=np.uint64, mode="r", offset=start, shape=(n,)) if n else np.empty(0, dtype=np.uint64)
+        start += n * 8
+        self.offsets = np.memmap(self.path, dtype=np.int64, mode="r", offset=start, shape=(n + 1,))
+        start += (n + 1) * 8
+        self.ordinals = np.memmap(self.path, dtype=np.int32, mode="r", offset=start, shape=(m,)) if m else np.empty(0, dtype=np.int32)
+        start += m * 4
+        self.sizes = np.memmap(self.path, dtype=np.int32, mode="r", offset=start, shape=(self.max_ordinal + 1,))
+        self._reset_delta()
+        return True
+
+    def _reset_delta(self):
+        self.delta_fps = np.empty(0, dtype=np.uint64)
+        self.delta_ordinals = np.empty(0, dtype=np.int64)
+        self.delta_sizes = np.zeros(1, dtype=np.int64)  # by ordinal - max_ordinal
+        self.delta_upto = self.max_ordinal
+
+    def refresh(self):
+        """
+        Catches up with the store: reopens a snapshot another process
+        rebuilt, reads the postings of documents committed since the last
+        call, and rebuilds the snapshot once too many are outside it.
+        """
+        if self._snapshot_id() != self.snapshot_id:
+            self._open()
+        self.removed_seq, removed = self.store.removed_since(self.removed_seq)
+        if removed:
+            self.removed = np.union1d(self.removed, np.asarray(removed, dtype=np.int64))
+        upto = self.store.max_ordinal()
+        if upto - self.max_ordinal > self.rebuild_after:
+            self.rebuild()
+            return
+        if upto <= self.delta_upto:
+            return
+        fps, ordinals = self.store.postings_between(self.delta_upto, upto)
+        fps = np.concatenate([self.delta_fps, fps])
+        ordinals = np.concatenate([self.delta_ordinals, ordinals])
+        order = np.argsort(fps, kind="stable")
+        self.delta_fps, self.delta_ordinals = fps[order], ordinals[order]
+        self.delta_sizes = np.bincount(ordinals - self.max_ordinal, minlength=upto - self.max_ordinal + 1)
+        self.delta_upto = upto
+
+    def rebuild(self):
+        """Writes a new snapshot of every stored posting and swaps it in atomically."""
+        upto = self.store.max_ordinal()
+        fps, ordinals = self.store.postings_between(0, upto)
+        order = np.lexsort((ordinals, fps))
+        fps, ordinals = fps[order], ordinals[order].astype(np.int32)
+        keys, starts = np.unique(fps, return_index=True)
+        offsets = np.append(starts, len(fps)).astype(np.int64)
+        sizes = np.bincount(ordinals, minlength=upto + 1).astype(np.int32)
+
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.array([self.MAGIC, len(keys), len(ordinals), upto], dtype=np.int64).tofile(f)
+            keys.tofile(f)
+            offsets.tofile(f)
+            ordinals.tofile(f)
+            sizes.tofile(f)
+        os.replace(tmp_path, self.path)
+        self._open()
+
+    def doc_sizes(self, ordinals: np.ndarray) -> np.ndarray:
+        """Number of distinct fingerprints of each document."""
+        self.refresh()
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        sizes = np.zeros(len(ordinals), dtype=np.int64)
+        in_snapshot = ordinals <= self.max_ordinal
+        sizes[in_snapshot] = self.sizes[ordinals[in_snapshot]]
+        in_delta = ~in_snapshot & (ordinals <= self.delta_upto)
+        sizes[in_delta] = self.delta_sizes[ordinals[in_delta] - self.max_ordinal]
+        return sizes
+
+    def shared_counts(self, fps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fingerprints shared with every indexed document, counted in one pass
+        over the query's posting lists.
+
+        :param fps: Distinct fingerprints of the query.
+        :return: (ordinals, shared counts) of the documents sharing any.
+        """
+        counts = np.bincount(self.lookup(fps))
+        ordinals = np.flatnonzero(counts)
+        return ordinals, counts[ordinals]
+
+    def lookup(self, fps: np.ndarray) -> np.ndarray:
+        """
+        Ordinals of the documents containing each of the fingerprints, one
+        entry per (fingerprint, document) pair.
+
+        :param fps: Distinct fingerprints to look up.
+        :return: int64 array of document ordinals.
+        """
+        self.refresh()
+        fps = np.asarray(fps, dtype=np.uint64)
+        found = np.empty(0, dtype=np.int64)
+        if len(self.fps) and len(fps):
+            idx = np.searchsorted(self.fps, fps)
+            hit = idx < len(self.fps)
+            hit[hit] = self.fps[idx[hit]] == fps[hit]
+            idx = idx[hit]
+            found = _gather(self.ordinals, self.offsets[idx], self.offsets[idx + 1] - self.offsets[idx])
+        if len(self.delta_fps) and len(fps):
+            starts = np.searchsorted(self.delta_fps, fps, side="left")
+            lengths = np.searchsorted(self.delta_fps, fps, side="right") - starts
+            found = np.concatenate([found, _gather(self.delta_ordinals, starts, lengths)])
+        if len(self.removed) and len(found):
+            found = found[~np.isin(found, self.removed)]
+        return found
+
+    def get(self, fp: int, default=()) -> Set[str]:
+        """doc_ids containing a fingerprint, like the former dict of sets."""
+        ordinals = self.lookup(np.array([fp], dtype=np.uint64))
+        return set(self.store.doc_ids(ordinals).values()) if len(ordinals) else default
+
+
+def _stored_bands(store: RepresentationStore, lsh: LSHIndex, doc_ids) -> Dict[str, List[Tuple[int, int]]]:
+    """(band, key) pairs the stored documents were bucketed under, if the store uses `lsh`'s settings."""
+    if store.lsh_config() != lsh.config:
+        return {}
+    return {doc_id: lsh.band_keys(store[doc_id].signature) for doc_id in doc_ids
+            if doc_id in store and store[doc_id].signature is not None}
+
+
+def remove_documents(doc_ids: List[str], mode: str = "shingles", window: int = WINNOW_WINDOW) -> int:
+    """
+    Removes documents from the store of a fingerprint mode without loading
+    its inverted index, for callers that have no PlagiarismVisualizer.
+
+    :param doc_ids: Documents to remove, unknown ones are ignored.
+    :return: Number of documents removed.
+    """
+    path = store_file(mode, window)
+    if not path.exists():
+        return 0
+    store = RepresentationStore(path)
+    try:
+        return store.remove(doc_ids, _stored_bands(store, LSHIndex(), doc_ids))
+    finally:
+        store.close()
+
+
+def _gather(values: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenates values[start:start + length] for every pair, without a Python loop."""
+    total = int(lengths.sum())
+    shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return values[np.arange(total) + shift].astype(np.int64)
 
 
 class PlagiarismVisualizer:
-    def __init__(self, shingle_size: int = SHINGLE_SIZE):
+    def __init__(self, shingle_size: int = SHINGLE_SIZE,
+                 bands: int = LSH_BANDS, rows: int = LSH_ROWS,
+                 mode: str = "shingles", window: int = WINNOW_WINDOW):
         self.shingle_size = shingle_size
-        self.reps: Dict[str, DocRepresentation] = load_cached_representations()
-        self.shingle_index: Dict[str, Set[str]] = defaultdict(set)
-        for doc_id, rep in self.reps.items():
-            for sh in rep.shingles:
-                self.shingle_index[sh].add(doc_id)
-
-    def _make_doc_id(self, path: str) -> str:
-        st = os.stat(path)
-        hasher = hashlib.sha1()
-        hasher.update(str(path).encode("utf-8"))
-        hasher.update(str(st.st_size).encode("utf-8"))
-        hasher.update(str(int(st.st_mtime)).encode("utf-8"))
+        self.mode = mode
+        self.window = window
+        # Representations, postings and LSH buckets are all read from the store on demand
+        self.reps = RepresentationStore(store_file(mode, window))
+        self.shingle_index = ShingleIndex(self.reps)
+        self.lsh = LSHIndex(bands, rows, store=self.reps)
+        if self.reps.lsh_config() != self.lsh.config:
+            self._rebucket()
+        for legacy in legacy_cache_files(mode, window):
+            if legacy.exists():
+                self._import_legacy_cache(legacy)
+
+    def _rebucket(self):
+        """Refills the LSH buckets of a store written with other LSH settings, or before it had them."""
+        bands = {}
+        for doc_id, signature in list(self.reps.signatures()):
+            if signature is None or len(signature) != self.lsh.num_perm:
+                signature = minhash_signature(self.reps[doc_id].shingles, self.lsh.num_perm)
+                self.reps.set_signature(doc_id, signature)
+            bands[doc_id] = self.lsh.band_keys(signature)
+        self.reps.replace_bands(self.lsh.config, bands)
+
+    def _import_legacy_cache(self, path: Path):
+        """
+        Moves the documents of a pickle cache into the store. The pickle is
+        renamed first, so one worker imports it, once. Fingerprints are
+        recomputed from the cached tokens with the current settings; the PDFs
+        are not read again. Documents are re-keyed by the content hash of
+        their file where it still exists, so they are not indexed twice.
+        Documents cached without their text are left out and get indexed the
+        next time they are processed.
+        """
+        imported = path.with_name(path.name + ".imported")
+        try:
+            os.replace(path, imported)
+        except FileNotFoundError:
+            # Another worker got to it first
+            return
+        try:
+            legacy = load_legacy_representations(imported)
+        except Exception as e:
+            print(f"[WARN] Could not read the legacy plagiarism cache {path}: {e}")
+            return
+
+        reps, texts = [], []
+        seen = set()
+        for doc_id, old in legacy.items():
+            full_text = getattr(old, "full_text", "") or ""
+            tokens = getattr(old, "tokens", None) or tokenize(normalize_text(full_text))
+            try:
+                doc_id = self.document_id(old.path)
+            except OSError:
+                # The file is gone, it keeps the id it was cached under
+                pass
+            if doc_id in seen or doc_id in self.reps or not tokens:
+                continue
+            seen.add(doc_id)
+            shingles, position_fps, positions = fingerprint_tokens(
+                tokens, self.shingle_size, self.mode, self.window)
+            reps.append(DocRepresentation(
+                doc_id=doc_id,
+                path=old.path,
+                shingles=shingles,
+                token_count=len(tokens),
+                raw_text_excerpt=old.raw_text_excerpt,
+                signature=minhash_signature(shingles, self.lsh.num_perm),
+                positions=positions.astype(np.int64, copy=False),
+                position_fps=position_fps
+            ))
+            texts.append(DocText(full_text, tokens))
+        self._index(reps, texts)
+        print(f"[INFO] Imported {len(reps)} of {len(legacy)} document(s) from {path}")
+
+    def document_id(self, path: str, content_hash: str = None) -> str:
+        """
+        The SHA-256 of the file's content, the same key the blob store and
+        analysis results use, so identical files share one representation.
+        Hashed from the file when the caller does not know it yet.
+        """
+        if content_hash:
+            return content_hash
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(block)
         return hasher.hexdigest()
 
-    def process_document(self, path: str) -> str:
-        """Process document and return doc_id"""
+    def process_document(self, path: str, content_hash: str = None, text_path: str = None) -> str:
+        """Process document and return doc_id, the SHA-256 of its content. The
+        text layer extracted at ingest is read from `text_path` when given."""
         path = str(path)
-        doc_id = self._make_doc_id(path)
+        doc_id = self.document_id(path, content_hash)
         
         if doc_id in self.reps:
             return doc_id
 
-        print(f"[INFO] Processing: {path}")
-        full_text = extract_text_and_ocr_from_pdf(path)
-        norm = normalize_text(full_text)
-        tokens = tokenize(norm)
-        shingles = shingles_from_tokens(tokens, self.shingle_size)
-        excerpt = (full_text[:400] + "...") if len(full_text) > 400 else full_text
+        return self.add_document(*self.build_document(path, doc_id, text_path))
 
-        rep = DocRepresentation(
-            doc_id=doc_id,
-            path=path,
-            shingles=shingles,
-            token_count=len(tokens),
-            raw_text_excerpt=excerpt,
-            full_text=full_text,
-            tokens=tokens
-        )
-        
-        self.reps[doc_id] = rep
-        for sh in shingles:
-            self.shingle_index[sh].add(doc_id)
-        save_cached_representations(self.reps)
-        return doc_id
-
-    def find_matching_positions(self, doc_id_a: str, doc_id_b: str) -> Tuple[Set[int], Set[int]]:
-        """Find token positions that match between two documents"""
+    def build_document(self, path: str, doc_id: str, text_path: str = None) -> Tuple[DocRepresentation, DocText]:
+        """
+        Extracts and fingerprints a document without touching the store, so
+        threads sharing this visualizer can run it concurrently and only
+        serialize add_document.
+
+        :param path: The PDF.
+        :param doc_id: Its document_id.
+        :param text_path: Text layer extracted at ingest, if any.
+        :return: The representation and text for add_document.
+        """
+        return _build_representation(str(path), doc_id, self.shingle_size, self.mode,
+                                     self.window, self.lsh.num_perm, text_path)
+
+    def add_document(self, rep: DocRepresentation, text: DocText) -> str:
+        """Stores a representation from build_document unless its content was indexed meanwhile."""
+        if rep.doc_id not in self.reps:
+            self._index([rep], [text])
+        return rep.doc_id
+
+    def process_documents(self, paths: List[str], workers: int = INGEST_WORKERS,
+                          progress_callback: Callable[[float, str], None] = None,
+                          content_hashes: List[str] = None,
+                          text_paths: List[str] = None) -> List[Optional[str]]:
+        """
+        Indexes a batch of PDFs, e.g. all the documents of a project. Text
+        extraction, OCR and fingerprinting run in a process pool; the new
+        representations are then written to the store in one transaction.
+
+        :param paths: PDFs to index. Already indexed content is skipped, and
+            paths with the same content are indexed once.
+        :param workers: Processes used, no pool when 1.
+        :param progress_callback: Receives (percentage, status) on the
+            calling thread, as extract_zip does.
+        :param content_hashes: SHA-256 of each path when already known.
+        :param text_paths: Text layer of each path extracted at ingest, if any.
+        :return: The doc_id of each path, None for the PDFs that failed.
+        """
+        paths = [str(path) for path in paths]
+        content_hashes = content_hashes or [None] * len(paths)
+        doc_ids = [self.document_id(path, digest) for path, digest in zip(paths, content_hashes)]
+        texts = dict(zip(doc_ids, text_paths or [None] * len(paths)))
+        pending = {doc_id: path for doc_id, path in zip(doc_ids, paths) if doc_id not in self.reps}
+        args = (self.shingle_size, self.mode, self.window, self.lsh.num_perm)
+
+        built: Dict[str, Tuple[DocRepresentation, DocText]] = {}
+        failed = set()
+
+        def collect(doc_id: str, build):
+            try:
+                built[doc_id] = build()
+            except Exception as e:
+                print(f"[WARN] Could not index {pending[doc_id]}: {e}")
+                failed.add(doc_id)
+            if progress_callback:
+                progress_callback((len(built) + len(failed)) / len(pending) * 100, "fingerprinting")
+
+        if workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+                futures = {pool.submit(_build_representation, path, doc_id, *args, texts[doc_id]): doc_id
+                           for doc_id, path in pending.items()}
+                for future in as_completed(futures):
+                    collect(futures[future], future.result)
+        else:
+            for doc_id, path in pending.items():
+                collect(doc_id, lambda: _build_representation(path, doc_id, *args, texts[doc_id]))
+
+        # Stored in input order, so ordinals do not depend on which worker finished first
+        done = [built[doc_id] for doc_id in pending if doc_id in built]
+        self._index([rep for rep, _ in done], [text for _, text in done])
+        if progress_callback:
+            progress_callback(100, "indexed")
+        return [None if doc_id in failed else doc_id for doc_id in doc_ids]
+
+    def _index(self, reps: List[DocRepresentation], texts: List[DocText]):
+        """Stores new representations with their LSH buckets; the inverted index reads them back on lookup."""
+        self.reps.add_many(reps, texts, bands=[self.lsh.band_keys(rep.signature) for rep in reps])
+
+    def remove_documents(self, doc_ids: List[str]) -> int:
+        """
+        Drops documents from the store with their texts and LSH buckets, e.g.
+        once no project refers to their content any more.
+
+        :param doc_ids: Documents to remove, unknown ones are ignored.
+        :return: Number of documents removed.
+        """
+        return self.reps.remove(doc_ids, _stored_bands(self.reps, self.lsh, doc_ids))
+
+    def find_similar(self, doc_id: str, threshold: float = 0.0, top_k: int = None) -> List[Tuple[str, float]]:
+        """
+        Documents similar to an indexed one, most similar first. Candidates
+        come from the LSH index; exact Jaccard is computed only for them.
+
+        :param doc_id: The indexed document.
+        :param threshold: Minimum exact Jaccard similarity to report.
+        :param top_k: Maximum number of matches, all if None.
+        :return: List of (doc_id, similarity).
+        """
+        rep = self.reps[doc_id]
+        candidates = self.lsh.query(rep.signature)
+        candidates.discard(doc_id)
+
+        matches = []
+        for other_id in candidates:
+            score = jaccard_similarity(rep.shingles, self.reps[other_id].shingles)
+            if score >= threshold:
+                matches.append((other_id, score))
+        matches.sort(key=lambda m: m[1], reverse=True)
+        return matches[:top_k] if top_k else matches
+
+    def query(self, doc_id: str, top_k: int = 10, order_by: str = "similarity") -> List[Dict]:
+        """
+        Top sources of an indexed document across the whole corpus. Shared
+        fingerprints are counted for every document at once from the query's
+        posting lists, so no document is compared pairwise. Documents are
+        keyed by content hash, so the document itself (and every identical
+        copy of it) is never reported as its own source.
+
+        :param doc_id: The indexed document to check.
+        :param top_k: Number of sources returned.
+        :param order_by: "similarity" (Jaccard) or "containment" (share of
+            the query's fingerprints found in the source).
+        :return: Dicts with 'doc_id', 'path', 'shared', 'similarity' and
+            'containment', best first.
+        """
+        rep = self.reps[doc_id]
+        own = self.reps.ordinals([doc_id])[doc_id]
+        ordinals, shared = self.shingle_index.shared_counts(rep.shingles)
+        keep = ordinals != own
+        ordinals, shared = ordinals[keep], shared[keep]
+        if not len(ordinals):
+            return []
+
+        query_size = len(rep.shingles)
+        similarity = shared / (query_size + self.shingle_index.doc_sizes(ordinals) - shared)
+        containment = shared / query_size
+        scores = similarity if order_by == "similarity" else containment
+        best = np.argsort(-scores, kind="stable")[:top_k]
+
+        info = self.reps.paths(ordinals[best])
+        return [{
+            "doc_id": info[int(ordinals[i])][0],
+            "path": info[int(ordinals[i])][1],
+            "shared": int(shared[i]),
+            "similarity": float(similarity[i]),
+            "containment": float(containment[i])
+        } for i in best.tolist()]
+
+    def query_path(self, path: str, top_k: int = 10, order_by: str = "similarity",
+                   content_hash: str = None, text_path: str = None) -> List[Dict]:
+        """Indexes a submission (if needed) and returns its top sources, see query."""
+        return self.query(self.process_document(path, content_hash, text_path), top_k, order_by)
+
+    def project_pairs(self, doc_ids: List[str], min_similarity: float = 0.0) -> List[Dict]:
+        """
+        Similarity of every pair of documents of a project sharing at least
+        one fingerprint. Each document's posting lists are walked once and
+        restricted to the project, so cost follows shared fingerprints
+        rather than the number of pairs. Identical files of a project have
+        one doc_id and are never paired with each other.
+
+        :param doc_ids: Indexed documents of the project.
+        :param min_similarity: Minimum Jaccard similarity of reported pairs.
+        :return: Dicts with 'a', 'b', 'shared', 'similarity', 'containment_a'
+            and 'containment_b', most similar first.
+        """
+        by_ordinal = {ordinal: doc_id for doc_id, ordinal in self.reps.ordinals(doc_ids).items()}
+        members = np.array(sorted(by_ordinal), dtype=np.int64)
+        sizes = dict(zip(members.tolist(), self.shingle_index.doc_sizes(members).tolist()))
+
+        pairs = []
+        for ordinal in members.tolist():
+            found = self.shingle_index.lookup(self.reps[by_ordinal[ordinal]].shingles)
+            # Each pair once, from its lower ordinal
+            found = found[(found > ordinal) & np.isin(found, members)]
+            others, shared = np.unique(found, return_counts=True)
+            for other, count in zip(others.tolist(), shared.tolist()):
+                similarity = count / (sizes[ordinal] + sizes[other] - count)
+                if similarity >= min_similarity:
+                    pairs.append({
+                        "a": by_ordinal[ordinal],
+                        "b": by_ordinal[other],
+                        "shared": count,
+                        "similarity": similarity,
+                        "containment_a": count / sizes[ordinal],
+                        "containment_b": count / sizes[other]
+                    })
+        pairs.sort(key=lambda p: p["similarity"], reverse=True)
+        return pairs
+
+    def _positional_fingerprints(self, rep: DocRepresentation) -> Tuple[np.ndarray, np.ndarray]:
+        """(fingerprints, token positions) stored at ingest, rehashed for older rows."""
+        if rep.positions is None:
+            position_fps = fingerprints_by_position(self.reps.text(rep.doc_id).tokens, self.shingle_size)
+            return position_fps, np.arange(len(position_fps))
+        return rep.position_fps, rep.positions
+
+    def find_matching_intervals(self, doc_id_a: str, doc_id_b: str
+                                ) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        """
+        Token spans of each document covered by the shingles both share.
+
+        :param doc_id_a: First indexed document.
+        :param doc_id_b: Second indexed document.
+        :return: Merged (start, end) token intervals of a and of b, end excluded.
+        """
         rep_a = self.reps[doc_id_a]
         rep_b = self.reps[doc_id_b]
-        
-        # Get shingle positions for both documents
-        shingles_a = shingles_from_tokens_with_positions(rep_a.tokens, self.shingle_size)
-        shingles_b = shingles_from_tokens_with_positions(rep_b.tokens, self.shingle_size)
-        
-        # Find common shingles
-        common_shingles = set(shingles_a.keys()) & set(shingles_b.keys())
-        
-        # Collect all matching token positions
-        positions_a = set()
-        positions_b = set()
-        
-        for shingle in common_shingles:
-            for pos in shingles_a[shingle]:
-                # Mark all tokens in this shingle
-                for i in range(self.shingle_size):
-                    positions_a.add(pos + i)
-            for pos in shingles_b[shingle]:
-                for i in range(self.shingle_size):
-                    positions_b.add(pos + i)
-        
-        return positions_a, positions_b
+        common = np.intersect1d(rep_a.shingles, rep_b.shingles, assume_unique=True)
+        return (matching_intervals(*self._positional_fingerprints(rep_a), common, self.shingle_size),
+                matching_intervals(*self._positional_fingerprints(rep_b), common, self.shingle_size))
 
-    def create_highlighted_pdf(self, doc_id: str, matching_positions: Set[int], 
-                               compared_doc_path: str, similarity: float, 
+    def create_highlighted_pdf(self, doc_id: str, intervals: List[Tuple[int, int]],
+                               compared_doc_path: str, similarity: float,
                                output_path: str):
-        """Create a PDF with highlighted matching segments"""
+        """
+        Writes a report of a document with its matching spans highlighted.
+
+        :param doc_id: The indexed document.
+        :param intervals: Its matched (start, end) token intervals, see find_matching_intervals.
+        :param compared_doc_path: Path of the document it was compared with.
+        :param similarity: Similarity score shown in the report.
+        :param output_path: Where the report PDF is written.
+        """
         rep = self.reps[doc_id]
-        
-        # Create PDF
-        doc = SimpleDocTemplate(output_path, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            textColor=HexColor('#1a1a1a'),
-            spaceAfter=30
-        )
-        story.append(Paragraph(f"Plagiarism Analysis Report", title_style))
-        story.append(Spacer(1, 12))
-        
-        # Document info
-        info_style = styles['Normal']
-        story.append(Paragraph(f"<b>Document:</b> {os.path.basename(rep.path)}", info_style))
-        story.append(Paragraph(f"<b>Compared with:</b> {os.path.basename(compared_doc_path)}", info_style))
-        story.append(Paragraph(f"<b>Similarity Score:</b> {similarity:.2%}", info_style))
-        story.append(Paragraph(f"<b>Matching Tokens:</b> {len(matching_positions)} / {rep.token_count}", info_style))
-        story.append(Spacer(1, 20))
-        story.append(Paragraph("<b>Highlighted Text:</b>", styles['Heading2']))
-        story.append(Spacer(1, 12))
-        
-        # Create highlighted text
-        highlight_style = ParagraphStyle(
-            'Highlighted',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_JUSTIFY,
-            leading=14
-        )
-        
-        # Build highlighted text
-        highlighted_parts = []
-        tokens = rep.tokens
-        
-        i = 0
-        while i < len(tokens):
-            if i in matching_positions:
-                # Start of a matching segment
-                segment = []
-                while i < len(tokens) and i in matching_positions:
-                    segment.append(tokens[i])
-                    i += 1
-                # Highlight this segment
-                highlighted_parts.append(f'<font backColor="yellow"><b>{" ".join(segment)}</b></font>')
-            else:
-                # Non-matching segment
-                segment = []
-                while i < len(tokens) and i not in matching_positions:
-                    segment.append(tokens[i])
-                    i += 1
-                highlighted_parts.append(" ".join(segment))
-        
-        full_highlighted_text = " ".join(highlighted_parts)
-        
-        # Split into chunks to avoid reportlab issues with very long paragraphs
-        max_chunk_size = 3000
-        text_chunks = []
-        current_chunk = ""
-        
-        words = full_highlighted_text.split()
-        for word in words:
-            if len(current_chunk) + len(word) + 1 > max_chunk_size:
-                text_chunks.append(current_chunk)
-                current_chunk = word
-            else:
-                current_chunk += " " + word if current_chunk else word
-        
-        if current_chunk:
-            text_chunks.append(current_chunk)
-        
-        for chunk in text_chunks:
-            story.append(Paragraph(chunk, highlight_style))
+        tokens = self.reps.text(doc_id).tokens
+        matched = sum(end - start for start, end in intervals)
+
+        story = [
+            Paragraph("Plagiarism Analysis Report", REPORT_TITLE_STYLE),
+            Spacer(1, 12),
+            Paragraph(f"<b>Document:</b> {escape(os.path.basename(rep.path))}", REPORT_INFO_STYLE),
+            Paragraph(f"<b>Compared with:</b> {escape(os.path.basename(compared_doc_path))}", REPORT_INFO_STYLE),
+            Paragraph(f"<b>Similarity Score:</b> {similarity:.2%}", REPORT_INFO_STYLE),
+            Paragraph(f"<b>Matching Tokens:</b> {matched} / {rep.token_count}", REPORT_INFO_STYLE),
+            Spacer(1, 20),
+            Paragraph("<b>Highlighted Text:</b>", REPORT_HEADING_STYLE),
+            Spacer(1, 12)
+        ]
+        for paragraph in highlighted_paragraphs(tokens, intervals):
+            story.append(Paragraph(paragraph, REPORT_TEXT_STYLE))
             story.append(Spacer(1, 12))
-        
-        # Build PDF
-        doc.build(story)
+
+        SimpleDocTemplate(output_path, pagesize=letter).build(story)
         print(f"[INFO] Created highlighted PDF: {output_path}")
 
-    def compare_and_visualize(self, path_a: str, path_b: str, output_dir: str = "visualizations"):
-        """Compare two documents and create highlighted PDFs for both"""
+    def annotate_source_pdf(self, doc_id: str, other_doc_id: str, output_path: str,
+                            color: Tuple[float, float, float] = ANNOTATION_COLOR) -> int:
+        """
+        Writes a copy of a document's original PDF with the words matching
+        the other document highlighted in place. The page words are
+        tokenised and fingerprinted like the indexed text, and the words
+        covered by a shared fingerprint get one highlight rectangle per run
+        on a line, in a single annotation per page. Text found only by OCR
+        has no word boxes and is not highlighted.
+
+        :param doc_id: The indexed document to annotate.
+        :param other_doc_id: The indexed document it is compared with.
+        :param output_path: Where the annotated PDF is written.
+        :param color: Highlight colour as (R, G, B), values 0-1.
+        :return: Number of highlighted words.
+        """
+        rep = self.reps[doc_id]
+        common = np.intersect1d(rep.shingles, self.reps[other_doc_id].shingles, assume_unique=True)
+
+        doc = fitz.open(rep.path)
+        words = [(page_no, word) for page_no, page in enumerate(doc) for word in page.get_text("words")]
+        tokens, owners = [], []
+        for i, (_, word) in enumerate(words):
+            for token in tokenize(normalize_text(word[4])):
+                tokens.append(token)
+                owners.append(i)
+        position_fps = fingerprints_by_position(tokens, self.shingle_size)
+        owners = np.asarray(owners, dtype=np.int64)
+        spans = matching_intervals(position_fps, np.arange(len(position_fps)), common, self.shingle_size)
+        # Words between the first and last token of a span, including those without tokens ("a", "&")
+        matched = np.unique(np.concatenate(
+            [np.arange(owners[start], owners[end - 1] + 1) for start, end in spans] + [owners[:0]]))
+
+        # Consecutive words of a line share one rectangle
+        rects = defaultdict(list)
+        previous = None
+        for i in matched.tolist():
+            page_no, (x0, y0, x1, y1, _, block_no, line_no, _) = words[i]
+            line = (page_no, block_no, line_no)
+            if previous == (line, i - 1):
+                rects[page_no][-1].include_rect(fitz.Rect(x0, y0, x1, y1))
+            else:
+                rects[page_no].append(fitz.Rect(x0, y0, x1, y1))
+            previous = (line, i)
+
+        for page_no, page_rects in rects.items():
+            page = doc[page_no]
+            highlight = page.add_highlight_annot(quads=page_rects)
+            highlight.set_colors(stroke=color)
+            highlight.update()
+
+        doc.save(output_path, garbage=1, deflate=True)
+        doc.close()
+        print(f"[INFO] Created annotated PDF: {output_path}")
+        return len(matched)
+
+    def compare_and_visualize(self, path_a: str, path_b: str, output_dir: str = "visualizations",
+                              annotate: bool = False):
+        """
+        Compare two documents and create highlighted PDFs for both: reports
+        of their text, or with annotate the original PDFs highlighted in place.
+        """
         output_dir = Path(output_dir)
         output_dir.mkdir(exist_ok=True)
         
@@ -297,9 +1367,6 @@ class PlagiarismVisualizer:
         
         print(f"\n[INFO] Similarity between documents: {similarity:.2%}")
         
-        # Find matching positions
-        positions_a, positions_b = self.find_matching_positions(doc_id_a, doc_id_b)
-        
         # Create output filenames
         base_a = Path(path_a).stem
         base_b = Path(path_b).stem
@@ -307,8 +1374,13 @@ class PlagiarismVisualizer:
         output_b = output_dir / f"{base_b}_vs_{base_a}_highlighted.pdf"
         
         # Create highlighted PDFs
-        self.create_highlighted_pdf(doc_id_a, positions_a, path_b, similarity, str(output_a))
-        self.create_highlighted_pdf(doc_id_b, positions_b, path_a, similarity, str(output_b))
+        if annotate:
+            self.annotate_source_pdf(doc_id_a, doc_id_b, str(output_a))
+            self.annotate_source_pdf(doc_id_b, doc_id_a, str(output_b))
+        else:
+            intervals_a, intervals_b = self.find_matching_intervals(doc_id_a, doc_id_b)
+            self.create_highlighted_pdf(doc_id_a, intervals_a, path_b, similarity, str(output_a))
+            self.create_highlighted_pdf(doc_id_b, intervals_b, path_a, similarity, str(output_b))
         
         return similarity, str(output_a), str(output_b)
 
@@ -322,13 +1394,16 @@ if __name__ == "__main__":
     parser.add_argument("pdf2", help="Second PDF file")
     parser.add_argument("--shingle", type=int, default=SHINGLE_SIZE, help="shingle size")
     parser.add_argument("--output-dir", default="visualizations", help="Output directory")
+    parser.add_argument("--annotate", action="store_true",
+                        help="highlight the original PDFs instead of writing text reports")
     args = parser.parse_args()
 
     visualizer = PlagiarismVisualizer(shingle_size=args.shingle)
     similarity, out_a, out_b = visualizer.compare_and_visualize(
         args.pdf1, 
         args.pdf2, 
-        args.output_dir
+        args.output_dir,
+        annotate=args.annotate
     )
     
     print(f"\n✓ Visualization complete!")
@@ -23,3 +23,18 @@ async def GetClass(token: str) -> int:
             return 4, -1
     
     
+
+
+async def GetClassification(token: str) -> dict:
+    """
+    Returns the model API's full JSON response for the given characters.
+
+    Raises:
+        httpx.HTTPStatusError: If the model API does not answer with 200.
+    """
+    url = "http://localhost:3344/api/get"
+    payload = {"chars": token}
+    async with httpx.AsyncClient() as client:
+        response = await client.post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,112 @@
+import json
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+RESULT_DIR = "Results"
+os.makedirs(RESULT_DIR, exist_ok=True)
+
+RESULT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+def new_result_id() -> str:
+    """Returns a fresh result id (32 hex characters)."""
+    return uuid4().hex
+
+
+def is_valid_result_id(result_id: str) -> bool:
+    """Result ids become file names, so only accept the format we generate."""
+    return bool(RESULT_ID_RE.match(result_id or ""))
+
+
+def result_pdf_path(result_id: str) -> str:
+    """Path of the highlighted PDF of a result."""
+    return os.path.join(RESULT_DIR, f"{result_id}.pdf")
+
+
+def result_data_path(result_id: str) -> str:
+    """Path of the classification data of a result."""
+    return os.path.join(RESULT_DIR, f"{result_id}.json")
+
+
+def save_result_data(result_id: str, data: Dict[str, Any]) -> None:
+    """
+    Writes the classification data of a result. The file is written to a
+    temporary name and renamed so readers never see a partial file.
+    """
+    path = result_data_path(result_id)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_result_data(result_id: str) -> Optional[Dict[str, Any]]:
+    """Reads the classification data of a result, None if it does not exist."""
+    path = result_data_path(result_id)
+    if not is_valid_result_id(result_id) or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def touch_result(result_id: str) -> None:
+    """Marks a result as used now, so the sweep keeps it for another full lifetime."""
+    for path in (result_pdf_path(result_id), result_data_path(result_id)):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+
+def sweep_results(max_age_seconds: float, now: float = None) -> List[str]:
+    """
+    Deletes the highlighted PDF and data file of every result that was not
+    written or reused for `max_age_seconds`.
+
+    Args:
+        max_age_seconds (float): Lifetime of a result since its last use.
+        now (float, optional): Current time as a UNIX timestamp.
+
+    Returns:
+        List[str]: Ids of the deleted results.
+    """
+    now = time.time() if now is None else now
+    expired = set()
+    for entry in os.scandir(RESULT_DIR):
+        result_id, ext = os.path.splitext(entry.name)
+        if ext not in (".pdf", ".json") or not is_valid_result_id(result_id):
+            continue
+        try:
+            if now - entry.stat().st_mtime > max_age_seconds:
+                expired.add(result_id)
+        except FileNotFoundError:
+            continue
+
+    for result_id in expired:
+        for path in (result_pdf_path(result_id), result_data_path(result_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return sorted(expired)
+
+
+def job_input_path(input_id: str) -> str:
+    """Where the input PDF of a background job is kept until the job is done."""
+    return os.path.join(RESULT_DIR, f"job-{input_id}.pdf")
+
+
+def text_layer_path(content_hash: str) -> str:
+    """Where the extracted text layer of a file with this content is kept."""
+    return os.path.join(RESULT_DIR, f"text-{content_hash}.txt")
+
+
+def remove_text_layer(content_hash: str) -> None:
+    """Deletes the text layer of a content nothing refers to any more."""
+    try:
+        os.remove(text_layer_path(content_hash))
+    except FileNotFoundError:
+        pass
@@ -1,62 +1,408 @@
-
-# --- Mock document retrieval (replace with your DB or filesystem logic) ---
 import asyncio
-import random
-from typing import List, Dict, Any
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from typing import Dict, List, Set
 
-from fastapi import WebSocket
+import fitz
+from bson import ObjectId
+from pdf2image import convert_from_path
 from fastapi.concurrency import run_in_threadpool
+from motor.motor_asyncio import AsyncIOMotorCollection
+from opentelemetry.trace import Tracer
+
+from Database.Document import SetDocumentResult
+from Database.Job import (LEASE_SECONDS, AppendJobEvent, ClaimExpiredOCRJob, ClaimTask,
+                          CompleteTask, CountRunningByUser, CreateJob, CreateOCRJob, ExtendLease,
+                          FailOCRJob, FailTask, FindOCRJob, GetJob, GetJobEvents, GetJobTasks,
+                          GetPublishedChunks, GetQueuedUsers, RecoverExpiredTasks, SetJobCheckpoint,
+                          UpdateJobStatus)
+from Tesseract.OCR import ocr_from_image
+from Utils.Analysis import analyse_pdf, content_hash
+from Utils.CONFIG import MODEL_VERSION
+from Utils.Fitz import run_in_fitz_thread
+from Utils.Para import chunk_by_tokens
+from Utils.Request import GetClassification
+from Utils.Result import job_input_path, new_result_id
+from Utils.Plagirarism import PlagiarismVisualizer
+
+
+# --- Model runners ---
+async def run_ai_model(ai_model: str, pdf_bytes: bytes, filename: str,
+                       result_collection: AsyncIOMotorCollection, tracer: Tracer = None,
+                       known_hash: str = None) -> Dict:
+    """AI detection (OCR included for scanned pages), reusing stored results."""
+    result, cached = await analyse_pdf(pdf_bytes, result_collection, filename=filename,
+                                       tracer=tracer, known_hash=known_hash)
+    return {
+        "result_id": result["result_id"],
+        "model_version": result["model_version"],
+        "summary": result["summary"],
+        "cached": cached
+    }
+
+
+def run_plagiarism_model(plag_model: str, path: str, visualizer: PlagiarismVisualizer,
+                         content_hash: str = None, text_path: str = None, lock=None) -> Dict:
+    """
+    Adds the document to the plagiarism index and scores it against its
+    closest source in the whole corpus, counted from the inverted index.
+    The document is indexed under its content hash, so an identical file
+    is analysed once and never matched against itself. The text layer
+    extracted at ingest is reused when the document has one.
+
+    `lock` guards the shared index. It is held only while the store is
+    read or written, so text extraction and OCR of other documents run
+    in parallel.
+    """
+    lock = lock or nullcontext()
+    doc_id = visualizer.document_id(path, content_hash)
+    with lock:
+        indexed = doc_id in visualizer.reps
+    if not indexed:
+        built = visualizer.build_document(path, doc_id, text_path)
+        with lock:
+            visualizer.add_document(*built)
+    with lock:
+        matches = visualizer.query(doc_id, top_k=1)
+    best = matches[0] if matches else None
+
+    return {
+        "p_score": round(best["similarity"], 4) if best else 0.0,
+        "containment": round(best["containment"], 4) if best else 0.0,
+        "match": os.path.basename(best["path"]) if best else None
+    }
+
+
+class AnalysisScheduler:
+    """
+    Runs project analysis jobs from the Mongo-backed task queue.
+
+    Jobs are split into one task per document. A pool of worker coroutines
+    claims queued tasks atomically, so several processes can share the same
+    queue; failed tasks are retried with backoff. Progress events are pushed
+    to in-process subscribers (the /ws/analyze sockets), which only listen.
+
+    `workers` is the global concurrency limit of this process and
+    `per_user_limit` caps one user's running documents across all processes.
+    Tasks are handed out fair-share: the next task goes to the eligible user
+    with the fewest running tasks, ties broken by who was served least
+    recently, so one large upload cannot starve everyone else. Within a
+    task, AI detection and plagiarism run in parallel.
+
+    Jobs outlive their sockets. Every progress event is stored with a
+    per-job sequence number, so a client can reconnect with the job id and
+    the last sequence it saw to get the missed events replayed. Running
+    tasks and OCR jobs hold a lease that is renewed while they make
+    progress; after a crash or restart the lease runs out, and the work is
+    picked up again from the last finished document or page.
+    """
+
+    def __init__(
+        self,
+        document_collection: AsyncIOMotorCollection,
+        result_collection: AsyncIOMotorCollection,
+        job_collection: AsyncIOMotorCollection,
+        task_collection: AsyncIOMotorCollection,
+        event_collection: AsyncIOMotorCollection,
+        workers: int = 4,
+        per_user_limit: int = 2,
+        poll_interval: float = 2.0,
+        recovery_interval: float = LEASE_SECONDS / 3,
+        tracer: Tracer = None
+    ):
+        self.document_collection = document_collection
+        self.result_collection = result_collection
+        self.job_collection = job_collection
+        self.task_collection = task_collection
+        self.event_collection = event_collection
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.poll_interval = poll_interval
+        self.recovery_interval = recovery_interval
+        self.tracer = tracer
+
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._wakeup = asyncio.Event()
+        self._worker_tasks: List[asyncio.Task] = []
+        # Claims are decided one at a time so counts are not read stale by sibling workers
+        self._claim_lock = asyncio.Lock()
+        self._last_served: Dict[str, float] = {}
+        self._ocr_jobs: Set[asyncio.Task] = set()
+
+        # The plagiarism index is shared by all workers and is not thread safe,
+        # the lock is held for its reads and writes but not for text extraction
+        self._visualizer = None
+        self._plagiarism_lock = threading.Lock()
+
+    # --- Lifecycle ---
+    async def start(self):
+        # Work abandoned by a previous run resumes from its last checkpoint
+        recovered = await RecoverExpiredTasks(self.task_collection)
+        if recovered:
+            print(f"[INFO] Re-queued {recovered} interrupted analysis task(s)")
+        await self._resume_expired_ocr_jobs()
+
+        for n in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker(n)))
+        self._worker_tasks.append(asyncio.create_task(self._recover()))
+
+    async def stop(self):
+        # Unfinished work keeps its lease and checkpoint, the next start resumes it
+        for task in self._worker_tasks + list(self._ocr_jobs):
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, *self._ocr_jobs, return_exceptions=True)
+        self._worker_tasks = []
+        self._ocr_jobs = set()
+
+    # --- Jobs ---
+    async def submit(self, project_id: str, user_id: str, document_ids: List[str],
+                     ai_model: str, plag_model: str) -> str:
+        job_id = await CreateJob(project_id, user_id, document_ids, ai_model, plag_model,
+                                 self.job_collection, self.task_collection)
+        self._wakeup.set()
+        return job_id
+
+    async def get_job(self, job_id: str) -> dict:
+        return await GetJob(job_id, self.job_collection)
+
+    async def get_job_tasks(self, job_id: str) -> List[dict]:
+        return await GetJobTasks(job_id, self.task_collection)
+
+    async def get_events(self, job_id: str, after: int = 0) -> List[dict]:
+        return await GetJobEvents(job_id, after, self.event_collection)
+
+    async def submit_ocr(self, pdf_bytes: bytes, user_id: str = None) -> dict:
+        """
+        Stores the PDF and starts a page-checkpointed OCR job for it. If the
+        same content was already OCRed (or is being OCRed) with the current
+        model, that job is returned instead and its events are replayed.
+        """
+        digest = content_hash(pdf_bytes)
+        existing = await FindOCRJob(digest, MODEL_VERSION, self.job_collection)
+        if existing is not None:
+            return existing
 
+        total_pages = await run_in_fitz_thread(_page_count, pdf_bytes)
 
-def get_documents_for_project(project_id: str) -> List:
-    return [
-        {"id": f"doc_{i}", "content": f"Content of document {i} for {project_id}"}
-        for i in range(1, 6)
-    ]
+        path = job_input_path(new_result_id())
+        await run_in_threadpool(_write_file, path, pdf_bytes)
+        job_id = await CreateOCRJob(path, total_pages, self.job_collection, user_id=user_id,
+                                    content_hash=digest, model_version=MODEL_VERSION)
 
+        job = await self.get_job(job_id)
+        self._spawn_ocr_job(job)
+        return job
 
-# --- Mock model inference functions ---
-def run_ai_model(ai_model: str, content: str) -> Dict:
-    # simulate model processing
-    asyncio.sleep(0.2)
-    return {0: round(random.uniform(0, 1), 2), 
-            1: round(random.uniform(0, 1), 2), 
-            2: round(random.uniform(0, 1), 2), 
-            3: round(random.uniform(0, 1), 2)}
+    # --- Progress ---
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers[job_id].add(queue)
+        return queue
 
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        self._subscribers[job_id].discard(queue)
+        if not self._subscribers[job_id]:
+            del self._subscribers[job_id]
 
-def run_plagiarism_model(plag_model: str, content: str) -> Dict:
-    # simulate model processing
-    asyncio.sleep(0.2)
-    return {"p_score": round(random.uniform(0, 1), 2)}
+    async def publish(self, job_id: str, event: Dict) -> Dict:
+        """Stores the event under the job's next sequence number and fans it out."""
+        event = await AppendJobEvent(job_id, event, self.job_collection, self.event_collection)
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(event)
+        return event
 
+    # --- Workers ---
+    async def _worker(self, n: int):
+        while True:
+            try:
+                task = await self._claim_fair()
+            except Exception as e:
+                print(f"[WARN] Scheduler worker {n} could not reach the queue: {e}")
+                task = None
 
-# --- Core background task ---
-async def process_documents(websocket: WebSocket, project_id: str, ai_model: str, plag_model: str):
-    documents = get_documents_for_project(project_id)
-    total = len(documents)
+            if task is None:
+                # Sleep until new work is submitted, polling for retries and other processes
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
 
-    await websocket.send_json({"status": "started", "total_docs": total})
+            try:
+                await self._run_task(task)
+            except Exception as e:
+                # The queue became unreachable mid-task, the task is left 'running'
+                print(f"[WARN] Scheduler worker {n} lost task {task['_id']}: {e}")
 
-    for idx, doc in enumerate(documents, start=1):
+    async def _recover(self):
+        """
+        Picks up the tasks and OCR jobs of workers that died in another
+        process, once per scheduler every recovery_interval.
+        """
+        while True:
+            await asyncio.sleep(self.recovery_interval)
+            try:
+                if await RecoverExpiredTasks(self.task_collection):
+                    self._wakeup.set()
+                await self._resume_expired_ocr_jobs()
+            except Exception as e:
+                print(f"[WARN] Scheduler could not recover expired work: {e}")
+
+    async def _claim_fair(self):
+        """Claims the next task for the least served user under their limit."""
+        async with self._claim_lock:
+            users = await GetQueuedUsers(self.task_collection)
+            if not users:
+                return None
+            running = await CountRunningByUser(self.task_collection)
+            eligible = [u for u in users if running.get(u, 0) < self.per_user_limit]
+            eligible.sort(key=lambda u: (running.get(u, 0), self._last_served.get(u, 0.0)))
+
+            for user_id in eligible:
+                task = await ClaimTask(self.task_collection, {"user_id": user_id})
+                if task is not None:
+                    self._last_served[user_id] = time.monotonic()
+                    return task
+            return None
+
+    async def _keep_lease(self, _id, collection: AsyncIOMotorCollection):
+        """Renews a lease until cancelled, for as long as the work is alive."""
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            await ExtendLease(_id, collection)
+
+    async def _run_task(self, task: dict):
+        job_id = task["job_id"]
+        lease = asyncio.create_task(self._keep_lease(task["_id"], self.task_collection))
         try:
+            document = await self.document_collection.find_one(
+                {"_id": _object_id(task["document_id"])})
+            if document is None:
+                raise FileNotFoundError(f"Document {task['document_id']} not found")
+
+            path = document["document_path"]
+            pdf_bytes = await run_in_threadpool(_read_file, path)
+
             # Run both models concurrently
-            ai_result = await run_in_threadpool(run_ai_model, ai_model, doc["content"])
-            plag_result = await run_in_threadpool(run_plagiarism_model, plag_model, doc["content"])
+            ai_result, plag_result = await asyncio.gather(
+                run_ai_model(task["ai_model"], pdf_bytes, document["document_name"],
+                             self.result_collection, self.tracer, document.get("content_hash")),
+                run_in_threadpool(self._run_plagiarism, task["plagiarism_model"], path,
+                                  document.get("content_hash"), document.get("text_path"))
+            )
 
-            result = {
-                "doc_id": doc["id"],
-                "ai_result": ai_result,
-                "plag_result": plag_result,
-                "progress": f"{idx}/{total}",
-            }
+            result = {"ai_result": ai_result, "plag_result": plag_result}
+            await SetDocumentResult(task["document_id"], result, self.document_collection)
+            await CompleteTask(task["_id"], result, self.task_collection)
+            job = await UpdateJobStatus(job_id, self.job_collection, self.task_collection)
 
-            await websocket.send_json(result)
+            await self.publish(job_id, {
+                "doc_id": task["document_id"],
+                "document_name": document["document_name"],
+                **result,
+                "progress": f"{job['done'] + job['failed']}/{job['total']}",
+            })
 
-            # Simulate time gap between docs
-            await asyncio.sleep(0.5)
+        except Exception as e:
+            retry = await FailTask(task, str(e), self.task_collection)
+            job = await UpdateJobStatus(job_id, self.job_collection, self.task_collection)
+            await self.publish(job_id, {"error": str(e), "doc_id": task["document_id"], "retrying": retry})
+        finally:
+            lease.cancel()
+
+        if job["finished_now"]:
+            await self.publish(job_id, {"status": "completed", "done": job["done"], "failed": job["failed"]})
+
+    # --- OCR jobs ---
+    async def _resume_expired_ocr_jobs(self):
+        """Takes over the OCR jobs whose runner stopped renewing its lease."""
+        while (job := await ClaimExpiredOCRJob(self.job_collection)) is not None:
+            print(f"[INFO] Resuming OCR job {job['_id']} at page {job['checkpoint'] + 1}")
+            self._spawn_ocr_job(job)
 
+    def _spawn_ocr_job(self, job: dict):
+        task = asyncio.create_task(self._run_ocr_job(job))
+        self._ocr_jobs.add(task)
+        task.add_done_callback(self._ocr_jobs.discard)
+
+    async def _run_ocr_job(self, job: dict):
+        """
+        OCRs and classifies a PDF page by page from the job's checkpoint,
+        publishing the same messages /ws/ocr/pdf always sent. The checkpoint
+        moves after each finished page, and a resumed job skips the events
+        it already published. A failure marks the job failed and ends its
+        stream with {"status": "failed"}.
+        """
+        job_id = job["_id"]
+        start = job["checkpoint"]
+        lease = asyncio.create_task(self._keep_lease(job_id, self.job_collection))
+        # A page interrupted half way is redone, the chunks clients already got are not sent again
+        published = await GetPublishedChunks(job_id, start, self.event_collection)
+
+        try:
+            for page_no in range(start, job["total"]):
+                images = await run_in_threadpool(
+                    convert_from_path, job["pdf_path"], first_page=page_no + 1, last_page=page_no + 1)
+                text = await run_in_threadpool(ocr_from_image, images[0])
+                # The first call may download the tokenizer, keep it off the event loop
+                chunks = [c['text'] for c in await run_in_threadpool(chunk_by_tokens, text)]
+
+                for j, chunk in enumerate(chunks):
+                    if (page_no + 1, j + 1) in published:
+                        continue
+                    try:
+                        data = await GetClassification(chunk)
+                        await self.publish(job_id, {"page": page_no + 1, "chunk": j + 1,
+                                                    "text": chunk, "data": data})
+                    except Exception as e:
+                        await self.publish(job_id, {"page": page_no + 1, "chunk": j + 1,
+                                                    "error": str(e)})
+
+                if (page_no + 1, None) not in published:
+                    await self.publish(job_id, {"page": page_no + 1, "status": "completed"})
+                await SetJobCheckpoint(job_id, page_no + 1, self.job_collection)
+
+            await SetJobCheckpoint(job_id, job["total"], self.job_collection, done=True)
+            await self.publish(job_id, {"status": "done"})
+            os.remove(job["pdf_path"])
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            await websocket.send_json({"error": str(e), "doc_id": doc["id"]})
+            print(f"[WARN] OCR job {job_id} failed: {e}")
+            await FailOCRJob(job_id, str(e), self.job_collection)
+            if os.path.exists(job["pdf_path"]):
+                os.remove(job["pdf_path"])
+            await self.publish(job_id, {"status": "failed", "error": str(e)})
+        finally:
+            lease.cancel()
+
+    def _run_plagiarism(self, plag_model: str, path: str, content_hash: str = None,
+                        text_path: str = None) -> Dict:
+        with self._plagiarism_lock:
+            if self._visualizer is None:
+                self._visualizer = PlagiarismVisualizer()
+        return run_plagiarism_model(plag_model, path, self._visualizer, content_hash, text_path,
+                                    lock=self._plagiarism_lock)
+
+
+def _page_count(pdf_bytes: bytes) -> int:
+    with fitz.open("pdf", pdf_bytes) as doc:
+        return doc.page_count
+
+
+def _write_file(path: str, content: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
 
-    await websocket.send_json({"status": "completed"})
+def _object_id(document_id: str):
+    return ObjectId(document_id) if ObjectId.is_valid(document_id) else document_id